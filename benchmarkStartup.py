@@ -0,0 +1,77 @@
+import sys
+import time
+import json as js
+import statistics
+import subprocess
+
+# Startup time of the GUI, on the simulated instruments so that it runs
+# without the hardware (e.g. on Linux). Run from this directory:
+#     python benchmarkStartup.py [runs]
+# Every run is a new Python process, so the imports are timed cold
+# (apart from the file cache of the OS). Set QT_QPA_PLATFORM=offscreen
+# to run it without a display.
+
+# Modules that are slow to import and are not needed to start the GUI.
+# They should only be imported when they are used.
+HEAVY_MODULES = ["pandas", "pyfftw", "matplotlib", "clr", "picosdk"]
+
+def measure():
+    """
+    Start the GUI once, in this process, and print the time (s) of each
+    phase and the heavy modules imported, as JSON.
+    """
+    start = time.perf_counter()
+    from src.config import defaults
+    defaults["simulation"]["enabled"] = True
+    from PyQt6.QtWidgets import QApplication
+    import main
+    imported = time.perf_counter()
+    app = QApplication(sys.argv)
+    main.qdarktheme.setup_theme()
+    win = main.MainWindow()
+    built = time.perf_counter()
+    win.show()
+    app.processEvents()
+    shown = time.perf_counter()
+    print(js.dumps({"imports": imported - start,
+                    "window": built - imported,
+                    "show": shown - built,
+                    "total": shown - start,
+                    "heavy modules": [name for name in HEAVY_MODULES
+                                      if name in sys.modules]}))
+    # Let the device discovery finish before the process exits
+    win.session.discovery.result()
+
+def main(runs: int = 5):
+    """
+    Time the startup over a number of runs and print the median and
+    fastest time of each phase.
+    Args:
+        runs (int): Number of times to start the GUI.
+    """
+    results = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, __file__, "--measure"],
+                                capture_output=True, text=True, check=True)
+        process = time.perf_counter() - start
+        # The measurement is the last line, after the startup messages
+        result = js.loads(output.stdout.strip().splitlines()[-1])
+        result["process"] = process
+        results.append(result)
+
+    print(f"Startup time over {runs} runs (simulated instruments):")
+    for phase in ["imports", "window", "show", "total", "process"]:
+        times = [result[phase] for result in results]
+        print(f"    {phase:<8} median {statistics.median(times):.3f} s, "
+              f"fastest {min(times):.3f} s")
+    heavy = sorted({name for result in results
+                    for name in result["heavy modules"]})
+    print("Heavy modules imported at startup:",
+          ", ".join(heavy) if heavy else "none")
+
+if __name__ == "__main__":
+    if "--measure" in sys.argv:
+        measure()
+    else:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
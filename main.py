@@ -1,20 +1,21 @@
 try:
     import sys
     import numpy as np
-    import json as js
+    from src.config import defaults
     from PyQt6.QtWidgets import (
         QApplication, QWidget, QVBoxLayout, QTabWidget, QMainWindow
     )
     from src.GUI.inputWidget import InputWidget
     from src.GUI.plotWidgets import PlotManager
-    from PyQt6.QtCore import QTimer, QThreadPool
-    # Import all instrument classes here
-    from src.instruments.Picoscope4000 import PS4000 as ps
-    from src.instruments.DLS import DLS
-    from src.instruments.SC10 import SC10
-    from src.instruments.FWxC import FWxC
+    from src.GUI.compareWidget import CompareWidget
+    from PyQt6.QtCore import Qt, QTimer, QThreadPool
+    # The session owns all instrument instances
+    from src.control.session import InstrumentSession
     from src.control.experiments import *
     from src.control.worker import Worker
+    from src.control.checkpoint import Checkpoint
+    from src.control.runEstimator import LatencyLog
+    from src.control.progress import ProgressMeter
     from ctypes import *
     import qdarktheme
     import datetime
@@ -22,9 +23,6 @@ except OSError as ex:
     print("Warning:", ex)
 
 
-with open(r'config\systemDefaults.JSON') as f:
-    defaults = js.load(f)
-
 class MainWindow(QMainWindow):
     """
     Main window for the application.
@@ -33,27 +31,26 @@ class MainWindow(QMainWindow):
     def __init__(self):
         """
         Initialize the main window and set up the layout and widgets.
-        Also creates instances of instrument classes.
+        Also creates the instrument session, which owns the instruments.
         """
         super().__init__()
         self.setWindowTitle("Joyce Lab Terahertz App (JoLTA)")
         self.resize(1900, 1000)
 
-        # TODO: Setup instrument classes. Add all instruments here.
-        self.ps4000 = ps()
-        self.thz_dls = DLS()
-        self.pump_dls = DLS()
-        self.pump_shutter = SC10()
-        self.pump_shutter.list_devices()
-        self.fw1 = FWxC()
-        self.fw2 = FWxC()
-        self.fw1.list_devices()
-        self.fw2.list_devices()
+        # Instruments stay connected across runs, and are only closed
+        # when the window is closed
+        self.session = InstrumentSession()
+        self.ps4000 = self.session.ps4000
+        self.thz_dls = self.session.thz_dls
+        self.pump_dls = self.session.pump_dls
+        self.pump_shutter = self.session.pump_shutter
+        self.fw1 = self.session.fw1
+        self.fw2 = self.session.fw2
 
         self.tabs = QTabWidget()
         self.tabs.addTab(self.create_run_settings_tab(), "Run Settings")
         self.tabs.addTab(self.create_data_collection_tab(), "Data plots")
-        # self.tabs.addTab(self.compare_plots_tab(), "Compare plots")
+        self.tabs.addTab(self.compare_plots_tab(), "Compare plots")
         self.tabs.addTab(self.create_infomation_tab(), "Information")
 
         wid = QWidget(self)
@@ -90,6 +87,15 @@ class MainWindow(QMainWindow):
         tab.setLayout(layout)
         return tab
     
+    def compare_plots_tab(self):
+        tab = QWidget()
+        layout = QVBoxLayout()
+        # Saved runs, overlaid for comparison
+        self.compare_plots = CompareWidget()
+        layout.addWidget(self.compare_plots)
+        tab.setLayout(layout)
+        return tab
+
     def create_infomation_tab(self):
         tab = QWidget()
         layout = QVBoxLayout()
@@ -119,25 +125,22 @@ class MainWindow(QMainWindow):
 
             # Any other args, kwargs are passed to the run function
             worker = Worker(self.run_program)
+            # Plots are redrawn at a capped frame rate, with the latest
+            # data only
             worker.signals.processed_data.connect(self.data_plots.
-                                                  update_plots)
-            # worker.signals.finished.connect(self.thread_complete)
-            # worker.signals.progress.connect(self.progress_fn)
+                                                  queue_plots)
+            worker.signals.finished.connect(self.thread_complete)
+            worker.signals.progress.connect(self.data_plots.
+                                            update_progress)
             # Execute
             self.threadpool.start(worker)
 
     def wind_down(self):
         """
-        Close all instrument connections, and save data as needed.
+        Leave the instruments safe between runs. The connections stay
+        open for the next run, so only the pump shutter is closed.
         """
-        # TODO: Save data here
-        # TODO: Close all instruments here
-        self.ps4000.close()
-        self.thz_dls.close()
-        self.pump_dls.close()
-        self.pump_shutter.close()
-        self.fw1.close()
-        self.fw2.close()
+        self.pump_shutter.set_command("close")
 
     def run_program(self, emit):
         """
@@ -161,41 +164,61 @@ class MainWindow(QMainWindow):
             print("No experiments queued.")
             return
 
-        # Open instrument connections
-        # TODO: Open all instruments here
-        self.thz_dls.setup(defaults["DLS"]["THz DLS"]["serial port"])
-        self.pump_dls.setup(defaults["DLS"]["Pump DLS"]["serial port"])
-        self.ps4000.setup()
-        self.pump_shutter.setup(defaults["SC10"]["serial port"],
-                                defaults["SC10"]["baud rate"])
-        self.fw1.setup(defaults["FWxC"]["fw1"]["serial port"],
-                       defaults["FWxC"]["fw1"]["baud rate"])
-        self.fw2.setup(defaults["FWxC"]["fw2"]["serial port"],
-                       defaults["FWxC"]["fw2"]["baud rate"])
+        # Reconnect any instruments that are not connected or have
+        # stopped answering. The others are still open from earlier runs.
+        if not self.session.connect():
+            print("Could not set up all instruments, nothing was run.")
+            self.data_plots.exp_stop_button.setEnabled(False)
+            return
 
-        # Save metadata to a txt file
+        # Set up the step journals so interrupted experiments can be
+        # resumed. Old journals are discarded if resuming is disabled.
+        resuming = False
+        checkpoints = Checkpoint.for_queue(self.main_menu.program_list,
+                                           self.main_menu.sample_text.text())
+        for experiment, checkpoint in zip(self.main_menu.program_list,
+                                          checkpoints):
+            if checkpoint is None:
+                continue
+            experiment.checkpoint = checkpoint
+            if not self.main_menu.resume_CB.isChecked():
+                experiment.checkpoint.discard()
+            elif len(experiment.checkpoint.load()) != 0:
+                resuming = True
+
+        # Save metadata to a txt file. When resuming, the metadata file
+        # of the interrupted run is appended to.
         if self.main_menu.save_CB.isChecked():
             try:
                 with open(self.main_menu.dir_path_text.text() + "/" +
                         self.main_menu.sample_text.text() + " metadata.txt",
-                        "x") as f:
+                        "a" if resuming else "x") as f:
                     f.write("Sample name: " +
                             self.main_menu.sample_text.text() + "\n")
                     f.write("Date: " + str(datetime.datetime.now()) + "\n")
                     f.write("Experiments:\n")
+                    # The plain descriptions, without the pin markers
+                    # and estimates shown in the list
                     for index in range(self.main_menu.program_widget.count()):
                         f.write(f"{str(index+1)})")
                         f.write(self.main_menu.program_widget.item(index).
-                                text() + "\n")
+                                data(Qt.ItemDataRole.UserRole) + "\n")
             except FileExistsError:
                 self.experiment.stop_experiment = False
                 print("File already exists. Please choose a different name.")
                 self.wind_down()
                 return
 
+        # Measure move and capture latencies for future estimates
+        latencies = LatencyLog()
         experiment_count = 1
-        for experiment in self.main_menu.program_list:
+        program_count = len(self.main_menu.program_list)
+        for index, experiment in enumerate(self.main_menu.program_list):
             self.experiment = experiment
+            self.experiment.latencies = latencies
+            self.experiment.progress = ProgressMeter(index + 1,
+                                                     program_count,
+                                                     experiment.name)
             # Ensure next experiment button is correctly configured
             if len(self.main_menu.program_list) > 1:
                 self.data_plots.next_exp_button.setEnabled(True)
@@ -224,11 +247,24 @@ class MainWindow(QMainWindow):
                 self.experiment.stop_experiment = False
                 break
 
-        # Close connections to the instruments
+        latencies.save()
         self.wind_down()
+        if self.session.tracer is not None:
+            print("Instrument trace saved to",
+                  self.session.tracer.export())
+            self.session.tracer.clear()
         self.data_plots.exp_stop_button.setEnabled(False)
         return
 
+    def thread_complete(self):
+        """
+        Called in the main thread when the worker thread has finished,
+        however the queue ended.
+        """
+        self.data_plots.exp_stop_button.setEnabled(False)
+        self.data_plots.next_exp_button.setEnabled(False)
+        self.data_plots.end_progress()
+
     def update_plots(self, data):
         """
         Update the plots with new data.
@@ -256,9 +292,10 @@ class MainWindow(QMainWindow):
     def closeEvent(self, *args, **kwargs):
         super(QMainWindow, self).closeEvent(*args, **kwargs)
         # TODO: Handle closing the main window, ensuring all data is
-        # saved and instruments are closed properly.
-        if self.main_menu.save_CB.isChecked():
+        # saved.
+        if self.main_menu.save_CB.isChecked() and hasattr(self, "experiment"):
             self.experiment.waveformDP.save_data()
+        self.session.close()
 
 def main():
     app = QApplication(sys.argv)
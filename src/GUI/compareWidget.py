@@ -0,0 +1,201 @@
+from PyQt6.QtWidgets import (
+    QWidget, QGridLayout, QPushButton, QComboBox, QLabel, QLineEdit,
+    QListWidget, QListWidgetItem, QFileDialog
+)
+from PyQt6.QtCore import Qt, QThreadPool
+import pyqtgraph as pg
+from src.control.datasets import list_datasets, DatasetCache
+from src.control.worker import Worker
+
+class CompareWidget(QWidget):
+    """
+    Overlay of saved scans, to compare runs without the notebook.
+
+    - The data files of a folder are listed with only their first line
+      read. The checked files are overlaid, plus the selected one, so
+      the arrow keys flip through the files.
+    - Files are loaded on a worker thread (see DatasetCache), one load
+      at a time, so the GUI never waits for the disk. Loads requested
+      meanwhile are picked up when the running one finishes.
+    - Curves are decimated to the visible range (peak method), so files
+      with many scans or steps draw quickly.
+    """
+    keys = ["E_off", "E_on", "DT",
+            "E_off Spectrum", "E_on Spectrum", "DT Spectrum"]
+
+    def __init__(self):
+        super().__init__()
+        self.cache = DatasetCache()
+        # Path -> Dataset, of the files shown. The paths last requested,
+        # and whether their spectra have been calculated.
+        self.datasets = {}
+        self.loaded_paths = []
+        self.datasets_spectra = False
+        # (path, scan index) -> curve
+        self.curves = {}
+        self.loading = False
+        self.pool = QThreadPool()
+        self.pool.setMaxThreadCount(1)
+
+        self.dir_path_text = QLineEdit()
+        self.dir_path_text.setPlaceholderText("Enter folder path")
+        self.dir_path_text.returnPressed.connect(self.list_files)
+        select_dir_button = QPushButton("Browse")
+        select_dir_button.clicked.connect(self.selectDirectoryDialog)
+        refresh_button = QPushButton("Refresh")
+        refresh_button.clicked.connect(self.list_files)
+
+        self.file_list = QListWidget()
+        self.file_list.itemChanged.connect(self.request_datasets)
+        self.file_list.currentItemChanged.connect(self.request_datasets)
+        self.dropdown = QComboBox()
+        self.dropdown.addItems(self.keys)
+        self.dropdown.currentTextChanged.connect(self.request_datasets)
+        self.status_label = QLabel("")
+
+        self.plotWidget = pg.PlotWidget()
+        self.plotWidget.getPlotItem().layout.setContentsMargins(
+            10, 10, 10, 10)
+        self.plotWidget.addLegend()
+        self.plotWidget.setLabel("left", "ADC Counts")
+
+        layout = QGridLayout()
+        layout.addWidget(QLabel("Folder:"), 0, 0)
+        layout.addWidget(self.dir_path_text, 0, 1, 1, 3)
+        layout.addWidget(select_dir_button, 0, 4)
+        layout.addWidget(refresh_button, 0, 5)
+        layout.addWidget(self.file_list, 1, 0, 1, 2)
+        layout.addWidget(self.plotWidget, 1, 2, 1, 4)
+        layout.addWidget(self.dropdown, 2, 0, 1, 2)
+        layout.addWidget(self.status_label, 2, 2, 1, 4)
+        layout.setColumnStretch(2, 1)
+        layout.setColumnStretch(3, 3)
+        self.setLayout(layout)
+
+    def selectDirectoryDialog(self):
+        """ Open a file dialog to select a directory """
+        file_dialog = QFileDialog()
+        file_dialog.setWindowTitle("Select Directory")
+        file_dialog.setFileMode(QFileDialog.FileMode.Directory)
+        file_dialog.setViewMode(QFileDialog.ViewMode.List)
+
+        if file_dialog.exec():
+            self.dir_path_text.setText(str(file_dialog.selectedFiles()[0]))
+            self.list_files()
+
+    def list_files(self):
+        """ List the data files of the folder, keeping checked ones """
+        checked = set(self._checked_paths())
+        try:
+            paths = list_datasets(self.dir_path_text.text())
+        except OSError as ex:
+            self.status_label.setText(f"Could not list the folder: {ex}")
+            return
+        self.file_list.blockSignals(True)
+        self.file_list.clear()
+        for path in paths:
+            item = QListWidgetItem(path.replace("\\", "/").split("/")[-1])
+            item.setData(Qt.ItemDataRole.UserRole, path)
+            item.setFlags(item.flags() | Qt.ItemFlag.ItemIsUserCheckable)
+            item.setCheckState(Qt.CheckState.Checked if path in checked
+                               else Qt.CheckState.Unchecked)
+            self.file_list.addItem(item)
+        self.file_list.blockSignals(False)
+        self.status_label.setText(f"{len(paths)} data files")
+        self.request_datasets()
+
+    def _checked_paths(self) -> list:
+        """ Paths of the checked files """
+        items = [self.file_list.item(i)
+                 for i in range(self.file_list.count())]
+        return [item.data(Qt.ItemDataRole.UserRole) for item in items
+                if item.checkState() == Qt.CheckState.Checked]
+
+    def _shown_paths(self) -> list:
+        """ Paths of the files to show: the checked and selected ones """
+        paths = self._checked_paths()
+        current = self.file_list.currentItem()
+        if current is not None:
+            path = current.data(Qt.ItemDataRole.UserRole)
+            if path not in paths:
+                paths.append(path)
+        return paths
+
+    def request_datasets(self, *args):
+        """
+        Load the files to show on a worker thread, with their spectra if
+        a spectrum is selected, and draw them when loaded.
+        """
+        if self.loading:
+            return
+        paths = self._shown_paths()
+        spectra = self.dropdown.currentText().endswith("Spectrum")
+        cache = self.cache
+
+        def load(emit):
+            datasets = {}
+            for path in paths:
+                try:
+                    datasets[path] = cache.get(path)
+                    if spectra:
+                        for scan in datasets[path].scans:
+                            scan.get_spectra()
+                except Exception as ex:
+                    print(f"Could not load {path}: {ex!r}")
+            emit((paths, spectra, datasets))
+
+        worker = Worker(load)
+        worker.signals.processed_data.connect(self.show_datasets)
+        worker.signals.finished.connect(self._load_finished)
+        self.loading = True
+        self.status_label.setText("Loading...")
+        self.pool.start(worker)
+
+    def _load_finished(self):
+        """ Load again if the files or key changed meanwhile """
+        self.loading = False
+        paths = self._shown_paths()
+        spectra = self.dropdown.currentText().endswith("Spectrum")
+        if (set(paths) != set(self.loaded_paths) or
+                spectra != self.datasets_spectra):
+            self.request_datasets()
+
+    def show_datasets(self, result):
+        """ Draw the loaded files, from the (paths, spectra, datasets) """
+        self.loaded_paths, self.datasets_spectra, self.datasets = result
+        self.draw()
+        scans = sum(len(dataset.scans)
+                    for dataset in self.datasets.values())
+        self.status_label.setText(f"{len(self.datasets)} files, "
+                                  f"{scans} scans shown")
+
+    def draw(self):
+        """
+        Overlay the selected key of all scans shown. The curves are made
+        again, so those of files no longer shown are dropped and their
+        data can be freed.
+        """
+        key = self.dropdown.currentText()
+        spectrum = key.endswith("Spectrum")
+        if spectrum != self.datasets_spectra:
+            # Spectra not calculated yet, wait for the load
+            return
+        for curve in self.curves.values():
+            self.plotWidget.removeItem(curve)
+        self.curves = {}
+        count = sum(len(dataset.scans)
+                    for dataset in self.datasets.values())
+        x_axis = "Frequency (THz)" if spectrum else "Delay (mm)"
+        for path, dataset in self.datasets.items():
+            for index, scan in enumerate(dataset.scans):
+                data = scan.spectra if spectrum else scan.frame
+                name = f"{dataset.name} {scan.label}".strip()
+                pen = pg.mkPen(color=pg.intColor(len(self.curves),
+                                                 hues=max(count, 9)),
+                               width=2)
+                curve = self.plotWidget.plot(data[x_axis], data[key],
+                                             pen=pen, name=name)
+                curve.setClipToView(True)
+                curve.setDownsampling(auto=True, method="peak")
+                self.curves[(path, index)] = curve
+        self.plotWidget.setLabel("bottom", x_axis)
@@ -1,7 +1,7 @@
 # TODO: make this info widget to display relevant information as experiment goes on
 
 import sys
-import json as js
+from src.config import defaults
 from PyQt6.QtWidgets import (
     QApplication, QWidget, QGridLayout, QPushButton, QCheckBox,
     QGroupBox, QLabel, QComboBox, QFileDialog, QLineEdit, QListWidget, 
@@ -9,9 +9,6 @@ from PyQt6.QtWidgets import (
 from PyQt6.QtGui import QFont
 
 
-with open(r"config\systemDefaults.JSON") as f:
-    defaults = js.load(f)
-
 class InfoWidgets:
     """ Widgets to display information for the main GUI """
     class WaveformInfo(QGroupBox):
@@ -43,8 +40,8 @@ class InfoWidgets:
                 self.layout.addWidget(QLabel(f"{key}:"), row, col)
                 self.layout.addWidget(self.variables[key], row, col+1)
 
-        def update_info(self, data: dict):
-            """ Update the waveform information widget with new data """
+        def update_info(self, data):
+            """ Update the waveform information with a WaveformFrame """
             if data["Saturation"]:
                 self.variables["Saturation"].setText(
                     "WARNING! Channel overrange!")
@@ -1,20 +1,27 @@
 import sys
-import json as js
+from src.config import defaults
 from PyQt6.QtWidgets import (
     QApplication, QWidget, QGridLayout, QPushButton, QCheckBox,
-    QLabel, QComboBox, QFileDialog, QLineEdit, QListWidget
+    QLabel, QComboBox, QFileDialog, QLineEdit, QListWidget, QListWidgetItem
 )
+from PyQt6.QtCore import Qt
 from src.GUI.usefulWidgets import ResizingStackedWidget
 from src.instruments.DLS import DLS
 # Import experiment classes here
 from src.control.experiments import (
-    darkTHz, OPTP, pumpDecay
+    darkTHz, OPTP, pumpDecay, pumpProbeMap, fluenceSeries
 )
+from src.control.queueOptimiser import QueueOptimiser
+from src.control.runEstimator import RunEstimator, format_duration
 import os
 
-
-with open(r"config\systemDefaults.JSON") as f:
-    defaults = js.load(f)
+# Experiment name (as in systemDefaults.json) -> experiment class
+# TODO: Add new experiment classes here.
+experiment_classes = {"Dark THz": darkTHz,
+                      "Pump decay": pumpDecay,
+                      "OPTP": OPTP,
+                      "Pump-probe map": pumpProbeMap,
+                      "Fluence series": fluenceSeries}
 
 class InputWidget(QWidget):
     """ Widget to handle user inputs for the main GUI """
@@ -24,6 +31,8 @@ class InputWidget(QWidget):
         self.program_list = []
         self.thz_dls = thz_dls
         self.pump_dls = pump_dls
+        # Experiment name -> input widget, built when first selected
+        self.input_widgets = {}
         self.layout = QGridLayout()
         self.layout.setRowStretch(0|1|2|3|4|5, 1)
         self.setLayout(self.layout)
@@ -58,8 +67,13 @@ class InputWidget(QWidget):
         self.remove_experiment_button = QPushButton("Remove\nexperiment")
         self.remove_experiment_button.clicked.connect(
             self.remove_experiment)
+        self.pin_experiment_button = QPushButton("Pin/unpin\nexperiment")
+        self.pin_experiment_button.clicked.connect(self.pin_experiment)
+        self.optimise_button = QPushButton("Optimise\norder")
+        self.optimise_button.clicked.connect(self.optimise_program)
 
         self.run_exp_button = QPushButton("Run experiments")
+        self.estimate_label = QLabel("Estimated total: -")
         
         self.layout.addWidget(QLabel("Folder:"), 0, 0)
         self.layout.addWidget(self.dir_path_text, 0, 1, 1, 10)
@@ -71,6 +85,7 @@ class InputWidget(QWidget):
         self.layout.addWidget(self.file_type, 1, 11)
 
         self.layout.addWidget(self.run_exp_button, 2, 0)
+        self.layout.addWidget(self.estimate_label, 2, 1, 1, 4)
         self.layout.addWidget(QLabel("Sampling Mode:"), 2, 6)
         self.layout.addWidget(self.experiments, 2, 7)
 
@@ -78,34 +93,43 @@ class InputWidget(QWidget):
         self.is_ref.setChecked(False)
         self.layout.addWidget(self.is_ref, 2, 8)
 
+        self.resume_CB = QCheckBox("Resume interrupted runs")
+        self.resume_CB.setChecked(True)
+        self.layout.addWidget(self.resume_CB, 2, 9)
+
         self.layout.addWidget(self.program_widget, 3, 0, 5, 5)
         self.layout.addWidget(self.add_experiment_button, 3, 5)
         self.layout.addWidget(self.remove_experiment_button, 4, 5)
+        self.layout.addWidget(self.pin_experiment_button, 5, 5)
+        self.layout.addWidget(self.optimise_button, 6, 5)
         
-        # TODO: Add new experiment input widget here. Follow the templates.
+        # Only the input widget of the selected experiment is built. The
+        # others are built when they are first selected.
         self.experiment_stack = ResizingStackedWidget(self)
-        self.darkTHz_widget = darkTHz.input_widget()
-        self.OPTP_widget = OPTP.input_widget()
-        self.PD_widget = pumpDecay.input_widget()
         self.layout.addWidget(self.experiment_stack, 3, 6, 3, 5)
-        self.experiment_stack.addWidget(self.darkTHz_widget.GUI)
-        self.experiment_stack.addWidget(self.PD_widget.GUI)
-        self.experiment_stack.addWidget(self.OPTP_widget.GUI)
-        self.experiment_stack.adjustSize()
+        self.select_experiment_type()
 
-    def select_experiment_type(self):
+    def input_widget(self, experiment: str):
         """
-        Show the input menu for the selected experiment
-        TODO: Add new experiment input widget here for switching.
+        Input widget of an experiment, built on first use.
+        Args:
+            experiment (str): Name of the experiment.
+        Returns:
+            The input_widget instance of the experiment class.
         """
+        if experiment not in self.input_widgets:
+            widget = experiment_classes[experiment].input_widget()
+            self.experiment_stack.addWidget(widget.GUI)
+            self.input_widgets[experiment] = widget
+        return self.input_widgets[experiment]
+
+    def select_experiment_type(self):
+        """ Show the input menu for the selected experiment """
         ctext = self.experiments.currentText()
-        match ctext:
-            case "Dark THz":
-                self.experiment_stack.setCurrentIndex(0)
-            case "Pump decay":
-                self.experiment_stack.setCurrentIndex(1)
-            case "OPTP":
-                self.experiment_stack.setCurrentIndex(2)
+        if ctext not in experiment_classes:
+            return
+        self.experiment_stack.setCurrentWidget(self.input_widget(ctext).GUI)
+        self.experiment_stack.adjustSize()
 
     def selectDirectoryDialog(self):
         """ Open a file dialog to select a directory """
@@ -129,27 +153,28 @@ class InputWidget(QWidget):
         if experiment == "":
             print("No experiment selected")
         else:
+            widget = self.input_widget(experiment)
             display_string = f" {experiment}\n    "
             match experiment:
                 case "Dark THz":
-                    self.program_list.append(self.darkTHz_widget.
+                    self.program_list.append(widget.
                                              set_experiment_parameters(
                                                 self.thz_dls
                                              ))
-                    settings = self.darkTHz_widget.settings
+                    settings = widget.settings
                     display_string += (f"DLS125: "
                         f"{settings["active_DLS_initial"]} mm to "
                         f"{settings["active_DLS_final"]} mm, "
                         f"{settings["active_DLS_steps"]} steps, "
                         f"{settings["repeats"]} repeats\n")
-                    self.program_widget.addItem(display_string)
+                    self.add_program_item(display_string)
                 case "Pump decay":
-                    self.program_list.append(self.PD_widget.
+                    self.program_list.append(widget.
                                              set_experiment_parameters(
                                                 self.pump_dls,
                                                 self.thz_dls
                                              ))
-                    settings = self.PD_widget.settings
+                    settings = widget.settings
                     display_string += (f"DLS125: "
                             f"{settings["DLS125_position"]} mm; fw1: "
                             f"{settings["fw1"]}, fw2: {settings["fw2"]}\n"
@@ -161,14 +186,14 @@ class InputWidget(QWidget):
                             f"{settings["DLS325_final"][i]} mm, "
                             f"{settings["DLS325_steps"][i]} steps, "
                             f"{settings["sampling_mode"][i]} sampling\n")
-                    self.program_widget.addItem(display_string)
+                    self.add_program_item(display_string)
                 case "OPTP":
-                    self.program_list.append(self.OPTP_widget.
+                    self.program_list.append(widget.
                                              set_experiment_parameters(
                                                  self.thz_dls,
                                                  self.pump_dls
                                              ))
-                    settings = self.OPTP_widget.settings
+                    settings = widget.settings
                     display_string += ("DLS325: "
                         f"{settings["DLS325_position"]} mm; fw1: "
                         f"{settings["fw1"]}, fw2: {settings["fw2"]}\n"
@@ -176,7 +201,67 @@ class InputWidget(QWidget):
                         f"{settings["DLS125_final"]} mm, "
                         f"{settings["DLS125_steps"]} steps, "
                         f"{settings["DLS125_repeats"]} repeats\n")
-                    self.program_widget.addItem(display_string)
+                    self.add_program_item(display_string)
+                case "Pump-probe map":
+                    self.program_list.append(widget.
+                                             set_experiment_parameters(
+                                                 self.thz_dls,
+                                                 self.pump_dls
+                                             ))
+                    settings = widget.settings
+                    display_string += ("fw1: "
+                        f"{settings["fw1"]}, fw2: {settings["fw2"]}, "
+                        f"{settings["repeats"]} repeats\n"
+                        f"    DLS325: {settings["DLS325_initial"]} mm to "
+                        f"{settings["DLS325_final"]} mm, "
+                        f"{settings["DLS325_steps"]} steps, "
+                        f"{settings["sampling_mode"]} sampling\n"
+                        f"    DLS125: {settings["DLS125_initial"]} mm to "
+                        f"{settings["DLS125_final"]} mm, "
+                        f"{settings["DLS125_steps"]} steps (snake order)\n")
+                    self.add_program_item(display_string)
+                case "Fluence series":
+                    series = widget.set_experiment_parameters(self.thz_dls,
+                                                              self.pump_dls)
+                    if series is None:
+                        return
+                    self.program_list.append(series)
+                    settings = widget.settings
+                    display_string += (f"{settings["scan_type"]}: "
+                        f"{settings["steps"]} steps, "
+                        f"{settings["repeats"]} repeats\n"
+                        f"    fw1/fw2: ")
+                    display_string += ", ".join(
+                        f"{fw1}/{fw2}" for fw1, fw2 in settings["fw_series"])
+                    display_string += "\n"
+                    self.add_program_item(display_string)
+
+    def add_program_item(self, display_string: str):
+        """
+        Add an experiment's description to the displayed program list.
+        The description is kept with the item, so the estimate and pin
+        marker can be updated.
+        """
+        item = QListWidgetItem(display_string)
+        item.setData(Qt.ItemDataRole.UserRole, display_string)
+        self.program_widget.addItem(item)
+        self.update_estimates()
+
+    def update_estimates(self):
+        """
+        Estimate the duration of every queued experiment (a dry run of
+        the program list) and show it in the program list.
+        """
+        durations = RunEstimator().program_durations(self.program_list)
+        for index, duration in enumerate(durations):
+            item = self.program_widget.item(index)
+            text = item.data(Qt.ItemDataRole.UserRole)
+            if self.program_list[index].pinned:
+                text = "[Pinned]" + text
+            item.setText(text + f"    Estimated time: "
+                         f"{format_duration(duration)}\n")
+        self.estimate_label.setText(
+            f"Estimated total: {format_duration(sum(durations))}")
 
     def remove_experiment(self):
         """ Remove the selected experiment from list """
@@ -186,6 +271,40 @@ class InputWidget(QWidget):
         for item in selected_items:
             del self.program_list[self.program_widget.row(item)]
             self.program_widget.takeItem(self.program_widget.row(item))
+        self.update_estimates()
+
+    def pin_experiment(self):
+        """
+        Pin/unpin the selected experiments. Pinned experiments keep their
+        place in the queue when the order is optimised.
+        """
+        for item in self.program_widget.selectedItems():
+            experiment = self.program_list[self.program_widget.row(item)]
+            experiment.pinned = not experiment.pinned
+        self.update_estimates()
+
+    def optimise_program(self):
+        """
+        Reorder the queued experiments to minimise hardware motion
+        between them (filter wheels, shutter and DLS travel).
+        """
+        if len(self.program_list) < 2:
+            return
+        optimiser = QueueOptimiser()
+        before = optimiser.program_cost(self.program_list)
+        new_order = optimiser.optimise(self.program_list)
+        after = optimiser.program_cost(new_order)
+
+        # Reorder the displayed list to match the new program list
+        items = [self.program_widget.takeItem(0)
+                 for _ in range(self.program_widget.count())]
+        for experiment in new_order:
+            self.program_widget.addItem(
+                items[self.program_list.index(experiment)])
+        self.program_list = new_order
+        self.update_estimates()
+        print(f"Queue reordered. Estimated hardware motion: "
+              f"{before:.1f} s -> {after:.1f} s")
 
     def check_file_exists(self, file_path: str):
         """
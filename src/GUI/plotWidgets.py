@@ -1,17 +1,81 @@
 from PyQt6.QtWidgets import (
     QWidget, QVBoxLayout, QGridLayout, QPushButton,
-    QComboBox, QLabel, QGroupBox,
+    QComboBox, QLabel, QGroupBox, QStackedWidget, QProgressBar
 )
+from PyQt6.QtCore import QTimer, QThreadPool
+from src.config import defaults
 import pyqtgraph as pg
 from src.GUI.usefulWidgets import ResizingStackedWidget ,QCheckList
 from src.GUI.infoWidget import InfoWidgets
+from src.control.frames import SignalFrame
+from src.control.dataProcessing import SpectrumDP
+from src.control.runEstimator import format_duration
+from src.control.worker import Worker
 import numpy as np
 
 # TODO: Colour code different segments of Picoscope signals
-# TODO: Add heatmap plot for spot size plot
+# TODO: Show knife-edge spot profiles in the HeatmapPlot
 
 colors = ["b", "r", "g"]
 
+class AppendBuffer:
+    """
+    Preallocated x and y arrays for a curve that only grows, such as the
+    THz signals of a scan, which gain one point per step. New points are
+    copied in at the end and the curve is given views of the filled
+    part, so an update costs the new points only. The extrema are kept
+    as the data grows, to autorange without scanning the arrays.
+    """
+    def __init__(self, run: int, capacity: int):
+        """
+        Args:
+            run (int): Run number of the frames the buffer follows.
+            capacity (int): Number of points to allocate, e.g. the number
+                of steps of the scan. Grows if exceeded.
+        """
+        self.run = run
+        self.x = np.empty(max(capacity, 1))
+        self.y = np.empty(max(capacity, 1))
+        self.count = 0
+        self.x_range = [np.inf, -np.inf]
+        self.y_range = [np.inf, -np.inf]
+
+    def extend(self, x_source, y_source) -> bool:
+        """
+        Copy the points of the sources that are not in the buffer yet.
+        Args:
+            x_source: x values, at least as long as y_source.
+            y_source: y values, of which the first self.count are in the
+                buffer already.
+        Returns:
+            True if points were added, False otherwise.
+        """
+        end = min(len(y_source), len(x_source))
+        if end <= self.count:
+            return False
+        self.append(x_source[self.count:end], y_source[self.count:end])
+        return True
+
+    def append(self, x_new, y_new):
+        """ Add points at the end """
+        end = self.count + len(y_new)
+        if end > len(self.x):
+            # Only when a scan has more steps than allocated for
+            self.x = np.resize(self.x, 2 * end)
+            self.y = np.resize(self.y, 2 * end)
+        x_new = np.asarray(x_new, dtype=float)
+        y_new = np.asarray(y_new)
+        if np.iscomplexobj(y_new):
+            y_new = np.abs(y_new)
+        y_new = y_new.astype(float)
+        self.x[self.count:end] = x_new
+        self.y[self.count:end] = y_new
+        self.count = end
+        self.x_range = [min(self.x_range[0], np.nanmin(x_new)),
+                        max(self.x_range[1], np.nanmax(x_new))]
+        self.y_range = [min(self.y_range[0], np.nanmin(y_new)),
+                        max(self.y_range[1], np.nanmax(y_new))]
+
 class LivePlot(QWidget):
     def __init__(self,
                  flag: str = None,
@@ -35,6 +99,17 @@ class LivePlot(QWidget):
         if self.is_main:
             self.plotWidget.addLegend()
 
+        # THz signals grow by one point per step, so their curves are
+        # appended to (see AppendBuffer) instead of redrawn from the full
+        # data. The view follows the extrema of the data until the user
+        # zooms or pans, and again after the "A" (autoscale) button.
+        self.buffers = {}
+        self.follow_data = True
+        self.plotWidget.getViewBox().sigRangeChangedManually.connect(
+            self._stop_following)
+        self.plotWidget.getPlotItem().autoBtn.clicked.connect(
+            self._follow)
+
         # This dictionary holds the information that can be plotted
         # for the given flag
         self.dataplots = {"THz Signals": {"E_off": None,
@@ -66,12 +141,16 @@ class LivePlot(QWidget):
         """
         Internal method to update the plot axes based on the flag
         """
+        self.buffers = {}
         match self.flag:
             case "THz Signals":
                 self.plotWidget.setLabel("left", "ADC Counts")
                 self.plotWidget.setLabel("bottom", "Delay (mm)")
                 self.plotWidget.showGrid(x=False, y=False)
                 self.plotWidget.setLogMode(False, False)
+                # The range is set from the running extrema instead
+                self.plotWidget.disableAutoRange()
+                self.follow_data = True
                 # Remove plots of THz spectra if any
                 for key in self.dataplots["THz Spectra"].keys():
                     if (self.dataplots["THz Spectra"][key] is None or
@@ -87,6 +166,7 @@ class LivePlot(QWidget):
                 self.plotWidget.setLabel("bottom", "Frequency (THz)")
                 self.plotWidget.showGrid(x=True, y=True)
                 self.plotWidget.setLogMode(False, True)
+                self.plotWidget.enableAutoRange()
                 # Remove plots of THz signal if any
                 for key in self.dataplots["THz Signals"].keys():
                     if (self.dataplots["THz Signals"][key] is None or
@@ -110,10 +190,21 @@ class LivePlot(QWidget):
             if "Spectrum" in key:
                 self.dataplots[self.flag][key].setLogMode(xState=False,
                                                      yState=True)
+            if self.flag == "Picoscope signal":
+                # A capture is ~80,000 samples, far more than the plot is
+                # wide. Only the visible range is drawn, decimated to the
+                # min and max of each pixel column, so pulse edges and
+                # saturation spikes stay visible. pyqtgraph recomputes
+                # this (vectorised) on every zoom or resize.
+                self.dataplots[self.flag][key].setClipToView(True)
+                self.dataplots[self.flag][key].setDownsampling(
+                    auto=True, method="peak")
 
     def change_plot_type(self, text):
         self.plot_type = text.lower().replace(" + points", "+points")
         self.plotWidget.clear()
+        # The new curves are empty, so refill them from the data
+        self.buffers = {}
         for plot in self.dataplots[self.flag].keys():
             if plot == "x_axis":
                 continue
@@ -156,9 +247,6 @@ class LivePlot(QWidget):
         Update the plot with new data.
         The main plotting logic is all here
         """
-        # If data is provided, cache the data
-        if type(data) is dict:
-            self.data = data
         #Cache the data selection if provided
         if data_selection is not None:
             self.data_selection = data_selection
@@ -168,6 +256,13 @@ class LivePlot(QWidget):
             self.plotWidget.setTitle(self.flag)
             self.previous_flag = self.flag
             self._update_plot_axes()
+            # Data of the previous flag has none of the keys of this one
+            self.data = None
+        # If data is provided, cache the data
+        if data is not None:
+            self.data = data
+        if self.data is None:
+            return
 
         # Just simply plot the data, no need to change anything
         for plot in self.dataplots[self.flag].keys():
@@ -176,30 +271,439 @@ class LivePlot(QWidget):
             if self.dataplots[self.flag][plot] is None:
                 print(f"Plot {plot} not found in {self.flag}")
                 continue  # Skip invalid plots
-            y_data = self.data[plot]
-            x_data = self.data[self.dataplots[self.flag]["x_axis"]][:len(
-                                    self.data[plot])]
             if data_selection is not None and plot in self.data_selection:
                 self.dataplots[self.flag][plot].setVisible(True)
             else:
                 self.dataplots[self.flag][plot].setVisible(False)
 
+            if self.flag == "THz Signals":
+                self._append_points(plot)
+                continue
+            y_data = self.data[plot]
+            x_data = self.data[self.dataplots[self.flag]["x_axis"]][:len(
+                                    self.data[plot])]
             if np.iscomplexobj(y_data):
                 print(f"Plot {plot} contains complex data,"
                       f" getting absolute value.")
                 y_data = np.abs(y_data)
             self.dataplots[self.flag][plot].setData(x_data, y_data)
 
+        if self.flag == "THz Signals":
+            self._update_range()
+
+    def _append_points(self, plot: str):
+        """
+        Add the new points of a THz signal to its curve. The buffer is
+        started again when the frame is of new data, e.g. a new scan.
+        """
+        y_data = self.data[plot]
+        x_data = self.data[self.dataplots[self.flag]["x_axis"]]
+        buffer = self.buffers.get(plot)
+        if (buffer is None or buffer.run != self.data.run or
+                len(y_data) < buffer.count):
+            buffer = AppendBuffer(self.data.run, len(x_data))
+            self.buffers[plot] = buffer
+        if buffer.extend(x_data, y_data):
+            self.dataplots[self.flag][plot].setData(
+                buffer.x[:buffer.count], buffer.y[:buffer.count],
+                skipFiniteCheck=True)
+
+    def _update_range(self):
+        """ Fit the view to the extrema of the visible THz signals """
+        if not self.follow_data:
+            return
+        buffers = [buffer for plot, buffer in self.buffers.items()
+                   if buffer.count != 0 and
+                   self.dataplots[self.flag][plot].isVisible()]
+        if len(buffers) == 0:
+            return
+        x_range = (min(buffer.x_range[0] for buffer in buffers),
+                   max(buffer.x_range[1] for buffer in buffers))
+        y_range = (min(buffer.y_range[0] for buffer in buffers),
+                   max(buffer.y_range[1] for buffer in buffers))
+        self.plotWidget.setRange(xRange=x_range, yRange=y_range)
+
+    def _stop_following(self):
+        """ Leave the view where the user has zoomed or panned to """
+        self.follow_data = False
+
+    def _follow(self):
+        """ Follow the data again after the autoscale button """
+        if self.flag != "THz Signals":
+            return
+        # The button turns on pyqtgraph's autorange, which scans all data
+        self.plotWidget.disableAutoRange()
+        self.follow_data = True
+        self._update_range()
+
+class IndexAxis(pg.AxisItem):
+    """
+    Axis of an image drawn in index coordinates (pixel i at i), labelled
+    with the values of its rows or columns. The values need not be
+    evenly spaced, e.g. logarithmic pump delays.
+    """
+    def __init__(self, orientation: str):
+        super().__init__(orientation)
+        self.values = np.zeros(1)
+
+    def set_values(self, values: np.ndarray):
+        """ Label the axis with the values of the pixels """
+        self.values = values
+        self.picture = None
+        self.update()
+
+    def tickSpacing(self, minVal, maxVal, size):
+        # Pixels between the ticks would show interpolated values
+        return [(max(spacing, 1), offset) for spacing, offset in
+                super().tickSpacing(minVal, maxVal, size)]
+
+    def tickStrings(self, values, scale, spacing):
+        indices = np.arange(len(self.values))
+        return [f"{np.interp(value, indices, self.values):.4g}"
+                if 0 <= value <= indices[-1] else ""
+                for value in values]
+
+class HeatmapPlot(QWidget):
+    """
+    Live 2D view of the THz signals, with a line profile of one row.
+
+    - For 2D maps (see MapDP), a row is a pump delay and a column a THz
+      delay. Repeated 1D scans of the same delays are shown one scan per
+      row, e.g. to follow drift over a series of scans.
+    - The images of E_off, E_on and DT are preallocated (float32, NaN
+      where not measured yet). Only the points measured since the last
+      frame are written to them.
+    - The colour levels follow the running extrema of the image, until
+      they are changed on the colour bar ("Auto levels" to follow
+      again).
+    - The line profile shows the row under the horizontal cursor, which
+      follows the row being measured until it is dragged.
+    - The images are drawn in pixel coordinates, with the axes labelled
+      by the delays (see IndexAxis), as the delays of a row or column
+      need not be evenly spaced (e.g. logarithmic sampling).
+    """
+    keys = ["E_off", "E_on", "DT"]
+
+    def __init__(self, flag: str = "THz Map"):
+        super().__init__()
+        self.flag = flag
+        self.data = None
+        self.key = "DT"
+        self.images = None
+        # Run number, row and number of points of the frames drawn last
+        self.run = None
+        self.row = -1
+        self.columns = None
+        self.row_label = ""
+        self.count = 0
+        self.rows = 0
+        self.levels = {}
+        self.follow_levels = True
+        self.follow_row = True
+
+        self.x_ticks = IndexAxis("bottom")
+        self.y_ticks = IndexAxis("left")
+        self.plotWidget = pg.PlotWidget(axisItems={"bottom": self.x_ticks,
+                                                   "left": self.y_ticks})
+        self.plotWidget.setTitle(flag)
+        self.plotWidget.getPlotItem().layout.setContentsMargins(
+            10, 10, 10, 10)
+        self.plotWidget.setLabel("bottom", "Delay (mm)")
+        self.image_item = pg.ImageItem(axisOrder="row-major")
+        self.plotWidget.addItem(self.image_item)
+        self.colour_bar = pg.ColorBarItem(colorMap="viridis",
+                                          rounding=0.001)
+        self.colour_bar.setImageItem(self.image_item,
+                                     insert_in=self.plotWidget.getPlotItem())
+        self.colour_bar.sigLevelsChangeFinished.connect(
+            self._stop_following_levels)
+        self.cursor = pg.InfiniteLine(angle=0, movable=True, pen="r")
+        self.cursor.sigDragged.connect(self._stop_following_row)
+        self.cursor.sigPositionChanged.connect(self._update_profile)
+        self.plotWidget.addItem(self.cursor)
+
+        self.profile_ticks = IndexAxis("bottom")
+        self.profile_widget = pg.PlotWidget(
+            axisItems={"bottom": self.profile_ticks})
+        self.profile_widget.setLabel("left", "ADC Counts")
+        self.profile_widget.setXLink(self.plotWidget)
+        self.profile = self.profile_widget.plot(
+            [], [], pen=pg.mkPen(color=colors[0], width=2))
+
+        self.dropdown = QComboBox()
+        self.dropdown.addItems(self.keys)
+        self.dropdown.setCurrentText(self.key)
+        self.dropdown.currentTextChanged.connect(self.change_key)
+        self.levels_button = QPushButton("Auto levels")
+        self.levels_button.clicked.connect(self._follow_levels)
+        controls_layout = QGridLayout()
+        controls_layout.addWidget(self.dropdown, 0, 0)
+        controls_layout.addWidget(self.levels_button, 0, 1)
+
+        layout = QVBoxLayout()
+        layout.addWidget(self.plotWidget, 3)
+        layout.addWidget(self.profile_widget, 1)
+        layout.addLayout(controls_layout)
+        self.setLayout(layout)
+
+    def _start(self, columns: np.ndarray, rows: np.ndarray):
+        """
+        Allocate new images.
+        Args:
+            columns (np.ndarray): Delays of the columns (mm).
+            rows (np.ndarray): Values of the rows, pump delays (mm) for
+                a map or scan numbers for repeated scans.
+        """
+        self.x_axis = np.asarray(columns, dtype=float)
+        self.y_axis = np.asarray(rows, dtype=float)
+        self.x_ticks.set_values(self.x_axis)
+        self.profile_ticks.set_values(self.x_axis)
+        self.y_ticks.set_values(self.y_axis)
+        shape = (len(self.y_axis), len(self.x_axis))
+        self.images = {key: np.full(shape, np.nan, dtype=np.float32)
+                       for key in self.keys}
+        self.levels = {key: [np.inf, -np.inf] for key in self.keys}
+        self.rows = 0
+        self.follow_levels = True
+        self.follow_row = True
+
+    def _add_rows(self):
+        """ Double the number of rows for repeated scans """
+        rows = len(self.y_axis)
+        self.y_axis = np.arange(2 * rows, dtype=float)
+        self.y_ticks.set_values(self.y_axis)
+        for key in self.keys:
+            self.images[key] = np.concatenate(
+                [self.images[key],
+                 np.full_like(self.images[key], np.nan)])
+
+    def _place(self, frame) -> tuple:
+        """
+        Find where the points of a new frame go, allocating new images
+        when the frame is not of the same map or scan delays.
+        Returns:
+            The row of the frame and the columns of its steps.
+        """
+        if frame.map_row is not None:
+            if (self.images is None or
+                    self.x_axis.shape != frame.map_delay_mm.shape or
+                    self.y_axis.shape != frame.map_pump_delay_mm.shape or
+                    np.any(self.x_axis != frame.map_delay_mm) or
+                    np.any(self.y_axis != frame.map_pump_delay_mm)):
+                self._start(frame.map_delay_mm, frame.map_pump_delay_mm)
+                self.row_label = "Pump delay (mm)"
+                self.plotWidget.setLabel("left", self.row_label)
+            return frame.map_row, frame.map_columns
+        delay = frame["Delay (mm)"]
+        if (self.images is None or self.x_axis.shape != delay.shape or
+                np.any(self.x_axis != delay)):
+            self._start(delay, np.arange(16))
+            self.row_label = "Scan"
+            self.plotWidget.setLabel("left", self.row_label)
+            return 0, np.arange(len(delay))
+        row = self.row + 1
+        if row >= len(self.y_axis):
+            self._add_rows()
+        return row, np.arange(len(delay))
+
+    def update_plot(self, data=None):
+        """
+        Add the new points of a WaveformFrame. The images are only drawn
+        when the widget is shown. Without a frame, they are redrawn.
+        """
+        if data is not None:
+            if data.run != self.run:
+                self.row, self.columns = self._place(data)
+                self.run = data.run
+                self.count = 0
+            self.data = data
+            if data.steps > self.count:
+                columns = self.columns[self.count:data.steps]
+                for key in self.keys:
+                    values = data[key][self.count:data.steps]
+                    self.images[key][self.row, columns] = values
+                    if np.all(np.isnan(values)):
+                        continue
+                    self.levels[key] = [
+                        min(self.levels[key][0], np.nanmin(values)),
+                        max(self.levels[key][1], np.nanmax(values))]
+                self.count = data.steps
+                self.rows = max(self.rows, self.row + 1)
+        if self.images is not None and self.isVisible():
+            self._draw()
+
+    def _draw(self):
+        """ Upload the image and update the levels and the profile """
+        # Repeated scans only show the rows measured so far
+        rows = (len(self.y_axis) if self.data.map_row is not None
+                else self.rows)
+        self.image_item.setImage(self.images[self.key][:rows],
+                                 autoLevels=False)
+        # Pixel (row, column) is centred at (column, row)
+        self.image_item.setRect(-0.5, -0.5, len(self.x_axis), rows)
+        levels = self.levels[self.key]
+        if self.follow_levels and levels[0] <= levels[1]:
+            self.colour_bar.setLevels(levels)
+        if self.follow_row:
+            self.cursor.setValue(self.row)
+        self._update_profile()
+
+    def _update_profile(self):
+        """ Show the row under the cursor in the line profile """
+        if self.images is None:
+            return
+        row = int(round(self.cursor.value()))
+        if not 0 <= row < len(self.y_axis):
+            self.profile.setData([], [])
+            return
+        self.profile_widget.setTitle(
+            f"{self.key} at {self.row_label} {self.y_axis[row]:.4g}")
+        self.profile.setData(np.arange(len(self.x_axis)),
+                             self.images[self.key][row],
+                             connect="finite")
+
+    def change_key(self, key: str):
+        """ Show E_off, E_on or DT """
+        self.key = key
+        self.follow_levels = True
+        self.update_plot()
+
+    def _stop_following_levels(self):
+        """ Keep the colour levels set on the colour bar """
+        self.follow_levels = False
+
+    def _follow_levels(self):
+        """ Follow the extrema of the data again """
+        self.follow_levels = True
+        self.update_plot()
+
+    def _stop_following_row(self):
+        """ Keep the profile on the row the cursor was dragged to """
+        self.follow_row = False
+
+class DiagnosticsPanel(QWidget):
+    """
+    Live noise diagnostics, to spot noise problems during a run.
+
+    - Histograms of the spread of the repeats of A, B, C and D about
+      their step means, and of the five noise figures of each step, for
+      the whole experiment (since resuming, for a resumed one). They are
+      streaming histograms with a fixed number of bins (see
+      StreamingHistogram), sent with each frame.
+    - SNR vs delay for the current scan: |E_off| / Emitter noise and
+      |DT| / OPTP noise, single repeat values.
+    Only drawn while shown, from the latest frame.
+    """
+    histogram_keys = ["A", "B", "C", "D", "Background noise",
+                      "Emitter noise", "Pump-induced noise", "Total noise",
+                      "OPTP noise"]
+    # SNR curve -> (signal, noise)
+    snr_keys = {"E_off SNR": ("E_off", "Emitter noise"),
+                "DT SNR": ("DT", "OPTP noise")}
+
+    def __init__(self, flag: str = "Diagnostics", columns: int = 3):
+        super().__init__()
+        self.flag = flag
+        self.data = None
+        self.buffers = {}
+        layout = QGridLayout()
+        self.setLayout(layout)
+
+        self.histograms = {}
+        for i, key in enumerate(self.histogram_keys):
+            plot_widget = pg.PlotWidget()
+            title = key if "noise" in key else f"{key} - step mean"
+            plot_widget.setTitle(title, size="9pt")
+            plot_widget.getAxis("left").setStyle(showValues=False)
+            self.histograms[key] = plot_widget.plot(
+                [0, 1], [0], stepMode="center", fillLevel=0,
+                brush=colors[0], pen=pg.mkPen(color=colors[0]))
+            layout.addWidget(plot_widget, i // columns, i % columns)
+
+        self.snr_widget = pg.PlotWidget()
+        self.snr_widget.setTitle("SNR")
+        self.snr_widget.setLabel("bottom", "Delay (mm)")
+        self.snr_widget.addLegend()
+        self.snr_curves = {key: self.snr_widget.plot(
+                               [], [], name=key,
+                               pen=pg.mkPen(color=colors[i % 3], width=2))
+                           for i, key in enumerate(self.snr_keys)}
+        rows = (len(self.histogram_keys) + columns - 1) // columns
+        layout.addWidget(self.snr_widget, rows, 0, 2, columns)
+
+    def update_plot(self, data=None):
+        """
+        Keep the latest WaveformFrame, and draw it if shown. Without a
+        frame, the latest one is redrawn.
+        """
+        if data is not None:
+            self.data = data
+        if self.data is None or not self.isVisible():
+            return
+        for key, histogram in self.data.histograms.items():
+            if histogram is not None and key in self.histograms:
+                self.histograms[key].setData(*histogram)
+        x_data = self.data["Delay (mm)"]
+        for key, (signal, noise) in self.snr_keys.items():
+            buffer = self.buffers.get(key)
+            if buffer is None or buffer.run != self.data.run:
+                buffer = AppendBuffer(self.data.run, len(x_data))
+                self.buffers[key] = buffer
+            if self.data.steps <= buffer.count:
+                continue
+            start = buffer.count
+            with np.errstate(divide="ignore", invalid="ignore"):
+                snr = (np.abs(self.data[signal][start:]) /
+                       self.data[noise][start:])
+            snr[~np.isfinite(snr)] = np.nan
+            buffer.append(x_data[start:self.data.steps], snr)
+            self.snr_curves[key].setData(buffer.x[:buffer.count],
+                                         buffer.y[:buffer.count],
+                                         connect="finite")
+
 class PlotManager(QWidget):
-    """ Class for the main tab to record and display results. """
+    """
+    Class for the main tab to record and display results.
+
+    Frames from the experiment thread (see src/control/frames.py) are
+    queued with queue_plots and drawn by a render timer at a capped frame
+    rate. Only the latest frame of each kind (WaveformFrame,
+    SignalFrame) is kept, so frames that arrive faster than they can be
+    drawn are dropped instead of backing up the event queue.
+
+    The THz spectra are calculated here, on a worker thread, and only
+    while they are on screen (see request_spectra).
+
+    The progress bar shows the progress of the running experiment, and
+    the time left from the moving average of its step durations (see
+    ProgressMeter).
+    """
     def __init__(self):
         super().__init__()
         self.layout = QGridLayout()
-        self.plot_order = ["THz Signals", "THz Spectra"]
+        self.plot_order = ["THz Signals", "THz Spectra", "THz Map",
+                           "Diagnostics"]
         self.current_data = None
         self.setLayout(self.layout)
         self.data_plots()
 
+        # Latest frames waiting to be drawn, and the last one drawn
+        self.pending_data = None
+        self.pending_signal = None
+        self.drawn_seq = 0
+
+        # Spectra of the current data, and the SpectrumDP of its scan
+        self.current_spectra = None
+        self.spectrum_dp = None
+        self.spectrum_run = None
+        self.spectra_running = False
+        self.spectra_pool = QThreadPool()
+        self.spectra_pool.setMaxThreadCount(1)
+        self.render_timer = QTimer(self)
+        self.render_timer.setInterval(
+            int(1000 / defaults["plots"]["frame rate (Hz)"]))
+        self.render_timer.timeout.connect(self.render)
+
     def control_panel(self):
         """ Create the information widget for the plots """
         base = QWidget()
@@ -233,8 +737,15 @@ class PlotManager(QWidget):
         self.next_exp_button = QPushButton("Next experiment")
         self.next_exp_button.setEnabled(False)
         control_layout.addWidget(self.data_dropdown, 0, 0)
+        self.progress_bar = QProgressBar()
+        # Steps are split into captures, so use a finer scale than %
+        self.progress_bar.setRange(0, 1000)
+        self.progress_bar.setValue(0)
+        self.progress_label = QLabel("")
         control_layout.addWidget(self.exp_stop_button, 1, 0)
         control_layout.addWidget(self.next_exp_button, 1, 1)
+        control_layout.addWidget(self.progress_bar, 2, 0, 1, 2)
+        control_layout.addWidget(self.progress_label, 3, 0, 1, 2)
 
         return base
 
@@ -246,41 +757,170 @@ class PlotManager(QWidget):
                                toolbar=True),
                       LivePlot("THz Spectra"),
                       LivePlot("Picoscope signal")]
+        # These take the place of the main plot when selected. The
+        # heatmap keeps the rows of earlier scans, so it is made now. The
+        # diagnostics only need the latest frame, so they are made when
+        # first selected (see change_plot), to keep the startup fast.
+        self.heatmap = HeatmapPlot("THz Map")
+        self.diagnostics = None
+        self.views = {self.heatmap.flag: self.heatmap}
+        self.main_stack = QStackedWidget()
+        self.main_stack.addWidget(self.plots[0])
+        self.main_stack.addWidget(self.heatmap)
 
         self.control_panel = self.control_panel()
-        self.layout.addWidget(self.plots[0], 0, 0, 6, 4)
+        self.layout.addWidget(self.main_stack, 0, 0, 6, 4)
         self.layout.addWidget(self.control_panel, 0, 4, 4, 1)
         self.layout.setColumnMinimumWidth(0, 1300)
         self.layout.setRowMinimumHeight(0, 400)
         for i in range(len(self.plots[1:])):
             self.layout.addWidget(self.plots[1:][i], i+4, 4, 1, 1)
 
+    def update_progress(self, progress):
+        """
+        Show the progress of the running experiment, from a
+        ProgressFrame.
+        """
+        if progress.steps != 0:
+            self.progress_bar.setValue(
+                int(1000 * min(progress.done() / progress.steps, 1)))
+        text = (f"Experiment {progress.experiment} of "
+                f"{progress.experiments}: {progress.name}\n"
+                f"Step {progress.step} of {progress.steps}")
+        time_left = progress.time_left()
+        if time_left is not None:
+            text += f", {format_duration(time_left)} left"
+        self.progress_label.setText(text)
+
+    def end_progress(self):
+        """ Show that the queue is no longer running """
+        text = self.progress_label.text().split("\n")[0]
+        if text != "":
+            text += "\n"
+        self.progress_label.setText(text + "Queue ended")
+
+    def queue_plots(self, data):
+        """
+        Queue a new frame to be drawn, replacing any frame of the same
+        kind that has not been drawn yet.
+        """
+        if isinstance(data, SignalFrame):
+            self.pending_signal = data
+        else:
+            self.pending_data = data
+        if not self.render_timer.isActive():
+            self.render_timer.start()
+
+    def render(self):
+        """
+        Draw the queued data, once per render timer tick. The timer stops
+        when there is nothing left to draw.
+        """
+        data, signal = self.pending_data, self.pending_signal
+        self.pending_data = None
+        self.pending_signal = None
+        if data is None and signal is None:
+            self.render_timer.stop()
+            return
+        # Frames are drawn in order, so never go back to an older one
+        if data is not None and data.seq > self.drawn_seq:
+            self.drawn_seq = data.seq
+            self.update_plots(data)
+        if signal is not None:
+            self.update_plots(signal)
+
     def update_plots(self,
-                     data: dict = None):
-        """ Update the plots with new data """
-        if type(data) is dict and "signal" not in data.keys():
+                     data=None):
+        """
+        Update the plots with new data. Raw Picoscope signals only update
+        the Picoscope plot. Without data, the waveform plots are redrawn
+        with the current data, e.g. after a change of data selection.
+        """
+        if isinstance(data, SignalFrame):
+            for plot in self.plots:
+                if plot.flag == "Picoscope signal":
+                    plot.update_plot(data)
+            return
+        if data is not None:
             self.current_data = data
+        if self.current_data is None:
+            return
         # Update information variables
-        if self.current_data is not None:
-            self.info_widget.update_info(self.current_data)
+        self.info_widget.update_info(self.current_data)
         for plot in self.plots:
             match plot.flag:
-                case "Picoscope signal":
-                    if type(data) is dict and "signal" in data.keys():
-                        plot.update_plot(data)
-                        return
                 case "THz Signals":
-                    if self.current_data is not None:
-                        plot.update_plot(self.current_data,
-                                    self.THz_signal_data.checked_items)
+                    plot.update_plot(self.current_data,
+                                     self.THz_signal_data.checked_items)
                 case "THz Spectra":
-                    if self.current_data is not None:
-                        plot.update_plot(self.current_data,
+                    plot.update_plot(self.current_spectra,
                                      self.THz_spectra_data.checked_items)
+        # Drawn only when shown, but kept up to date with every frame
+        for view in self.views.values():
+            view.update_plot(data)
+        self.request_spectra()
+
+    def _spectra_shown(self) -> bool:
+        """ Whether a plot of the THz spectra is on screen """
+        return any(plot.flag == "THz Spectra" and plot.isVisible()
+                   for plot in self.plots)
+
+    def request_spectra(self):
+        """
+        Calculate the spectra of the current data on a worker thread, if
+        they are on screen and out of date. One calculation runs at a
+        time, and the latest data is picked up when it finishes.
+        """
+        data = self.current_data
+        if (self.spectra_running or data is None or data.steps == 0 or
+                not self._spectra_shown()):
+            return
+        if (self.current_spectra is not None and
+                self.current_spectra.run == data.run and
+                self.current_spectra.steps == data.steps):
+            return
+        # The frequency axis and FFT plan are made once per scan
+        if self.spectrum_dp is None or self.spectrum_run != data.run:
+            self.spectrum_dp = SpectrumDP(data["Delay (mm)"])
+            self.spectrum_run = data.run
+        spectrum_dp = self.spectrum_dp
+        worker = Worker(lambda emit: emit(spectrum_dp.calculate(data)))
+        worker.signals.processed_data.connect(self.show_spectra)
+        worker.signals.finished.connect(self._spectra_finished)
+        self.spectra_running = True
+        self.spectra_pool.start(worker)
+
+    def show_spectra(self, spectra):
+        """ Draw newly calculated spectra (a SpectraFrame) """
+        self.current_spectra = spectra
+        for plot in self.plots:
+            if plot.flag == "THz Spectra":
+                plot.update_plot(spectra,
+                                 self.THz_spectra_data.checked_items)
+
+    def _spectra_finished(self):
+        """ Start on any data that arrived during the calculation """
+        self.spectra_running = False
+        self.request_spectra()
+
+    def showEvent(self, event):
+        """ Catch up on the spectra, not calculated while hidden """
+        super().showEvent(event)
+        self.request_spectra()
 
     def change_plot(self):
         """ Change the main plot to selected data """
         ctext = self.data_dropdown.currentText()
+        if ctext == "Diagnostics" and self.diagnostics is None:
+            self.diagnostics = DiagnosticsPanel(ctext)
+            self.diagnostics.update_plot(self.current_data)
+            self.views[ctext] = self.diagnostics
+            self.main_stack.addWidget(self.diagnostics)
+        if ctext in self.views:
+            self.main_stack.setCurrentWidget(self.views[ctext])
+            self.views[ctext].update_plot()
+            return
+        self.main_stack.setCurrentWidget(self.plots[0])
         current_main_flag = self.plots[0].flag
 
         # Find the plot corresponding to the selected flag
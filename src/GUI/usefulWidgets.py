@@ -3,9 +3,6 @@ from PyQt6.QtWidgets import (
     QGroupBox, QVBoxLayout, QCheckBox
 )
 from PyQt6.QtGui import QFont
-from matplotlib.backends.backend_qtagg import (FigureCanvasQTAgg
-                                               as FigureCanvas)
-from matplotlib.figure import Figure
 
 # This file provides useful widgets for the GUI to avoid
 # too much messy code in the main files.
@@ -169,6 +166,10 @@ class TinyHisPlotWidget(QWidget):
     A tiny histogram plot widget for displaying small plots in the GUI.
     """
     def __init__(self, parent=None):
+        # matplotlib is slow to import, so only when this widget is used
+        from matplotlib.backends.backend_qtagg import (FigureCanvasQTAgg
+                                                       as FigureCanvas)
+        from matplotlib.figure import Figure
         super().__init__(parent)
         layout = QVBoxLayout()
         self.setLayout(layout)
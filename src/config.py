@@ -0,0 +1,12 @@
+import json as js
+
+# The system defaults, read once when first imported and shared by all
+# modules: from src.config import defaults.
+# Changing a value here (e.g. defaults["simulation"]["enabled"]) before
+# the other modules are used changes it for all of them, which is how
+# the startup benchmark runs on the simulated instruments.
+
+PATH = r"config/systemDefaults.json"
+
+with open(PATH) as f:
+    defaults = js.load(f)
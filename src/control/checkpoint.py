@@ -0,0 +1,147 @@
+import os
+import json as js
+from src.config import defaults
+import hashlib
+
+# Step-level checkpointing so that interrupted experiments (crashes, USB
+# drop outs, power cuts) can be resumed instead of started over.
+
+class Checkpoint:
+    """
+    Append-only journal of the completed steps of one experiment.
+
+    The journal is a JSON lines file in the checkpoint directory:
+    - The first line holds the signature of the experiment (name,
+      sample, delays, repeats and pump settings, and which copy it is
+      of identical experiments in the queue).
+    - Every following line holds one completed step: its index, the
+      measured delay, the mean ABCD signals, the noise values and the
+      saturation flag.
+    Each step is flushed to disk as soon as it is complete, so at most
+    the step in progress is lost. The file name is derived from the
+    signature, so the same experiment queued again finds its journal,
+    wherever it is in the queue (e.g. after finished experiments were
+    removed or the queue was reordered).
+    """
+    def __init__(self, experiment, sample: str, copy: int = 0):
+        """
+        Args:
+            experiment (Experiment): The experiment to journal.
+            sample (str): Sample name.
+            copy (int): Number of identical experiments before this one
+                in the queue, so that each has its own journal (see
+                for_queue).
+        """
+        self.signature = {"name": experiment.name,
+                          "sample": sample,
+                          "copy": copy,
+                          "delay array": [float(delay) for delay in
+                                          experiment.delay_array],
+                          "repeats": experiment.repeats,
+                          "inactive DL position":
+                              experiment.inactive_DL_position,
+                          "fw positions": list(experiment.fw_positions)}
+        digest = hashlib.sha1(js.dumps(self.signature, sort_keys=True).
+                              encode("utf-8")).hexdigest()[:12]
+        self.path = os.path.join(defaults["checkpoints"]["directory"],
+                                 f"{experiment.name} {digest}.jsonl")
+
+    @staticmethod
+    def for_queue(experiments: list, sample: str) -> list:
+        """
+        Make the checkpoints of a queue of experiments. Identical
+        experiments are told apart by their order, not by their
+        position in the queue.
+        Args:
+            experiments (list): The queued experiments.
+            sample (str): Sample name.
+        Returns:
+            The Checkpoint of each experiment, or None for those that
+            are not resumable.
+        """
+        checkpoints = []
+        copies = {}
+        for experiment in experiments:
+            if not experiment.resumable:
+                checkpoints.append(None)
+                continue
+            checkpoint = Checkpoint(experiment, sample)
+            # The path is unique to the signature of the first copy
+            key = checkpoint.path
+            if key in copies:
+                checkpoint = Checkpoint(experiment, sample, copies[key])
+            copies[key] = copies.get(key, 0) + 1
+            checkpoints.append(checkpoint)
+        return checkpoints
+
+    def exists(self) -> bool:
+        """ Check if there is a journal for this experiment. """
+        return os.path.exists(self.path)
+
+    def load(self) -> list:
+        """
+        Read the completed steps from the journal.
+        Returns:
+            The step records in order, from step 0 up to the first
+            missing or unreadable step. Empty if there is no journal or
+            it belongs to a different experiment.
+        """
+        if not self.exists():
+            return []
+        records = []
+        with open(self.path) as f:
+            try:
+                header = js.loads(f.readline())
+            except js.JSONDecodeError:
+                return []
+            if header.get("signature") != self.signature:
+                return []
+            for line in f:
+                try:
+                    record = js.loads(line)
+                except js.JSONDecodeError:
+                    # Torn write from the interruption, drop the rest
+                    break
+                if record.get("step") != len(records):
+                    break
+                records.append(record)
+        return records
+
+    def resume(self) -> list:
+        """
+        Load the completed steps and rewrite a clean journal holding
+        only those, ready for new steps to be appended.
+        Returns:
+            The completed step records.
+        """
+        records = self.load()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "w") as f:
+            f.write(js.dumps({"signature": self.signature}) + "\n")
+            for record in records:
+                f.write(js.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        return records
+
+    def record_step(self, step: int, waveformDP):
+        """
+        Append a completed step to the journal.
+        Args:
+            step (int): Index of the step in the delay array.
+            waveformDP (WaveformDP): Data processing instance, after
+                update_data has been called for the step.
+        """
+        record = {"step": step, "Saturation": bool(waveformDP.saturation)}
+        for key in (["Delay measured (mm)", "A", "B", "C", "D"] +
+                    waveformDP.noise_keys):
+            record[key] = float(waveformDP.data[key][-1])
+        with open(self.path, "a") as f:
+            f.write(js.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def discard(self):
+        """ Delete the journal, e.g. once the experiment is complete. """
+        if self.exists():
+            os.remove(self.path)
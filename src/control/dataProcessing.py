@@ -1,16 +1,80 @@
 import numpy as np
 import json as js
-import pandas as pd
-from picosdk.functions import adc2mV
-import pyfftw  # FFTW used in Matlab.
+from src.config import defaults
+from src.control.frames import WaveformFrame, SpectraFrame, new_run
+# pandas (saving) and pyfftw (spectra) are slow to import and are not
+# needed to start the GUI, so they are imported where they are used.
 
 # TODO: Spectrum analysis, enabling bandwidth measurements. Remember to do it for noise floor too.
 # TODO: Add method to save data to file
 # TODO: Convert knifeedge matlab code to python
 # TODO: The only data necessary: Delay (mm), A, B, C, D
 
-with open(r"config/systemDefaults.json") as f:
-    defaults = js.load(f)
+class StreamingHistogram:
+    """
+    Histogram with a fixed number of bins, filled a batch at a time, so
+    its memory stays the same however long the run.
+
+    The range is set from the first batch (its mean +- 5 standard
+    deviations, or +- the mean for a single value). When later values
+    fall outside it, the range is doubled, merging pairs of bins, until
+    they fit. The counts stay exact, only coarser.
+    """
+    def __init__(self, bins: int = None):
+        """
+        Args:
+            bins (int): Number of bins, even. From systemDefaults.json if
+                None.
+        """
+        if bins is None:
+            bins = defaults["diagnostics"]["histogram bins"]
+        self.counts = np.zeros(bins + bins % 2, dtype=np.int64)
+        self.lower = None
+        self.upper = None
+
+    def add(self, values):
+        """ Count a batch of values, ignoring NaN """
+        values = np.asarray(values, dtype=float)
+        values = values[np.isfinite(values)]
+        if len(values) == 0:
+            return
+        if self.lower is None:
+            centre = np.mean(values)
+            half_width = max(5 * np.std(values), abs(centre), 1e-9)
+            self.lower = centre - half_width
+            self.upper = centre + half_width
+        while values.min() < self.lower:
+            self._widen(upwards=False)
+        while values.max() >= self.upper:
+            self._widen(upwards=True)
+        indices = ((values - self.lower) / (self.upper - self.lower) *
+                   len(self.counts)).astype(int)
+        # Rounding can put the top of the range in the bin above
+        indices = np.minimum(indices, len(self.counts) - 1)
+        self.counts += np.bincount(indices, minlength=len(self.counts))
+
+    def _widen(self, upwards: bool):
+        """ Double the range, merging pairs of bins """
+        half = len(self.counts) // 2
+        merged = self.counts.reshape(half, 2).sum(axis=1)
+        width = self.upper - self.lower
+        self.counts = np.zeros_like(self.counts)
+        if upwards:
+            self.counts[:half] = merged
+            self.upper += width
+        else:
+            self.counts[half:] = merged
+            self.lower -= width
+
+    def snapshot(self) -> tuple:
+        """
+        Returns:
+            The bin edges and a copy of the counts, or None if empty.
+        """
+        if self.lower is None:
+            return None
+        return (np.linspace(self.lower, self.upper, len(self.counts) + 1),
+                self.counts.copy())
 
 class WaveformDP:
     """
@@ -51,6 +115,21 @@ class WaveformDP:
     # These are reset/changed after each experiment
     saturation = False
 
+    # Noise values calculated for every step
+    noise_keys = ["Background noise", "Emitter noise", "Pump-induced noise",
+                  "Total noise", "OPTP noise"]
+
+    # Values with one entry per step. They are also written to
+    # preallocated arrays, which the frames sent to the GUI are views of.
+    step_keys = ["Delay measured (mm)", "A", "B", "C", "D", "E_off", "E_on",
+                 "DT", "Background noise", "Emitter noise",
+                 "Pump-induced noise", "Total noise", "OPTP noise"]
+
+    # Columns written to the data file
+    save_keys = ["Delay (mm)", "Delay measured (mm)", "A", "B", "C", "D",
+                 "Background noise", "Emitter noise", "Pump-induced noise",
+                 "Total noise", "OPTP noise"]
+
     def __init__(self,
                  experiment_name: str,
                  delay_mm: np.ndarray):
@@ -61,20 +140,35 @@ class WaveformDP:
                             ["sampling counts"])
         self.pulses_per_sample = self.sampling_signals * sampling_counts
         
-        # Make a frequency array
+        self._start_data(delay_mm)
+        self.clear_buffers()
+        # Kept for the whole experiment, e.g. across the rows of a map
+        self.histograms = {key: StreamingHistogram()
+                           for key in ["A", "B", "C", "D"] + self.noise_keys}
+
+    def _start_data(self, delay_mm: np.ndarray):
+        """
+        Start new data for the given delays. New arrays are allocated,
+        so frames of the previous data stay valid.
+        """
+        self.data = self._empty_data(delay_mm)
+        self.step_arrays = {key: np.full(len(delay_mm), np.nan)
+                            for key in self.step_keys}
+        self.steps = 0
+        self.run = new_run()
+
+    def _empty_data(self, delay_mm: np.ndarray) -> dict:
+        """ Create an empty data dictionary for the given delays """
         delay_ps = 2* delay_mm * 1e9 / defaults["C"]
-        double_bandwidth = (len(delay_mm)/(delay_ps[-1] - delay_ps[0]))
-        frequencies = np.linspace(0, double_bandwidth, len(delay_ps))       
-        self.data = {"Delay (mm)": delay_mm, "Delay (ps)": delay_ps, "A": [],
-                     "B": [], "C": [], "D": [], "E_off": [], "E_on": [],
-                     "DT": [], "E_off Spectrum": [], "E_on Spectrum": [],
-                    "DT Spectrum": [], "Frequency (THz)": frequencies,
-                    "E_off max": [], "E_off min": [], "E_on max": [],
-                    "E_on min": [], "DT max": [], "DT min": [],
-                    "Saturation": False, "Background noise": [],
-                    "Emitter noise": [], "Pump-induced noise": [],
-                    "Total noise": [], "OPTP noise": []}
-        
+        return {"Delay (mm)": delay_mm, "Delay (ps)": delay_ps,
+                "Delay measured (mm)": [], "A": [],
+                "B": [], "C": [], "D": [], "E_off": [], "E_on": [],
+                "DT": [], "E_off max": [], "E_off min": [], "E_on max": [],
+                "E_on min": [], "DT max": [], "DT min": [],
+                "Saturation": False, "Background noise": [],
+                "Emitter noise": [], "Pump-induced noise": [],
+                "Total noise": [], "OPTP noise": []}
+
     def check_segment_data(self, ps_raw_output: np.ndarray):
         """ Check for saturation and segment the PicoScope data """
         if (ps_raw_output.max() >= 32760 or
@@ -93,10 +187,12 @@ class WaveformDP:
             self.C_buffer.append(np.mean(segmented_list[i+2]))
             self.D_buffer.append(np.mean(segmented_list[i+3]))
 
-    def update_data(self):
+    def update_data(self, measured_delay: float = None):
         """
         Return the mean of segmented data and updates data dictionary
         to be saved later. Calculations are made for plotting.
+        The measured delay is the DLS position read back for the step,
+        stored next to the commanded "Delay (mm)".
         
         Noise is a difficult thing to calculate, it should always be
         calculated here as it is the number of repeats that determines
@@ -115,24 +211,51 @@ class WaveformDP:
         C = np.array(self.C_buffer)
         D = np.array(self.D_buffer)
         ABCD = [np.mean(A), np.mean(B), np.mean(C), np.mean(D)]
+        # The spread of the repeats about the step mean, so that the THz
+        # waveform itself doesn't widen the histograms
+        for key, values, mean in zip(["A", "B", "C", "D"], [A, B, C, D],
+                                     ABCD):
+            self.histograms[key].add(values - mean)
         noise = [np.std(A), # Baseline background noise
                  np.std(D - A), # Emitter noise
                  np.std(C - A), # Pump-induced noise
                  np.std(B - A), # Total noise
                  np.std(B - C - D + A)] # OPTP noise
+        # Filled with the repeat spreads, so all histograms cover the
+        # same steps (the repeats of restored steps are not journaled)
+        for key, value in zip(self.noise_keys, noise):
+            self.histograms[key].add([value])
+
+        self.add_step(ABCD, noise, measured_delay)
 
+    def add_step(self,
+                 ABCD: list,
+                 noise: list,
+                 measured_delay: float = None):
+        """
+        Append the mean ABCD signals and noise of a step to the data
+        dictionary, and calculate E_off, E_on, DT and their extrema.
+        Args:
+            ABCD (list): Mean A, B, C and D signals of the step.
+            noise (list): Noise values, in the order of noise_keys.
+            measured_delay (float): DLS position read back for the step
+                (mm), NaN if it could not be read.
+        """
+        self.data["Delay measured (mm)"].append(
+            np.nan if measured_delay is None else measured_delay)
         for i, key in enumerate(["A", "B", "C", "D"]):
             self.data[key].append(ABCD[i])
         
-        for i, key in enumerate(["Background noise", "Emitter noise",
-                                "Pump-induced noise", "Total noise",
-                                "OPTP noise"]):
+        for i, key in enumerate(self.noise_keys):
             self.data[key].append(noise[i])
 
         # Calculate E_off, E_on and DT
         self.data["E_off"].append(ABCD[3] - ABCD[0])
         self.data["E_on"].append(ABCD[1] - ABCD[0])
         self.data["DT"].append(ABCD[3] - ABCD[1])
+        for key in self.step_keys:
+            self.step_arrays[key][self.steps] = self.data[key][-1]
+        self.steps += 1
 
         for key in ["E_off", "E_on", "DT"]:
             self.data[f"{key} max"] = [max(self.data[key]),
@@ -144,18 +267,40 @@ class WaveformDP:
                                        [self.data[key].index(
                                        min(self.data[key]))]]
 
-        # Method to calculate FFT can be changed
-        # Calculating spectra using FFTW, similar to Matlab
-        # https://pyfftw.readthedocs.io/en/latest/source/pyfftw/builders/builders.html
-        self.data["E_off Spectrum"] = pyfftw.builders.fft(
-            np.array(self.data["E_off"]))()
-        self.data["E_on Spectrum"] = pyfftw.builders.fft(
-            np.array(self.data["E_on"]))()
-        self.data["DT Spectrum"] = pyfftw.builders.fft(
-            np.array(self.data["DT"]))()
-        self.data["E_off Spectrum"] = np.abs(self.data["E_off Spectrum"])
-        self.data["E_on Spectrum"] = np.abs(self.data["E_on Spectrum"])
-        self.data["DT Spectrum"] = np.abs(self.data["DT Spectrum"])
+    def frame(self) -> WaveformFrame:
+        """
+        Snapshot of the data to send to the GUI. Only the measured part of
+        the step arrays is exposed, which is never written to again, and
+        the histograms have a fixed size, so this takes the same time
+        however many steps there are.
+        """
+        return WaveformFrame(self.run,
+                             self.steps,
+                             self.data["Delay (mm)"],
+                             self.step_arrays,
+                             {f"{key} {extremum}":
+                              self.data[f"{key} {extremum}"]
+                              for key in ["E_off", "E_on", "DT"]
+                              for extremum in ["max", "min"]},
+                             self.saturation,
+                             {key: histogram.snapshot()
+                              for key, histogram in self.histograms.items()})
+
+    def restore_steps(self, records: list):
+        """
+        Rebuild the data dictionary from checkpointed steps, e.g. when
+        resuming an interrupted experiment. The histograms are not
+        refilled, as the repeats of the steps are not journaled, so they
+        only cover the steps measured since resuming.
+        Args:
+            records (list): Step dictionaries with the ABCD, noise and
+                saturation values, as written by the Checkpoint class.
+        """
+        for record in records:
+            self.add_step([record[key] for key in ["A", "B", "C", "D"]],
+                          [record[key] for key in self.noise_keys],
+                          record.get("Delay measured (mm)"))
+            self.saturation = self.saturation or record["Saturation"]
 
     def clear_buffers(self):
         """
@@ -189,6 +334,7 @@ class WaveformDP:
                     print("File already exists.\nSuggest using a different" \
                     "directory to save similar samples.")
             case "hdf5":
+                import pandas as pd
                 pd.DataFrame.from_dict(self.data).to_hdf(
                     f"{filename}.h5", key="df", mode="w")
             case "json":
@@ -198,11 +344,7 @@ class WaveformDP:
                 raise ValueError("Invalid file type. Choose from txt," \
                 "hdf5 or json.")
     
-    def save_data(self,
-                  keys: list = ["Delay (mm)", "A", "B", "C", "D",
-                                "Background noise", "Emitter noise",
-                                "Pump-induced noise", "Total noise",
-                                "OPTP noise"]):
+    def save_data(self, keys: list = None):
         """
         Save the experiment"s data and reset the experiment"s
         attributes.
@@ -211,6 +353,9 @@ class WaveformDP:
         csv for easy access.
         """
         # TODO: Implement saving to file types json and hdf5
+        import pandas as pd
+        if keys is None:
+            keys = self.save_keys
 
         min_len = min(len(self.data[key]) for key in keys)
         result = pd.DataFrame({k: self.data[k][:min_len] for k in keys})
@@ -226,7 +371,167 @@ class WaveformDP:
 
         self.clear_buffers()
         self.saturation = False
-    
+
+    def append_data(self,
+                    labels: dict,
+                    header: bool = False,
+                    keys: list = None):
+        """
+        Append the experiment's data to the existing data file, with
+        constant label columns (e.g. filter settings) in front.
+        Used when several scans share a single data file. Should be
+        called after each scan and each stop, in place of save_data.
+        Args:
+            labels (dict): Column name -> value for the whole scan.
+            header (bool): Write the column names, for the first scan.
+            keys (list): Data columns to write.
+        """
+        import pandas as pd
+        if keys is None:
+            keys = self.save_keys
+        min_len = min(len(self.data[key]) for key in keys)
+        result = pd.DataFrame({k: [v] * min_len for k, v in labels.items()}
+                              | {k: self.data[k][:min_len] for k in keys})
+        if self.save_type == "txt":
+            result.to_csv(f"{self.filename}.txt", sep="\t", index=False,
+                          mode="a", header=header)
+        self.clear_buffers()
+        self.saturation = False
+
+
+class MapDP(WaveformDP):
+    """
+    Data Processing class for 2D pump-probe maps.
+
+    The THz delay (inner axis) is swept for every pump delay (outer
+    axis) in a snake order, so every other row is measured backwards to
+    avoid flying the THz DLS back to the start.
+    - self.data holds the row currently being measured, in the order it
+      is measured, so the live plots work the same as for a 1D scan.
+    - self.map holds preallocated 2D arrays indexed as
+      [pump step, THz step], in ascending delay order. Unmeasured points
+      are NaN.
+    - Each completed row is appended to the data file as it finishes,
+      so the whole map ends up in a single file.
+    """
+
+    map_keys = WaveformDP.step_keys
+
+    def __init__(self,
+                 experiment_name: str,
+                 delay_mm: np.ndarray,
+                 pump_delay_mm: np.ndarray):
+        super().__init__(experiment_name, delay_mm)
+        self.delay_mm = np.asarray(delay_mm)
+        self.pump_delay_mm = np.asarray(pump_delay_mm)
+        shape = (len(self.pump_delay_mm), len(self.delay_mm))
+        self.map = {key: np.full(shape, np.nan) for key in self.map_keys}
+        self.row = 0
+        self.columns = np.arange(len(self.delay_mm))
+        self.rows_saved = 0
+        self.save_type = None
+
+    def start_row(self, row: int) -> np.ndarray:
+        """
+        Start a new row of the map, resetting the row data.
+        Returns:
+            The THz delay indices in the order they are to be measured.
+        """
+        self.row = row
+        self.columns = np.arange(len(self.delay_mm))
+        if row % 2 == 1:
+            self.columns = self.columns[::-1]
+        self._start_data(self.delay_mm[self.columns])
+        self.data["Pump delay (mm)"] = self.pump_delay_mm[row]
+        return self.columns
+
+    def frame(self) -> WaveformFrame:
+        """ Snapshot of the current row, with its place in the map """
+        frame = super().frame()
+        frame.map_row = self.row
+        frame.map_columns = self.columns
+        frame.map_delay_mm = self.delay_mm
+        frame.map_pump_delay_mm = self.pump_delay_mm
+        return frame
+
+    def update_data(self, measured_delay: float = None):
+        """
+        Update the row data as for a 1D scan, and copy the latest point
+        into the 2D map.
+        """
+        super().update_data(measured_delay)
+        column = self.columns[len(self.data["A"]) - 1]
+        for key in self.map_keys:
+            self.map[key][self.row, column] = self.data[key][-1]
+
+    def save_row(self):
+        """
+        Append the current row to the data file in ascending THz delay
+        order. Partial rows (e.g. after a stop) are saved as they are.
+        """
+        import pandas as pd
+        measured = len(self.data["A"])
+        if self.save_type != "txt" or measured == 0:
+            return
+        columns = np.sort(self.columns[:measured])
+        result = pd.DataFrame(
+            {"Pump delay (mm)": np.full(measured,
+                                        self.pump_delay_mm[self.row]),
+             "Delay (mm)": self.delay_mm[columns]} |
+            {key: self.map[key][self.row, columns]
+             for key in self.save_keys if key != "Delay (mm)"})
+        result.to_csv(f"{self.filename}.txt", sep="\t", index=False,
+                      mode="a", header=self.rows_saved == 0)
+        self.rows_saved += 1
+
+    def save_data(self):
+        """
+        Save the current row if it hasn't been saved yet, and reset the
+        experiment's attributes. Completed rows are already on file.
+        """
+        if self.rows_saved <= self.row:
+            self.save_row()
+        self.clear_buffers()
+        self.saturation = False
+
+class SpectrumDP:
+    """
+    Data Processing class for the amplitude spectra of E_off, E_on and
+    DT, calculated from WaveformFrames (e.g. by the GUI, away from the
+    acquisition).
+
+    A real FFT is used, so only the positive frequencies are calculated.
+    The signals are zero-padded to the length of the scan, so the
+    frequency axis and the FFTW plan are made once per scan, however
+    many steps have been measured.
+    """
+    keys = ["E_off", "E_on", "DT"]
+
+    def __init__(self, delay_mm: np.ndarray):
+        """
+        Args:
+            delay_mm (np.ndarray): Delays of the scan (mm), evenly spaced.
+        """
+        delay_ps = 2 * np.asarray(delay_mm) * 1e9 / defaults["C"]
+        self.length = len(delay_ps)
+        step_ps = (abs(delay_ps[-1] - delay_ps[0]) / (self.length - 1)
+                   if self.length > 1 else 1.0)
+        self.frequency = np.fft.rfftfreq(self.length, step_ps)
+        import pyfftw  # FFTW used in Matlab.
+        # Calculating spectra using FFTW, similar to Matlab
+        # https://pyfftw.readthedocs.io/en/latest/source/pyfftw/builders/builders.html
+        self.input = pyfftw.empty_aligned(self.length, dtype="float64")
+        self.rfft = pyfftw.builders.rfft(self.input)
+
+    def calculate(self, frame: WaveformFrame) -> SpectraFrame:
+        """ Calculate the spectra of the measured steps of a frame """
+        spectra = {}
+        for key in self.keys:
+            self.input[:] = 0.0
+            self.input[:frame.steps] = frame[key]
+            # The output array of the plan is reused, np.abs copies it
+            spectra[f"{key} Spectrum"] = np.abs(self.rfft())
+        return SpectraFrame(frame.run, frame.steps, self.frequency, spectra)
 
 class KnifeEdgeDP:
     """ Data Processing class for Knife Edge signals """
@@ -0,0 +1,215 @@
+import os
+import json as js
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from src.config import defaults
+from src.control.frames import WaveformFrame, new_run
+from src.control.dataProcessing import WaveformDP, SpectrumDP
+
+# Saved data files, loaded for the comparison tab.
+#
+# The data files are tab-separated text (see WaveformDP.save_data), which
+# is slow to parse. The first time a file is loaded, its columns are
+# parsed once and written to a .npy file in the dataset cache directory.
+# From then on the .npy file is memory-mapped: opening it is immediate,
+# and only the pages that are used are read from disk. The cache entry is
+# made again when the data file changes (size or modification time).
+#
+# Loaded datasets are kept in a DatasetCache, which holds the most
+# recently used ones only, so memory stays bounded however many files
+# are looked at.
+
+# Columns needed to show a data file
+REQUIRED_KEYS = ["Delay (mm)", "A", "B", "C", "D"]
+
+def list_datasets(directory: str) -> list:
+    """
+    Find the data files in a directory. Only the first line of each file
+    is read.
+    Args:
+        directory (str): Directory to look in.
+    Returns:
+        The paths of the data files, sorted by name.
+    """
+    paths = []
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if not name.endswith(".txt") or not os.path.isfile(path):
+            continue
+        try:
+            with open(path) as f:
+                columns = f.readline().rstrip("\n").split("\t")
+        except (OSError, UnicodeDecodeError):
+            continue
+        if all(key in columns for key in REQUIRED_KEYS):
+            paths.append(path)
+    return paths
+
+class Scan:
+    """
+    One scan of a data file, as a WaveformFrame, so it can be indexed
+    like live data (e.g. scan.frame["E_off"]). Data files of fluence
+    series and maps hold several scans, told apart by their label.
+    """
+    def __init__(self, label: str, frame: WaveformFrame):
+        self.label = label
+        self.frame = frame
+        self.spectra = None
+
+    def get_spectra(self):
+        """ The SpectraFrame of the scan, calculated on first use """
+        if self.spectra is None:
+            spectrum_dp = SpectrumDP(self.frame["Delay (mm)"])
+            self.spectra = spectrum_dp.calculate(self.frame)
+        return self.spectra
+
+class Dataset:
+    """
+    A saved data file, loaded through the dataset cache directory.
+
+    - path, name: The data file and its name without the extension.
+    - stamp: Size and modification time of the data file when loaded.
+    - scans: The scans of the file, in the order they were measured.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.name = os.path.splitext(os.path.basename(path))[0]
+        self.stamp = Dataset.file_stamp(path)
+        columns, scans = self._open()
+        self.scans = []
+        for label, start, stop in scans:
+            values = {key: columns[index][start:stop]
+                      for index, key in enumerate(self.keys)}
+            self.scans.append(Scan(label, self._frame(values)))
+
+    @staticmethod
+    def file_stamp(path: str) -> list:
+        """ Size and modification time of a file, to spot changes """
+        stat = os.stat(path)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def _cache_paths(self) -> tuple:
+        """ Paths of the .npy and .json files of the cache entry """
+        directory = defaults["compare"]["cache directory"]
+        digest = hashlib.sha1(os.path.abspath(self.path).
+                              encode("utf-8")).hexdigest()[:12]
+        stem = os.path.join(directory, f"{self.name} {digest}")
+        return f"{stem}.npy", f"{stem}.json"
+
+    def _open(self) -> tuple:
+        """
+        Memory-map the cache entry of the data file, making it first if
+        it is missing or out of date.
+        Returns:
+            The columns (one row per column of self.keys) and the scans,
+            as [label, first row, last row + 1].
+        """
+        array_path, info_path = self._cache_paths()
+        try:
+            with open(info_path) as f:
+                info = js.load(f)
+            if info["stamp"] == self.stamp:
+                self.keys = info["keys"]
+                return (np.load(array_path, mmap_mode="r"),
+                        info["scans"])
+        except (OSError, ValueError, KeyError):
+            pass
+        return self._parse(array_path, info_path)
+
+    def _parse(self, array_path: str, info_path: str) -> tuple:
+        """
+        Parse the data file and write its cache entry. The columns that
+        are not data (e.g. fw1, fw2 and Relative power of a fluence
+        series, or the pump delay of a map) label the scans.
+        Returns:
+            As _open.
+        """
+        import pandas as pd
+        table = pd.read_csv(self.path, sep="\t")
+        self.keys = [key for key in WaveformDP.save_keys
+                     if key in table.columns]
+        label_keys = [key for key in table.columns
+                      if key not in WaveformDP.save_keys]
+        scans = []
+        if len(label_keys) == 0:
+            scans.append(["", 0, len(table)])
+        else:
+            # A new scan starts wherever a label changes
+            labels = table[label_keys].astype(str)
+            changes = np.flatnonzero(
+                (labels != labels.shift()).any(axis=1).to_numpy())
+            bounds = list(changes) + [len(table)]
+            for start, stop in zip(bounds[:-1], bounds[1:]):
+                label = ", ".join(f"{key} {labels[key].iloc[start]}"
+                                  for key in label_keys)
+                scans.append([label, int(start), int(stop)])
+        # One row per column, so every column is contiguous on disk
+        columns = np.ascontiguousarray(
+            table[self.keys].to_numpy(dtype=float).T)
+        os.makedirs(os.path.dirname(array_path), exist_ok=True)
+        try:
+            np.save(array_path, columns)
+            # Written last, so an entry without it is never used
+            with open(info_path, "w") as f:
+                js.dump({"stamp": self.stamp, "keys": self.keys,
+                         "scans": scans}, f)
+        except OSError as ex:
+            # E.g. the old entry is still mapped. It is parsed again
+            # next time.
+            print(f"Could not cache {self.name}: {ex!r}")
+            return columns, scans
+        return np.load(array_path, mmap_mode="r"), scans
+
+    def _frame(self, values: dict) -> WaveformFrame:
+        """ WaveformFrame of a scan, from its columns """
+        A, B, C, D = (values[key] for key in ["A", "B", "C", "D"])
+        # As calculated in WaveformDP.add_step
+        step_arrays = {key: value for key, value in values.items()
+                       if key in WaveformDP.step_keys}
+        step_arrays |= {"E_off": D - A, "E_on": B - A, "DT": D - B}
+        return WaveformFrame(new_run(),
+                             len(A),
+                             values["Delay (mm)"],
+                             step_arrays,
+                             {},
+                             False)
+
+class DatasetCache:
+    """
+    The most recently used Datasets. Once there are more than
+    "cache size" (see "compare" in systemDefaults.json), the least
+    recently used one is dropped. A dataset whose file has changed since
+    it was loaded is loaded again. Safe to use from several threads.
+    """
+    def __init__(self, size: int = None):
+        if size is None:
+            size = defaults["compare"]["cache size"]
+        self.size = size
+        self.datasets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path: str) -> Dataset:
+        """
+        Get a dataset, loading it if it is not in the cache.
+        Args:
+            path (str): Path of the data file.
+        Returns:
+            The Dataset of the file.
+        """
+        with self._lock:
+            dataset = self.datasets.get(path)
+            if (dataset is not None and
+                    dataset.stamp == Dataset.file_stamp(path)):
+                self.datasets.move_to_end(path)
+                return dataset
+        # Loaded outside of the lock, so cached datasets can be got
+        # meanwhile
+        dataset = Dataset(path)
+        with self._lock:
+            self.datasets[path] = dataset
+            self.datasets.move_to_end(path)
+            while len(self.datasets) > self.size:
+                self.datasets.popitem(last=False)
+        return dataset
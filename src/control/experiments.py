@@ -1,4 +1,4 @@
-import json as js
+from src.config import defaults
 import numpy as np
 from PyQt6.QtWidgets import (
     QGridLayout, QLabel, QLineEdit, QGroupBox, QComboBox, QWidget
@@ -8,14 +8,38 @@ from src.GUI.plotWidgets import PlotManager
 from src.instruments.Picoscope4000 import PS4000
 from src.instruments.SC10 import SC10
 from src.instruments.FWxC import FWxC
-from src.control.dataProcessing import WaveformDP
-from src.GUI.usefulWidgets import RowContainer
+from src.control.dataProcessing import WaveformDP, MapDP
+from src.control.frames import SignalFrame
+from src.GUI.usefulWidgets import RowContainer, ResizingStackedWidget
 from time import *
 
 # TODO: Try to simplify the code
 
-with open(r"config/systemDefaults.json") as f:
-    defaults = js.load(f)
+def delay_segments(initial_pos: list,
+                   final_pos: list,
+                   steps: list,
+                   type: list = ["Linear"]) -> np.ndarray:
+    """
+    Build a delay array from a combination of linear and logarithmic
+    segments.
+    """
+    delay_array = np.array([])
+    for i in range(len(initial_pos)):
+        if steps[i] <= 0:
+            raise ValueError("Steps must be greater than 0.")
+        if type[i] == "Linear":
+            delay_array = np.append(delay_array,
+                                    np.linspace(initial_pos[i],
+                                                final_pos[i],
+                                                steps[i]))
+        elif type[i] == "Logarithmic":
+            delay_array = np.append(delay_array,
+                                    np.geomspace(initial_pos[i],
+                                                 final_pos[i],
+                                                 steps[i]))
+        else:
+            raise ValueError("Invalid delay array type.")
+    return delay_array
 
 class Experiment:
     """
@@ -29,8 +53,19 @@ class Experiment:
         - check_inputs: Check the inputs for the experiment.
         - set_experiment_parameters: Set the parameters for the experiment.
     - main_delay_array: Generate a delay array for the experiment.
+    - hardware_states: Hardware state needed at the start of the
+      experiment and left behind at the end.
     - run: Run the experiment.
+    - start_progress, step_done: Report the progress of run.
+    - set_pump: Set the filter wheels and pump shutter.
+    - acquire_step: Collect the repeats at the current delay.
+    - move_profile: Pick the DLS move profile for a move.
+    - move_DLS: Move a DLS, recording the move time.
+    - run_plan: Motion and acquisition done by run, for estimates.
     """
+    # Whether run() supports checkpointing and resuming
+    resumable = True
+
     def __init__(self, active_DLS:DLS,
                  inactive_DLS: DLS,
                  sample_attributes: dict):
@@ -50,6 +85,16 @@ class Experiment:
         self.repeats = 25
         self.stop_experiment = False
         self.next_experiment = False
+        # Pinned experiments keep their place when the queue is reordered
+        self.pinned = False
+        # Journal of completed steps, set by the main window before run
+        self.checkpoint = None
+        # Measured latencies for run-time estimates, set by the main
+        # window before run
+        self.latencies = None
+        # ProgressMeter for the progress bar, set by the main window
+        # before run
+        self.progress = None
 
     class input_widget:
         def __init__(self):
@@ -81,22 +126,35 @@ class Experiment:
         Generate a delay array for the experiment.
         Allows for a combination of linear and logarithmic delay arrays.
         """
-        for i in range(len(initial_pos)):
-            if steps[i] <= 0:
-                raise ValueError("Steps must be greater than 0.")
-            if type[i] == "Linear":
-                self.delay_array = np.append(self.delay_array,
-                                             np.linspace(initial_pos[i],
-                                                         final_pos[i],
-                                                         steps[i]))                          
-            elif type[i] == "Logarithmic":
-                self.delay_array = np.append(self.delay_array,
-                                             np.geomspace(initial_pos[i],
-                                                         final_pos[i],
-                                                         steps[i]))
-            else:
-                raise ValueError("Invalid delay array type.")
-    
+        self.delay_array = np.append(self.delay_array,
+                                     delay_segments(initial_pos,
+                                                    final_pos,
+                                                    steps,
+                                                    type))
+
+    def hardware_states(self) -> tuple[dict, dict]:
+        """
+        Hardware state required at the start of the experiment, and the
+        state the hardware is left in at the end. Keys are the DLS
+        instances, "fw1", "fw2" (filter values) and "shutter".
+        Used by the QueueOptimiser to order the program list. Override
+        this if the experiment moves the hardware differently to run.
+        """
+        start = {}
+        if self.inactive_DL_position is not None:
+            start[self.inactive_DLS] = self.inactive_DL_position
+        if len(self.fw_positions) != 0:
+            start["fw1"] = self.fw_positions[0]
+            start["fw2"] = self.fw_positions[1]
+            start["shutter"] = "open"
+        else:
+            start["shutter"] = "close"
+        end = dict(start)
+        if len(self.delay_array) != 0:
+            start[self.active_DLS] = float(self.delay_array[0])
+            end[self.active_DLS] = float(self.delay_array[-1])
+        return start, end
+
     def run(self,
             emit,
             ps: PS4000,
@@ -126,45 +184,174 @@ class Experiment:
                                             experiment_count,
                                             self.name,
                                             save_type)
-        # Move inactive DLS to the correct position
+        # Move inactive DLS to the correct position, while the filter
+        # wheels and pump shutter are set
+        pump_moves = self.set_pump(pump_shutter, fw1, fw2, wait=False)
         if self.inactive_DL_position is not None:
-            self.inactive_DLS.set_command("move absolute",
-                                            self.inactive_DL_position)
-        # Setting filtr wheel positions as needed and open up pump
-        # shutter if it is required.
-        if len(self.fw_positions) != 0:
-            fw1.set_command("position from filter", self.fw_positions[0])
-            fw2.set_command("position from filter", self.fw_positions[1])
-            pump_shutter.set_command("open")
-        else:
-            # Otherwise, ensure pump shutter is closed.
-            pump_shutter.set_command("close")
+            self.move_DLS(self.inactive_DLS, self.inactive_DL_position)
+        for move in pump_moves:
+            move.result()
+        # Restore the completed steps of an interrupted run, if any
+        start_step = 0
+        if self.checkpoint is not None:
+            records = self.checkpoint.resume()
+            self.waveformDP.restore_steps(records)
+            start_step = len(records)
+            if start_step != 0:
+                print(f"Resuming {self.name} at step {start_step + 1} of "
+                      f"{len(self.delay_array)}.")
+                emit(self.waveformDP.frame())
+        self.start_progress(emit, start_step)
         # Main loop for the entire experiment
-        for step in range(len(self.delay_array)):
+        for step in range(start_step, len(self.delay_array)):
             # Move delay array to the correct position
-            self.active_DLS.set_command("move absolute",
-                                        self.delay_array[step])
-            # Collect data from the Picoscope for the number of repeats
-            for repeat in range(self.repeats):
-                raw_signals = ps.get_data()
-                # This is a flag to stop the experiment from the GUI
-                if self.stop_experiment or self.next_experiment:
-                    self.next_experiment = False
-                    if save_dir is not None:
-                        # Save data if required
-                        self.waveformDP.save_data()
-                    return
-                # Emit a dictionary to the main thread to be ploted
-                emit({"time": ps_time, "signal": raw_signals})
-                self.waveformDP.check_segment_data(raw_signals)
-            self.waveformDP.update_data()
+            self.move_DLS(self.active_DLS, self.delay_array[step])
+            if self.acquire_step(emit, ps, ps_time):
+                if save_dir is not None:
+                    # Save data if required
+                    self.waveformDP.save_data()
+                return
+            self.waveformDP.update_data(
+                self.active_DLS.get_command("position"))
+            if self.checkpoint is not None:
+                self.checkpoint.record_step(step, self.waveformDP)
             self.waveformDP.clear_buffers()
 
             # Emit the data dictionary to main thread to be plotted
-            emit(self.waveformDP.data)
+            emit(self.waveformDP.frame())
+            self.step_done()
 
         if save_dir is not None:
             self.waveformDP.save_data()
+        # The run is complete, so there is nothing left to resume
+        if self.checkpoint is not None:
+            self.checkpoint.discard()
+
+    def run_plan(self) -> dict:
+        """
+        Motion and acquisition done by run after the hardware has been
+        brought to the starting state. Used for run-time estimates, so
+        override this if run is overridden.
+        Returns:
+            Dictionary with:
+            - "DLS moves": distances (mm) of the DLS moves in sequence,
+            - "steps": number of delay steps,
+            - "captures": number of Picoscope captures,
+            - "overlapped moves": list of (DLS distance, filter wheel
+              moves) that run at the same time. Filter wheel moves are
+              (wheel, from filter, to filter).
+        """
+        return {"DLS moves": np.abs(np.diff(self.delay_array)),
+                "steps": len(self.delay_array),
+                "captures": len(self.delay_array) * self.repeats,
+                "overlapped moves": []}
+
+    def move_profile(self, distance: float) -> str:
+        """
+        Pick the DLS move profile for a move of the given distance (mm).
+        Short scan steps (e.g. OPTP fine grids) use the stiff "fine"
+        profile that settles quickly. Returns to the start of a scan and
+        large (e.g. logarithmic pump decay) steps use the fast "slew"
+        profile. Override this for experiment specific profiles.
+        """
+        if distance <= defaults["DLS"]["fine step limit (mm)"]:
+            return "fine"
+        return "slew"
+
+    def move_DLS(self, dls: DLS, position: float):
+        """
+        Move a DLS to an absolute position (mm) and wait for it, using
+        the move profile picked for the distance. The
+        move is cancelled if the experiment is stopped or skipped from
+        the GUI. The move and settle times are recorded for future
+        run-time estimates. The position actually reached is read back
+        with get_command("position") after each step.
+        """
+        if dls.target is None:
+            dls.set_profile("slew")
+        else:
+            dls.set_profile(self.move_profile(abs(position - dls.target)))
+        move = dls.move_absolute_async(
+            position,
+            should_stop=lambda: self.stop_experiment or self.next_experiment)
+        def record_latencies(move):
+            # Only complete moves have a settle time
+            if self.latencies is not None and move.settle_time is not None:
+                self.latencies.record_move(dls, position,
+                                           move.move_time,
+                                           move.settle_time)
+
+        # The stage may still be settling in position when result returns
+        move.add_done_callback(record_latencies)
+        move.result()
+
+    def set_pump(self,
+                 pump_shutter: SC10,
+                 fw1: FWxC,
+                 fw2: FWxC,
+                 wait: bool = True) -> list:
+        """
+        Set the filter wheel positions and open up the pump shutter if
+        the experiment uses the pump. Otherwise, ensure the pump shutter
+        is closed. The wheels and shutter all move at the same time, and
+        those already in place are not moved.
+        Args:
+            wait (bool): Wait for the moves to finish. Otherwise, they
+                carry on in the background (e.g. while the DLSs are
+                positioned) and the caller waits on the returned futures.
+        Returns:
+            The futures of the filter wheel and shutter moves.
+        """
+        if len(self.fw_positions) != 0:
+            moves = [fw1.move_filter_async(self.fw_positions[0]),
+                     fw2.move_filter_async(self.fw_positions[1]),
+                     pump_shutter.set_command_async("open")]
+        else:
+            moves = [pump_shutter.set_command_async("close")]
+        if wait:
+            for move in moves:
+                move.result()
+        return moves
+
+    def acquire_step(self, emit, ps: PS4000, ps_time: np.ndarray) -> bool:
+        """
+        Collect data from the Picoscope for the number of repeats at the
+        current delay, and aggregate it in the waveformDP buffers.
+        Returns:
+            True if the experiment was stopped (or skipped) from the GUI,
+            False otherwise.
+        """
+        for repeat in range(self.repeats):
+            start = perf_counter()
+            raw_signals = ps.get_data()
+            if self.latencies is not None:
+                self.latencies.record("capture", perf_counter() - start)
+            # This is a flag to stop the experiment from the GUI
+            if self.stop_experiment or self.next_experiment:
+                self.next_experiment = False
+                return True
+            # Emit the capture to the main thread to be plotted
+            emit(SignalFrame(ps_time, raw_signals))
+            self.waveformDP.check_segment_data(raw_signals)
+            if self.progress is not None:
+                self.progress.capture(repeat + 1, self.repeats)
+        return False
+
+    def start_progress(self, emit, step: int = 0):
+        """
+        Start reporting the progress of run, if there is a progress
+        meter. The total steps are those of run_plan.
+        Args:
+            emit: Emit callback of the worker.
+            step (int): Steps already done (e.g. when resuming).
+        """
+        if self.progress is not None:
+            self.progress.start(emit, self.run_plan()["steps"], step)
+
+    def step_done(self):
+        """ Report a completed step of run """
+        if self.progress is not None:
+            self.progress.step_done()
 
 class filterWheelWidget(QGroupBox):
     """ Class to create a widget to get filter wheels inputs. """
@@ -485,4 +672,412 @@ class pumpDecay(Experiment):
             PD_instance.fw_positions = [self.settings["fw1"],
                                          self.settings["fw2"]]
 
-            return PD_instance
\ No newline at end of file
+            return PD_instance
+
+class pumpProbeMap(Experiment):
+    """
+    Class for the 2D pump-probe map experiment.
+    The pump DLS (inactive DLS) is the outer axis and the THz DLS
+    (active DLS) is the inner axis. The THz delay is swept in a snake
+    (boustrophedon) order so the THz DLS never flies back to the start.
+    """
+    resumable = False
+
+    def __init__(self,
+                 active_DLS: DLS,
+                 inactive_DLS: DLS,
+                 sample_attributes: dict = {}):
+        super().__init__(active_DLS, inactive_DLS, sample_attributes)
+        self.name = "Pump-probe map"
+        self.pump_delay_array = np.array([])
+
+    def hardware_states(self) -> tuple[dict, dict]:
+        """
+        The map starts at the first pump and THz delays. The THz DLS
+        ends at either end of its delay array depending on the number
+        of rows.
+        """
+        start, end = super().hardware_states()
+        if len(self.pump_delay_array) != 0:
+            start[self.inactive_DLS] = float(self.pump_delay_array[0])
+            end[self.inactive_DLS] = float(self.pump_delay_array[-1])
+            if len(self.pump_delay_array) % 2 == 0:
+                end[self.active_DLS] = start[self.active_DLS]
+        return start, end
+
+    def run_plan(self) -> dict:
+        """ Every row sweeps the THz delays, one way or the other. """
+        steps = len(self.pump_delay_array) * len(self.delay_array)
+        row_moves = np.abs(np.diff(self.delay_array))
+        return {"DLS moves": np.concatenate(
+                    [np.tile(row_moves, len(self.pump_delay_array)),
+                     np.abs(np.diff(self.pump_delay_array))]),
+                "steps": steps,
+                "captures": steps * self.repeats,
+                "overlapped moves": []}
+
+    def run(self,
+            emit,
+            ps: PS4000,
+            pump_shutter: SC10,
+            fw1: FWxC,
+            fw2: FWxC,
+            experiment_count: int =  None,
+            save_dir: str = None,
+            sample: str = None,
+            save_type: str = ""):
+        """
+        Run the 2D map. Each row is streamed into the same data file
+        as soon as it is complete.
+        """
+        ps_time = np.linspace(0, (ps.max_samples - 1) * 0.0001,
+                              ps.max_samples)
+        self.waveformDP = MapDP(self.name,
+                                self.delay_array,
+                                self.pump_delay_array)
+        if save_dir is not None:
+            self.waveformDP.generate_datafile(save_dir,
+                                              sample,
+                                              experiment_count,
+                                              self.name,
+                                              save_type)
+        self.set_pump(pump_shutter, fw1, fw2)
+        self.start_progress(emit)
+        for row, pump_delay in enumerate(self.pump_delay_array):
+            self.move_DLS(self.inactive_DLS, pump_delay)
+            for column in self.waveformDP.start_row(row):
+                self.move_DLS(self.active_DLS, self.delay_array[column])
+                if self.acquire_step(emit, ps, ps_time):
+                    if save_dir is not None:
+                        self.waveformDP.save_data()
+                    return
+                self.waveformDP.update_data(
+                    self.active_DLS.get_command("position"))
+                self.waveformDP.clear_buffers()
+                emit(self.waveformDP.frame())
+                self.step_done()
+            if save_dir is not None:
+                self.waveformDP.save_row()
+
+        if save_dir is not None:
+            self.waveformDP.save_data()
+
+    class input_widget:
+        def __init__(self):
+            """
+            Create the input widget for the pump-probe map experiment.
+            """
+            self.GUI = self.GUI()
+
+        def GUI(self):
+            """ Create the input menu for the pump-probe map experiment """
+            map_widget = QGroupBox("Pump-probe map settings")
+            map_widget_layout = QGridLayout()
+            DLS325_box = QGroupBox("DLS325 settings (outer axis)")
+            DLS325_boxlayout = QGridLayout()
+            DLS125_box = QGroupBox("DLS125 settings (inner axis)")
+            DLS125_boxlayout = QGridLayout()
+            self.fws_widget = filterWheelWidget()
+            DLS325_box.setLayout(DLS325_boxlayout)
+            DLS125_box.setLayout(DLS125_boxlayout)
+            map_widget_layout.addWidget(DLS325_box, 0, 0, 1, 4)
+            map_widget_layout.addWidget(self.fws_widget, 1, 0, 1, 4)
+            map_widget_layout.addWidget(DLS125_box, 2, 0, 1, 4)
+            map_widget.setLayout(map_widget_layout)
+
+            self.map_DLS325_initial = QLineEdit()
+            self.map_DLS325_final = QLineEdit()
+            self.map_DLS325_steps = QLineEdit()
+            self.map_DLS325_steps.setText(str(defaults["experiments"]
+                                          ["Pump-probe map"]
+                                          ["step frequency"]["pump"]))
+            self.map_sampling_mode = QComboBox()
+            self.map_sampling_mode.addItems(["Linear", "Logarithmic"])
+            self.map_DLS125_initial = QLineEdit()
+            self.map_DLS125_final = QLineEdit()
+            self.map_DLS125_steps = QLineEdit()
+            self.map_DLS125_steps.setText(str(defaults["experiments"]
+                                          ["Pump-probe map"]
+                                          ["step frequency"]["THz"]))
+            self.map_repeats = QLineEdit()
+            self.map_repeats.setText(str(defaults["experiments"]
+                                     ["Pump-probe map"]["repeats"]))
+
+            DLS325_boxlayout.addWidget(QLabel("Initial position (mm)"), 0, 0)
+            DLS325_boxlayout.addWidget(self.map_DLS325_initial, 1, 0)
+            DLS325_boxlayout.addWidget(QLabel("Final position (mm)"), 0, 1)
+            DLS325_boxlayout.addWidget(self.map_DLS325_final, 1, 1)
+            DLS325_boxlayout.addWidget(QLabel("Step count"), 0, 2)
+            DLS325_boxlayout.addWidget(self.map_DLS325_steps, 1, 2)
+            DLS325_boxlayout.addWidget(QLabel("Sampling mode"), 0, 3)
+            DLS325_boxlayout.addWidget(self.map_sampling_mode, 1, 3)
+
+            DLS125_boxlayout.addWidget(QLabel("Initial position (mm)"), 0, 0)
+            DLS125_boxlayout.addWidget(self.map_DLS125_initial, 1, 0)
+            DLS125_boxlayout.addWidget(QLabel("Final position (mm)"), 0, 1)
+            DLS125_boxlayout.addWidget(self.map_DLS125_final, 1, 1)
+            DLS125_boxlayout.addWidget(QLabel("Step count"), 0, 2)
+            DLS125_boxlayout.addWidget(self.map_DLS125_steps, 1, 2)
+            DLS125_boxlayout.addWidget(QLabel("Repeats"), 0, 3)
+            DLS125_boxlayout.addWidget(self.map_repeats, 1, 3)
+
+            return map_widget
+
+        def set_experiment_parameters(self,
+                                      active_DLS: DLS,
+                                      inactive_DLS: DLS):
+            """
+            Set the parameters for the pump-probe map experiment.
+            This gives us the setting dictionary to display the info
+            in the GUI, and also create an instance of the experiment class
+            to be appended to a program list that we can run.
+            """
+            self.settings = {}
+
+            self.settings["DLS325_initial"] = float(
+                self.map_DLS325_initial.text())
+            self.settings["DLS325_final"] = float(
+                self.map_DLS325_final.text())
+            self.settings["DLS325_steps"] = int(self.map_DLS325_steps.text())
+            self.settings["sampling_mode"] = (self.map_sampling_mode.
+                                              currentText())
+            self.settings["DLS125_initial"] = float(
+                self.map_DLS125_initial.text())
+            self.settings["DLS125_final"] = float(
+                self.map_DLS125_final.text())
+            self.settings["DLS125_steps"] = int(self.map_DLS125_steps.text())
+            self.settings["repeats"] = int(self.map_repeats.text())
+            self.settings["fw1"] = self.fws_widget.get_data()[0]
+            self.settings["fw2"] = self.fws_widget.get_data()[1]
+
+            map_instance = pumpProbeMap(active_DLS, inactive_DLS)
+            map_instance.repeats = self.settings["repeats"]
+            map_instance.main_delay_array(
+                [self.settings["DLS125_initial"]],
+                [self.settings["DLS125_final"]],
+                [self.settings["DLS125_steps"]])
+            map_instance.pump_delay_array = delay_segments(
+                [self.settings["DLS325_initial"]],
+                [self.settings["DLS325_final"]],
+                [self.settings["DLS325_steps"]],
+                [self.settings["sampling_mode"]])
+            map_instance.fw_positions = [self.settings["fw1"],
+                                         self.settings["fw2"]]
+
+            return map_instance
+
+class fluenceSeries(Experiment):
+    """
+    Class for the fluence series experiment.
+    Runs the same OPTP or pump decay scan for a list of filter wheel
+    combinations, in order of increasing pump power, within one
+    instrument session and one data file. The filter wheels move to the
+    next combination while the active DLS returns to the scan start.
+    """
+    resumable = False
+
+    def __init__(self,
+                 active_DLS: DLS,
+                 inactive_DLS: DLS,
+                 sample_attributes: dict = {}):
+        super().__init__(active_DLS, inactive_DLS, sample_attributes)
+        self.name = "Fluence series"
+        self.scan_type = "OPTP"
+        self.fw_series = []
+
+    @staticmethod
+    def combination_power(fw_values: list) -> float:
+        """
+        Relative pump power for a [fw1, fw2] filter combination. The
+        "power" values in systemDefaults.json are treated as
+        transmissions, so the two wheels multiply.
+        """
+        power = 1.0
+        for wheel, value in zip(["fw1", "fw2"], fw_values):
+            for filter in defaults["FWxC"][wheel]["filters"].values():
+                if filter["value"] == value:
+                    power *= filter["power"]
+        return power
+
+    def set_fw_series(self, combinations: list):
+        """
+        Set the filter wheel combinations, sorted by increasing power.
+        The first combination is used to set up the pump.
+        """
+        self.fw_series = sorted(combinations, key=self.combination_power)
+        self.fw_positions = list(self.fw_series[0])
+
+    def hardware_states(self) -> tuple[dict, dict]:
+        """ The filter wheels are left at the last combination. """
+        start, end = super().hardware_states()
+        if len(self.fw_series) != 0:
+            end["fw1"], end["fw2"] = self.fw_series[-1]
+        return start, end
+
+    def run_plan(self) -> dict:
+        """
+        The scan is repeated for every combination. The filter wheels
+        move while the active DLS returns to the start of the scan.
+        """
+        plan = super().run_plan()
+        count = len(self.fw_series)
+        plan["DLS moves"] = np.tile(plan["DLS moves"], count)
+        plan["steps"] *= count
+        plan["captures"] *= count
+        if len(self.delay_array) != 0:
+            span = abs(self.delay_array[-1] - self.delay_array[0])
+            plan["overlapped moves"] = [
+                (span, [("fw1", previous[0], current[0]),
+                        ("fw2", previous[1], current[1])])
+                for previous, current in zip(self.fw_series[:-1],
+                                             self.fw_series[1:])]
+        return plan
+
+    def run(self,
+            emit,
+            ps: PS4000,
+            pump_shutter: SC10,
+            fw1: FWxC,
+            fw2: FWxC,
+            experiment_count: int =  None,
+            save_dir: str = None,
+            sample: str = None,
+            save_type: str = ""):
+        """
+        Run the scan for every filter combination. All scans are
+        appended to the same data file, labelled by their filters and
+        relative power.
+        """
+        ps_time = np.linspace(0, (ps.max_samples - 1) * 0.0001,
+                              ps.max_samples)
+        self.fw_positions = list(self.fw_series[0])
+        pump_moves = self.set_pump(pump_shutter, fw1, fw2, wait=False)
+        if self.inactive_DL_position is not None:
+            self.move_DLS(self.inactive_DLS, self.inactive_DL_position)
+        for move in pump_moves:
+            move.result()
+        self.start_progress(emit)
+
+        for index, fw_values in enumerate(self.fw_series):
+            self.waveformDP = WaveformDP(self.name, self.delay_array)
+            if save_dir is not None:
+                if index == 0:
+                    self.waveformDP.generate_datafile(save_dir,
+                                                      sample,
+                                                      experiment_count,
+                                                      self.name,
+                                                      save_type)
+                    filename = self.waveformDP.filename
+                self.waveformDP.filename = filename
+                self.waveformDP.save_type = save_type
+            labels = {"fw1": fw_values[0], "fw2": fw_values[1],
+                      "Relative power": self.combination_power(
+                          fw_values)}
+
+            for step in range(len(self.delay_array)):
+                self.move_DLS(self.active_DLS, self.delay_array[step])
+                if self.acquire_step(emit, ps, ps_time):
+                    if save_dir is not None:
+                        self.waveformDP.append_data(labels, index == 0)
+                    return
+                self.waveformDP.update_data(
+                    self.active_DLS.get_command("position"))
+                self.waveformDP.clear_buffers()
+                emit(self.waveformDP.frame())
+                self.step_done()
+
+            if save_dir is not None:
+                self.waveformDP.append_data(labels, index == 0)
+
+            if index + 1 < len(self.fw_series):
+                # Overlap the filter wheel moves with the DLS return
+                next_values = self.fw_series[index + 1]
+                fw_moves = [fw1.move_filter_async(next_values[0]),
+                            fw2.move_filter_async(next_values[1])]
+                self.move_DLS(self.active_DLS, self.delay_array[0])
+                for fw_move in fw_moves:
+                    fw_move.result()
+
+    class input_widget:
+        def __init__(self):
+            """
+            Create the input widget for the fluence series experiment.
+            """
+            self.GUI = self.GUI()
+
+        def GUI(self):
+            """ Create the input menu for the fluence series experiment """
+            series_widget = QGroupBox("Fluence series settings")
+            series_widget_layout = QGridLayout()
+            series_widget.setLayout(series_widget_layout)
+
+            self.scan_type = QComboBox()
+            self.scan_type.addItems(["OPTP", "Pump decay"])
+            self.scan_type.currentIndexChanged.connect(self.select_scan_type)
+
+            # Reuse the OPTP and pump decay menus for the scan settings.
+            # Their filter wheel settings are replaced by the series.
+            self.OPTP_widget = OPTP.input_widget()
+            self.PD_widget = pumpDecay.input_widget()
+            self.OPTP_widget.fws_widget.setVisible(False)
+            self.PD_widget.fws_widget.setVisible(False)
+            self.scan_stack = ResizingStackedWidget()
+            self.scan_stack.addWidget(self.OPTP_widget.GUI)
+            self.scan_stack.addWidget(self.PD_widget.GUI)
+
+            self.fw_rows = RowContainer("Filter combinations",
+                                        lambda: filterWheelWidget(
+                                            "Filter combination"))
+
+            series_widget_layout.addWidget(QLabel("Scan type"), 0, 0)
+            series_widget_layout.addWidget(self.scan_type, 0, 1)
+            series_widget_layout.addWidget(self.scan_stack, 1, 0, 1, 4)
+            series_widget_layout.addWidget(self.fw_rows, 2, 0, 1, 4)
+
+            return series_widget
+
+        def select_scan_type(self):
+            """ Show the settings for the selected scan type """
+            self.scan_stack.setCurrentIndex(self.scan_type.currentIndex())
+
+        def set_experiment_parameters(self,
+                                      thz_DLS: DLS,
+                                      pump_DLS: DLS):
+            """
+            Set the parameters for the fluence series experiment.
+            The active DLS depends on the scan type, so both DLS are
+            parsed as THz DLS first, then pump DLS.
+            Returns None, so nothing is queued, if there are no filter
+            combinations.
+            """
+            if len(self.fw_rows.rows) == 0:
+                print("No filter combinations for the fluence series.")
+                return None
+            scan_type = self.scan_type.currentText()
+            match scan_type:
+                case "OPTP":
+                    scan = self.OPTP_widget.set_experiment_parameters(
+                        thz_DLS, pump_DLS)
+                    self.settings = dict(self.OPTP_widget.settings)
+                case "Pump decay":
+                    scan = self.PD_widget.set_experiment_parameters(
+                        pump_DLS, thz_DLS)
+                    self.settings = dict(self.PD_widget.settings)
+            del self.settings["fw1"], self.settings["fw2"]
+
+            series_instance = fluenceSeries(scan.active_DLS,
+                                            scan.inactive_DLS)
+            series_instance.scan_type = scan_type
+            series_instance.repeats = scan.repeats
+            series_instance.delay_array = scan.delay_array
+            series_instance.inactive_DL_position = scan.inactive_DL_position
+            series_instance.set_fw_series(
+                [row.content_widget.get_data()
+                 for row in self.fw_rows.rows])
+
+            self.settings["scan_type"] = scan_type
+            self.settings["repeats"] = scan.repeats
+            self.settings["steps"] = len(scan.delay_array)
+            self.settings["fw_series"] = series_instance.fw_series
+
+            return series_instance
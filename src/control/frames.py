@@ -0,0 +1,202 @@
+import itertools
+import numpy as np
+
+# Data sent from the experiment thread to the GUI thread. A frame is a
+# snapshot taken when it is emitted: it only holds read-only views of
+# arrays that the experiment thread no longer writes to, so handing it
+# over costs the same however long the scan is, and the GUI never sees
+# a half-updated step.
+
+# Frames are numbered in the order they are made, across all runs
+_sequence = itertools.count(1)
+# Every new data set (scan, map row, ...) gets a new run number
+_runs = itertools.count(1)
+
+def new_run() -> int:
+    """ Number for a new data set, see WaveformFrame.run """
+    return next(_runs)
+
+def _read_only(array: np.ndarray) -> np.ndarray:
+    """ Read-only view of an array """
+    view = array.view()
+    view.flags.writeable = False
+    return view
+
+class WaveformFrame:
+    """
+    Snapshot of the waveform data of a scan after a step.
+
+    - seq: Number of the frame, increasing.
+    - run: Number of the data set. It changes when the data is started
+      again (new scan, map row, ...), so the GUI knows to drop the
+      points it has drawn.
+    - steps: Number of steps measured.
+    - step_values: Per-step values (see WaveformDP.step_keys), as views
+      of the measured steps.
+    - histograms: Key -> (bin edges, counts) of the spread of the ABCD
+      repeats and of the noise figures, for the whole experiment (see
+      StreamingHistogram), or None before the first step. Steps
+      restored from a checkpoint are not counted.
+    - map_row, map_columns, map_delay_mm, map_pump_delay_mm: For a row
+      of a 2D map (see MapDP), the index of the row, the map columns of
+      the steps in measurement order and the axes of the whole map.
+      None for a 1D scan.
+    The frame can be indexed with the keys of WaveformDP.data, e.g.
+    frame["E_off"], frame["Delay (mm)"] or frame["E_off max"].
+    """
+    __slots__ = ("seq", "run", "steps", "delay_mm", "step_values",
+                 "extrema", "saturation", "histograms",
+                 "map_row", "map_columns", "map_delay_mm",
+                 "map_pump_delay_mm")
+
+    def __init__(self,
+                 run: int,
+                 steps: int,
+                 delay_mm: np.ndarray,
+                 step_arrays: dict,
+                 extrema: dict,
+                 saturation: bool,
+                 histograms: dict = None):
+        """
+        Args:
+            run (int): Number of the data set, from new_run.
+            steps (int): Number of steps measured.
+            delay_mm (np.ndarray): Delays of all steps (mm).
+            step_arrays (dict): Key -> preallocated array of the
+                per-step values, filled up to steps.
+            extrema (dict): Key -> [value, delay (mm)].
+            saturation (bool): Whether the PicoScope has saturated.
+            histograms (dict): Key -> (bin edges, counts) or None. The
+                counts must be copies.
+        """
+        self.seq = next(_sequence)
+        self.run = run
+        self.steps = steps
+        self.delay_mm = _read_only(delay_mm)
+        self.step_values = {key: _read_only(array[:steps])
+                            for key, array in step_arrays.items()}
+        self.extrema = extrema
+        self.saturation = saturation
+        self.histograms = {} if histograms is None else histograms
+        self.map_row = None
+        self.map_columns = None
+        self.map_delay_mm = None
+        self.map_pump_delay_mm = None
+
+    def __getitem__(self, key: str):
+        match key:
+            case "Delay (mm)":
+                return self.delay_mm
+            case "Saturation":
+                return self.saturation
+        for values in [self.step_values, self.extrema]:
+            if key in values:
+                return values[key]
+        raise KeyError(key)
+
+class SpectraFrame:
+    """
+    Amplitude spectra of a WaveformFrame (see SpectrumDP), indexed with
+    "Frequency (THz)" and "E_off Spectrum", "E_on Spectrum" or
+    "DT Spectrum".
+    """
+    __slots__ = ("seq", "run", "steps", "frequency", "spectra")
+
+    def __init__(self,
+                 run: int,
+                 steps: int,
+                 frequency: np.ndarray,
+                 spectra: dict):
+        """
+        Args:
+            run (int): Run number of the WaveformFrame.
+            steps (int): Number of steps of the WaveformFrame.
+            frequency (np.ndarray): Frequency axis (THz).
+            spectra (dict): Key -> amplitude spectrum.
+        """
+        self.seq = next(_sequence)
+        self.run = run
+        self.steps = steps
+        self.frequency = _read_only(frequency)
+        self.spectra = spectra
+
+    def __getitem__(self, key: str):
+        if key == "Frequency (THz)":
+            return self.frequency
+        return self.spectra[key]
+
+class SignalFrame:
+    """ A raw PicoScope capture, for the Picoscope signal plot """
+    __slots__ = ("seq", "time", "signal")
+
+    def __init__(self, time: np.ndarray, signal: np.ndarray):
+        """
+        Args:
+            time (np.ndarray): Time axis of the capture (ms).
+            signal (np.ndarray): Captured samples. The PicoScope returns
+                a new array for every capture, so it is not copied.
+        """
+        self.seq = next(_sequence)
+        self.time = time
+        self.signal = signal
+
+    def __getitem__(self, key: str):
+        match key:
+            case "time":
+                return self.time
+            case "signal":
+                return self.signal
+        raise KeyError(key)
+
+class ProgressFrame:
+    """
+    Progress of the running experiment, for the progress bar (see
+    ProgressMeter). Sent on the worker's progress signal, not with the
+    data frames.
+
+    - experiment, experiments: Position of the experiment in the queue
+      (from 1) and the length of the queue.
+    - name: Name of the experiment.
+    - step, steps: Steps completed and the total steps of the
+      experiment (e.g. all rows of a map).
+    - capture, captures: Captures done of the current step.
+    - step_time: Moving average of the step durations (s), or None
+      before the first step is complete.
+    """
+    __slots__ = ("seq", "experiment", "experiments", "name", "step",
+                 "steps", "capture", "captures", "step_time")
+
+    def __init__(self,
+                 experiment: int,
+                 experiments: int,
+                 name: str,
+                 step: int,
+                 steps: int,
+                 capture: int,
+                 captures: int,
+                 step_time: float = None):
+        self.seq = next(_sequence)
+        self.experiment = experiment
+        self.experiments = experiments
+        self.name = name
+        self.step = step
+        self.steps = steps
+        self.capture = capture
+        self.captures = captures
+        self.step_time = step_time
+
+    def done(self) -> float:
+        """ Steps done, counting the captures of the current step """
+        if self.captures == 0:
+            return float(self.step)
+        return self.step + self.capture / self.captures
+
+    def time_left(self) -> float:
+        """
+        Estimated time (s) until the experiment is complete, from the
+        moving average of the step durations. None if no step is
+        complete yet.
+        """
+        if self.step_time is None:
+            return None
+        return max(self.steps - self.done(), 0) * self.step_time
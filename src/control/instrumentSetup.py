@@ -0,0 +1,95 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, Future
+
+# Concurrent bring-up of the instruments. Opening a device is mostly
+# waiting on a serial or DLL handshake, so the devices are handled on a
+# thread pool and the total time is that of the slowest device rather
+# than the sum of all of them.
+
+# Single background thread for work that must not block the GUI, e.g.
+# device discovery at startup
+_background = ThreadPoolExecutor(max_workers=1)
+
+class DeviceResult:
+    """ Outcome of a task (setup, discovery, ...) on one device """
+    def __init__(self,
+                 name: str,
+                 success: bool,
+                 duration: float,
+                 value=None,
+                 error: Exception = None):
+        self.name = name
+        self.success = success
+        self.duration = duration
+        self.value = value
+        self.error = error
+
+def _timed(name: str, task) -> DeviceResult:
+    """ Run a task, timing it and catching any error. """
+    start = time.perf_counter()
+    try:
+        value = task()
+    except Exception as ex:
+        return DeviceResult(name, False, time.perf_counter() - start,
+                            error=ex)
+    # Tasks return False to report a failure without raising
+    return DeviceResult(name, value is not False,
+                        time.perf_counter() - start, value)
+
+def run_concurrently(tasks: dict, max_workers: int = None) -> dict:
+    """
+    Run one task per device at the same time and wait for all of them.
+    Args:
+        tasks (dict): Device name -> callable with no arguments. The
+            task fails if it raises or returns False.
+        max_workers (int): Threads to use, one per task by default.
+    Returns:
+        dict: Device name -> DeviceResult, in the order of tasks.
+    """
+    if len(tasks) == 0:
+        return {}
+    if max_workers is None:
+        max_workers = len(tasks)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {name: pool.submit(_timed, name, task)
+                   for name, task in tasks.items()}
+    return {name: future.result() for name, future in futures.items()}
+
+def run_in_background(tasks: dict, action: str) -> Future:
+    """
+    Start run_concurrently without waiting for it. The results are
+    reported once all tasks are done.
+    Args:
+        tasks (dict): As for run_concurrently.
+        action (str): Name of the action for the report, e.g. "Discovery".
+    Returns:
+        Future: Resolves to the dict of DeviceResults.
+    """
+    future = _background.submit(run_concurrently, tasks)
+    future.add_done_callback(lambda done: report(done.result(), action))
+    return future
+
+def report(results: dict, action: str) -> bool:
+    """
+    Print the time taken by each device, and why any of them failed.
+    Args:
+        results (dict): Device name -> DeviceResult.
+        action (str): Name of the action, e.g. "Setup".
+    Returns:
+        True if all devices succeeded, False otherwise.
+    """
+    for result in results.values():
+        if result.success:
+            line = f"{action} {result.name}: done in {result.duration:.2f} s"
+            if isinstance(result.value, list):
+                line += f", found {result.value}"
+            print(line)
+        else:
+            reason = "" if result.error is None else f": {result.error!r}"
+            print(f"{action} {result.name}: FAILED after "
+                  f"{result.duration:.2f} s{reason}")
+    if len(results) != 0:
+        slowest = max(results.values(), key=lambda result: result.duration)
+        print(f"{action} finished in {slowest.duration:.2f} s "
+              f"(slowest: {slowest.name}).")
+    return all(result.success for result in results.values())
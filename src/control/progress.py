@@ -0,0 +1,81 @@
+import collections
+from time import perf_counter
+from src.config import defaults
+from src.control.frames import ProgressFrame
+
+# Progress of the running experiment, for the progress bar and time left
+# shown while a queue runs. The experiment reports every capture and
+# every completed step, but a ProgressFrame is only sent once per
+# "update interval (s)" (see "progress" in systemDefaults.json), so the
+# acquisition loop only pays for a perf_counter call per capture.
+
+class ProgressMeter:
+    """
+    Tracks the steps of an experiment and the moving average of their
+    durations, and sends ProgressFrames with the emit callback of the
+    worker. Set on the experiment by the main window before run.
+    """
+    def __init__(self, experiment: int, experiments: int, name: str):
+        """
+        Args:
+            experiment (int): Position of the experiment in the queue,
+                from 1.
+            experiments (int): Number of experiments in the queue.
+            name (str): Name of the experiment.
+        """
+        self.experiment = experiment
+        self.experiments = experiments
+        self.name = name
+        self.interval = defaults["progress"]["update interval (s)"]
+        self.durations = collections.deque(
+            maxlen=defaults["progress"]["moving average steps"])
+        self.emit = None
+        self.step = 0
+        self.steps = 0
+        self.step_start = None
+        self.last_sent = None
+
+    def start(self, emit, steps: int, step: int = 0):
+        """
+        Start timing the steps, and send the progress straight away.
+        Args:
+            emit: Emit callback of the worker.
+            steps (int): Total steps of the experiment.
+            step (int): Steps already done (e.g. when resuming).
+        """
+        self.emit = emit
+        self.steps = steps
+        self.step = step
+        self.durations.clear()
+        self.step_start = perf_counter()
+        self._send(self.step_start, 0, 0)
+
+    def capture(self, capture: int, captures: int):
+        """
+        Report a capture of the current step.
+        Args:
+            capture (int): Captures done of the step.
+            captures (int): Captures per step.
+        """
+        now = perf_counter()
+        if now - self.last_sent >= self.interval:
+            self._send(now, capture, captures)
+
+    def step_done(self):
+        """ Report a completed step. The last step is always sent. """
+        now = perf_counter()
+        self.durations.append(now - self.step_start)
+        self.step_start = now
+        self.step += 1
+        if self.step >= self.steps or now - self.last_sent >= self.interval:
+            self._send(now, 0, 0)
+
+    def _send(self, now: float, capture: int, captures: int):
+        """ Send a ProgressFrame of the current progress """
+        self.last_sent = now
+        step_time = None
+        if len(self.durations) != 0:
+            step_time = sum(self.durations) / len(self.durations)
+        self.emit(ProgressFrame(self.experiment, self.experiments,
+                                self.name, self.step, self.steps,
+                                capture, captures, step_time))
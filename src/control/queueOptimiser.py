@@ -0,0 +1,152 @@
+from src.config import defaults
+from itertools import permutations
+
+# Reordering of the program list to cut down on hardware motion between
+# experiments. Experiments describe the hardware state they need via
+# Experiment.hardware_states(), this module only prices the transitions.
+
+# Segments up to this length are searched exhaustively (7! orders).
+# Longer segments are ordered greedily and then improved with swaps.
+EXACT_SEARCH_LIMIT = 7
+
+class QueueOptimiser:
+    """
+    Reorder a program list to minimise the hardware motion between
+    experiments.
+
+    Each experiment may move the inactive DLS, set both filter wheels,
+    toggle the pump shutter and move the active DLS to the start of its
+    delay array before collecting any data. The cost of every transition
+    is estimated in seconds from the "hardware timings" in
+    systemDefaults.json.
+
+    Experiments with pinned set to True keep their place in the queue.
+    They split the queue into segments, and experiments are only
+    reordered within their own segment.
+    """
+    def __init__(self, timings: dict = None):
+        if timings is None:
+            timings = defaults["hardware timings"]
+        self.timings = timings
+        # Filter value -> wheel position, built once from the defaults
+        self.fw_index = {}
+        self.fw_slots = {}
+        for wheel in ["fw1", "fw2"]:
+            filters = defaults["FWxC"][wheel]["filters"]
+            self.fw_index[wheel] = {filters[pos]["value"]: int(pos)
+                                    for pos in filters}
+            self.fw_slots[wheel] = len(filters)
+
+    def move_cost(self, key, start, end) -> float:
+        """
+        Cost in seconds to take one piece of hardware from start to end.
+        Unknown starting states (None) are free, as we have nothing to
+        compare against.
+        """
+        if start is None or end is None or start == end:
+            return 0.0
+        match key:
+            case "fw1" | "fw2":
+                # Filter wheels rotate the shortest way round
+                start = self.fw_index[key].get(start)
+                end = self.fw_index[key].get(end)
+                if start is None or end is None:
+                    return 0.0
+                steps = abs(end - start)
+                steps = min(steps, self.fw_slots[key] - steps)
+                return steps * self.timings["filter wheel step (s)"]
+            case "shutter":
+                return self.timings["shutter toggle (s)"]
+            case _:
+                # Any other key is a DLS instance
+                return (self.timings["DLS move overhead (s)"] +
+                        self.timings["DLS settle (s)"] +
+                        abs(end - start) /
+                        self.timings["DLS speed (mm/s)"])
+
+    def transition_cost(self, state: dict, experiment) -> float:
+        """
+        Cost in seconds to bring the hardware from state to the starting
+        state of the experiment.
+        """
+        start, _ = experiment.hardware_states()
+        return sum(self.move_cost(key, state.get(key), value)
+                   for key, value in start.items())
+
+    def program_cost(self, program: list, state: dict = None) -> float:
+        """ Total transition cost in seconds for the given order. """
+        state = {} if state is None else dict(state)
+        cost = 0.0
+        for experiment in program:
+            cost += self.transition_cost(state, experiment)
+            state.update(experiment.hardware_states()[1])
+        return cost
+
+    def _order_segment(self,
+                       segment: list,
+                       state: dict,
+                       next_pinned=None) -> list:
+        """
+        Find a low cost order for a segment of unpinned experiments.
+        The following pinned experiment (if any) is included in the
+        cost, as the segment decides where the hardware is left for it.
+        """
+        tail = [] if next_pinned is None else [next_pinned]
+        if len(segment) <= EXACT_SEARCH_LIMIT:
+            # The original order comes first, so it is kept on ties
+            return list(min(permutations(segment),
+                            key=lambda order: self.program_cost(
+                                list(order) + tail, state)))
+
+        # Greedy nearest neighbour ordering
+        order = []
+        remaining = list(segment)
+        current = dict(state)
+        while remaining:
+            closest = min(remaining, key=lambda experiment:
+                          self.transition_cost(current, experiment))
+            remaining.remove(closest)
+            order.append(closest)
+            current.update(closest.hardware_states()[1])
+
+        # Improve with pairwise swaps until nothing helps
+        best = self.program_cost(order + tail, state)
+        improved = True
+        while improved:
+            improved = False
+            for i in range(len(order) - 1):
+                for j in range(i + 1, len(order)):
+                    order[i], order[j] = order[j], order[i]
+                    cost = self.program_cost(order + tail, state)
+                    if cost < best - 1e-9:
+                        best = cost
+                        improved = True
+                    else:
+                        order[i], order[j] = order[j], order[i]
+        return order
+
+    def optimise(self, program: list, state: dict = None) -> list:
+        """
+        Return a reordered copy of the program list. Pinned experiments
+        stay at their original index.
+        Args:
+            program (list): Experiment instances in the queued order.
+            state (dict): Known hardware state before the first
+                experiment, if any.
+        Returns:
+            The reordered program list.
+        """
+        state = {} if state is None else dict(state)
+        ordered = []
+        segment = []
+        for experiment in program:
+            if not experiment.pinned:
+                segment.append(experiment)
+                continue
+            segment = self._order_segment(segment, state, experiment)
+            ordered += segment + [experiment]
+            for item in segment + [experiment]:
+                state.update(item.hardware_states()[1])
+            segment = []
+        ordered += self._order_segment(segment, state)
+        return ordered
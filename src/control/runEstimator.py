@@ -0,0 +1,173 @@
+import os
+import json as js
+from src.config import defaults
+import threading
+import numpy as np
+from src.control.queueOptimiser import QueueOptimiser
+
+# Run-time estimates for queued programs. The estimate is a dry run: it
+# walks each experiment's delays, repeats and hardware transitions
+# without touching the instruments, and prices them with latencies
+# measured during previous runs.
+
+def format_duration(seconds: float) -> str:
+    """ Format a duration in seconds as e.g. "2 h 05 min" or "4 min 10 s" """
+    seconds = int(round(seconds))
+    hours, remainder = divmod(seconds, 3600)
+    minutes, seconds = divmod(remainder, 60)
+    if hours > 0:
+        return f"{hours} h {minutes:02d} min"
+    return f"{minutes} min {seconds:02d} s"
+
+class LatencyLog:
+    """
+    Hardware latencies measured during previous runs, kept on disk so
+    that estimates improve with every run.
+    - DLS move: least squares fit of move time against distance, giving
+      the move overhead (intercept) and speed (1 / slope).
+    - DLS settle, capture: running means.
+    Measurements are only used once there are enough samples, otherwise
+    the "hardware timings" in systemDefaults.json are used.
+    """
+    def __init__(self, path: str = None):
+        if path is None:
+            path = defaults["run estimates"]["latency file"]
+        self.path = path
+        # Moves are recorded from the DLS polling threads
+        self._lock = threading.Lock()
+        self.stats = {"DLS move": {"n": 0, "sx": 0.0, "sy": 0.0,
+                                   "sxx": 0.0, "sxy": 0.0},
+                      "DLS settle": {"n": 0, "sum": 0.0},
+                      "capture": {"n": 0, "sum": 0.0}}
+        # Last commanded position of each DLS, to get move distances
+        self.positions = {}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                for key, values in js.load(f).items():
+                    if key in self.stats:
+                        self.stats[key].update(values)
+
+    def record(self, key: str, duration: float):
+        """ Add a measured duration (s) to a running mean. """
+        with self._lock:
+            self.stats[key]["n"] += 1
+            self.stats[key]["sum"] += duration
+
+    def record_move(self,
+                    dls,
+                    position: float,
+                    move_time: float,
+                    settle_time: float = None):
+        """
+        Add a measured DLS move. The first move of each DLS is only used
+        to learn its position, as the distance travelled is unknown.
+        Args:
+            dls: The DLS instance that moved.
+            position (float): Commanded position (mm).
+            move_time (float): Time from the command to the end of the
+                move (s). Includes settling if settle_time is None.
+            settle_time (float): Time spent settling (s), if measured.
+        """
+        with self._lock:
+            previous = self.positions.get(id(dls))
+            self.positions[id(dls)] = position
+            if previous is None:
+                return
+            distance = abs(position - previous)
+            if distance == 0:
+                return
+            move = self.stats["DLS move"]
+            move["n"] += 1
+            move["sx"] += distance
+            move["sy"] += move_time
+            move["sxx"] += distance**2
+            move["sxy"] += distance * move_time
+        if settle_time is not None:
+            self.record("DLS settle", settle_time)
+
+    def timings(self) -> dict:
+        """
+        Hardware timings in the format of the "hardware timings"
+        defaults, with measured values where there are enough samples.
+        """
+        timings = dict(defaults["hardware timings"])
+        minimum = defaults["run estimates"]["minimum samples"]
+        move = self.stats["DLS move"]
+        denominator = move["n"] * move["sxx"] - move["sx"]**2
+        if move["n"] >= minimum and denominator > 0:
+            slope = (move["n"] * move["sxy"] -
+                     move["sx"] * move["sy"]) / denominator
+            intercept = (move["sy"] - slope * move["sx"]) / move["n"]
+            if slope > 0:
+                timings["DLS speed (mm/s)"] = 1 / slope
+                timings["DLS move overhead (s)"] = max(intercept, 0.0)
+                # Without separate settle measurements, the fit already
+                # includes the settling time
+                timings["DLS settle (s)"] = 0.0
+        if self.stats["DLS settle"]["n"] >= minimum:
+            timings["DLS settle (s)"] = (self.stats["DLS settle"]["sum"] /
+                                         self.stats["DLS settle"]["n"])
+        if defaults["DLS"]["accept within tolerance"]:
+            # Settling then overlaps with the captures of the step
+            timings["DLS settle (s)"] = 0.0
+        if self.stats["capture"]["n"] >= minimum:
+            timings["capture (s)"] = (self.stats["capture"]["sum"] /
+                                      self.stats["capture"]["n"])
+        return timings
+
+    def save(self):
+        """ Write the measured latencies to disk. """
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self._lock, open(self.path, "w") as f:
+            js.dump(self.stats, f, indent=4)
+
+class RunEstimator:
+    """
+    Estimate how long each experiment in a program list will take.
+    Each estimate includes the hardware transition from the previous
+    experiment, the DLS moves and settling, the Picoscope captures and
+    the processing of each step.
+    """
+    def __init__(self, latencies: LatencyLog = None):
+        if latencies is None:
+            latencies = LatencyLog()
+        self.timings = latencies.timings()
+        self.optimiser = QueueOptimiser(self.timings)
+
+    def dls_moves(self, distances: np.ndarray) -> float:
+        """ Total time (s) for a sequence of DLS moves (mm). """
+        distances = np.asarray(distances)
+        distances = distances[distances != 0]
+        return (len(distances) * (self.timings["DLS move overhead (s)"] +
+                                  self.timings["DLS settle (s)"]) +
+                np.sum(distances) / self.timings["DLS speed (mm/s)"])
+
+    def experiment_duration(self, experiment, state: dict) -> float:
+        """
+        Estimated duration (s) of an experiment, starting from the given
+        hardware state.
+        """
+        plan = experiment.run_plan()
+        duration = self.optimiser.transition_cost(state, experiment)
+        duration += self.dls_moves(plan["DLS moves"])
+        duration += plan["captures"] * self.timings["capture (s)"]
+        duration += plan["steps"] * self.timings["step overhead (s)"]
+        for distance, fw_moves in plan["overlapped moves"]:
+            duration += max([self.dls_moves([distance])] +
+                            [self.optimiser.move_cost(*fw_move)
+                             for fw_move in fw_moves])
+        return float(duration)
+
+    def program_durations(self,
+                          program: list,
+                          state: dict = None) -> list:
+        """
+        Estimated duration (s) of every experiment in the program list,
+        in the order they will run.
+        """
+        state = {} if state is None else dict(state)
+        durations = []
+        for experiment in program:
+            durations.append(self.experiment_duration(experiment, state))
+            state.update(experiment.hardware_states()[1])
+        return durations
@@ -0,0 +1,123 @@
+from src.config import defaults
+from src.instruments.Picoscope4000 import PS4000
+from src.instruments.DLS import DLS
+from src.instruments.SC10 import SC10
+from src.instruments.FWxC import FWxC
+from src.control.tracing import Tracer
+from src.control.instrumentSetup import (
+    run_concurrently, run_in_background, report
+)
+
+# Instrument connections kept open across runs. Opening everything for
+# every run repeats slow handshakes (PicoScope OpenUnit takes seconds),
+# so the session owns the instruments for the lifetime of the app and
+# only reconnects what has failed.
+
+class InstrumentSession:
+    """
+    Owner of all instrument instances and their connections.
+
+    - The instruments are created once, here. Everything else is handed
+      these instances rather than creating its own.
+    - connect() is called before every run. It health checks the
+      instruments with cheap queries (Instrument.check_status) and only
+      sets up those that are not connected or have stopped answering,
+      all at the same time.
+    - close() closes every instrument, e.g. when the app is closed.
+    With "simulation": {"enabled": true} in systemDefaults.json, the
+    instruments run on simulated backends instead of the hardware. With
+    "tracing": {"enabled": true}, all instrument calls are recorded by
+    self.tracer.
+    """
+    def __init__(self):
+        self.simulated = defaults["simulation"]["enabled"]
+        if self.simulated:
+            print("Using simulated instruments.")
+            # Only imported when used, like the instrument DLLs
+            from src.instruments import simulated
+            simulated.load_libraries()
+            self.thz_dls = DLS(simulated.SimulatedDLSInterface())
+            self.pump_dls = DLS(simulated.SimulatedDLSInterface())
+            self.ps4000 = simulated.SimulatedPS4000(
+                self.thz_dls.dls_dll.position)
+        else:
+            self.thz_dls = DLS()
+            self.pump_dls = DLS()
+            self.ps4000 = PS4000()
+        self.pump_shutter = SC10()
+        self.fw1 = FWxC()
+        self.fw2 = FWxC()
+
+        # Device name -> (instrument, setup task returning success)
+        self.devices = {
+            "THz DLS": (self.thz_dls, lambda: self.thz_dls.setup(
+                defaults["DLS"]["THz DLS"]["serial port"]) == 0),
+            "Pump DLS": (self.pump_dls, lambda: self.pump_dls.setup(
+                defaults["DLS"]["Pump DLS"]["serial port"]) == 0),
+            "PicoScope": (self.ps4000, self.ps4000.setup),
+            "SC10": (self.pump_shutter, lambda: self.pump_shutter.setup(
+                defaults["SC10"]["serial port"],
+                defaults["SC10"]["baud rate"]) >= 0),
+            "fw1": (self.fw1, lambda: self.fw1.setup(
+                defaults["FWxC"]["fw1"]["serial port"],
+                defaults["FWxC"]["fw1"]["baud rate"]) >= 0),
+            "fw2": (self.fw2, lambda: self.fw2.setup(
+                defaults["FWxC"]["fw2"]["serial port"],
+                defaults["FWxC"]["fw2"]["baud rate"]) >= 0)}
+
+        self.tracer = None
+        if defaults["tracing"]["enabled"]:
+            self.tracer = Tracer()
+            for name, (instrument, _) in self.devices.items():
+                self.tracer.wrap(instrument, name)
+
+        # Look for the serial devices without blocking the GUI startup.
+        # Both filter wheels are listed by the same FWxC call.
+        self.discovery = run_in_background({"SC10": SC10.list_devices,
+                                            "FWxC": FWxC.list_devices},
+                                           "Discovery")
+
+    def check(self) -> dict:
+        """
+        Health check all instruments at the same time.
+        Returns:
+            dict: Device name -> True if connected and answering.
+        """
+        results = run_concurrently(
+            {name: instrument.check_status
+             for name, (instrument, _) in self.devices.items()})
+        return {name: result.success and result.value is True
+                for name, result in results.items()}
+
+    def connect(self) -> bool:
+        """
+        Make sure every instrument is connected. Instruments that fail
+        the health check are closed and set up again, the others are
+        left as they are.
+        Returns:
+            True if all instruments are connected, False otherwise.
+        """
+        # Discovery uses the same DLLs, so let it finish first
+        self.discovery.result()
+        failed = [name for name, healthy in self.check().items()
+                  if not healthy]
+        if len(failed) == 0:
+            print("All instruments already connected.")
+            return True
+        for name in failed:
+            self._close(name)
+        return report(run_concurrently({name: self.devices[name][1]
+                                        for name in failed}),
+                      "Setup")
+
+    def _close(self, name: str):
+        """ Close one instrument, ignoring errors from lost devices. """
+        try:
+            self.devices[name][0].close()
+        except Exception as ex:
+            print(f"Closing {name} failed: {ex!r}")
+
+    def close(self):
+        """ Close all instruments. """
+        for name in self.devices:
+            self._close(name)
@@ -0,0 +1,115 @@
+import os
+import json as js
+from src.config import defaults
+import inspect
+import threading
+import datetime
+from time import perf_counter_ns
+from collections import deque
+from functools import wraps
+
+# Opt-in tracing of instrument commands, to see how the time of a run is
+# spread across the instruments: idle gaps, commands waiting on each
+# other and slow commands. Enable with "tracing": {"enabled": true} in
+# systemDefaults.json. The trace of each run is written as a Chrome
+# trace-event JSON file, which can be opened in chrome://tracing or
+# https://ui.perfetto.dev.
+
+class Tracer:
+    """
+    Records every method call on the wrapped instruments into a ring
+    buffer: the instrument, method, start and end (monotonic clock),
+    thread and arguments. Once the buffer is full, the oldest calls are
+    dropped. Recording a call is a couple of clock reads and a deque
+    append. Arguments are only formatted on export.
+    """
+    def __init__(self, size: int = None):
+        if size is None:
+            size = defaults["tracing"]["buffer size"]
+        # (label, method, start ns, end ns, thread id, args, kwargs)
+        self.events = deque(maxlen=size)
+        self.thread_names = {}
+        self.origin = perf_counter_ns()
+
+    def wrap(self, instrument, label: str):
+        """
+        Trace all methods of an instrument instance, including private
+        ones, so nested calls show up as nested spans.
+        Args:
+            instrument: Instance of an Instrument subclass.
+            label (str): Name of the instrument in the trace.
+        """
+        for name in dir(type(instrument)):
+            if name.startswith("__"):
+                continue
+            # Instance attributes may shadow methods of the same name
+            method = getattr(instrument, name)
+            if not callable(method) or inspect.isclass(method):
+                continue
+            setattr(instrument, name, self._traced(method, label, name))
+
+    def _traced(self, method, label: str, name: str):
+        """ Wrap a bound method so that its calls are recorded """
+        events = self.events
+        thread_names = self.thread_names
+
+        @wraps(method)
+        def traced(*args, **kwargs):
+            start = perf_counter_ns()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                thread = threading.get_ident()
+                if thread not in thread_names:
+                    thread_names[thread] = threading.current_thread().name
+                events.append((label, name, start, perf_counter_ns(),
+                               thread, args, kwargs))
+        return traced
+
+    def clear(self):
+        """ Drop all recorded calls. """
+        self.events.clear()
+
+    def export(self, path: str = None) -> str:
+        """
+        Write the recorded calls as a Chrome trace-event JSON file.
+        Args:
+            path (str): File to write. By default, a time-stamped file in
+                the tracing directory.
+        Returns:
+            The path of the file written.
+        """
+        if path is None:
+            directory = defaults["tracing"]["directory"]
+            os.makedirs(directory, exist_ok=True)
+            stamp = datetime.datetime.now().strftime("%Y-%m-%d %H-%M-%S")
+            path = os.path.join(directory, f"trace {stamp}.json")
+        trace_events = [{"name": "thread_name", "ph": "M", "pid": 0,
+                         "tid": thread, "args": {"name": thread_name}}
+                        for thread, thread_name in
+                        list(self.thread_names.items())]
+        for label, name, start, end, thread, args, kwargs in list(
+                self.events):
+            arguments = {f"arg {i}": _short_repr(arg)
+                         for i, arg in enumerate(args)}
+            arguments |= {key: _short_repr(value)
+                          for key, value in kwargs.items()}
+            trace_events.append({"name": f"{label}.{name}",
+                                 "cat": label,
+                                 "ph": "X",
+                                 "ts": (start - self.origin) / 1000,
+                                 "dur": (end - start) / 1000,
+                                 "pid": 0,
+                                 "tid": thread,
+                                 "args": arguments})
+        with open(path, "w") as f:
+            js.dump({"traceEvents": trace_events,
+                     "displayTimeUnit": "ms"}, f)
+        return path
+
+def _short_repr(value, limit: int = 80) -> str:
+    """ repr of a value, cut to a readable length """
+    text = repr(value)
+    if len(text) > limit:
+        text = text[:limit - 3] + "..."
+    return text
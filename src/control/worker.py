@@ -4,11 +4,12 @@ try:
     from PyQt6.QtCore import QObject, QRunnable, pyqtSignal
 except OSError as ex:
     print("Warning:", ex)
+from src.control.frames import ProgressFrame
 
 # Currently, this Worker classes are used to simply enable multithreading.
 # There are a lot of additional features that can be added to this class,
 # Especially utilising the signals to update the GUI.
-# For example, we can use the progress signal to update a progress bar
+# The progress signal updates the progress bar of the data tab.
 # Multithreading based on this article:
 # https://www.pythonguis.com/tutorials/multithreading-pyqt6-applications-qthreadpool/
 
@@ -21,17 +22,18 @@ class WorkerSignals(QObject):
     error
         tuple (exctype, value, traceback.format_exc())
 
-    result
-        object data returned from processing, anything
+    processed_data
+        frame of data to plot (see src/control/frames.py)
 
     progress
-        float indicating % progress
+        ProgressFrame of the running experiment (see
+        src/control/progress.py)
     """
 
     finished = pyqtSignal()
     error = pyqtSignal(tuple)
-    processed_data = pyqtSignal(dict)
-    progress = pyqtSignal(float)
+    processed_data = pyqtSignal(object)
+    progress = pyqtSignal(object)
 
 class Worker(QRunnable):
     """Worker thread.
@@ -58,7 +60,12 @@ class Worker(QRunnable):
     def run(self):
         try:
             def emit(*args):
-                self.signals.processed_data.emit(args[0])
+                # Progress goes to its own signal, data to be plotted
+                # to processed_data
+                if isinstance(args[0], ProgressFrame):
+                    self.signals.progress.emit(args[0])
+                else:
+                    self.signals.processed_data.emit(args[0])
             #result = self.fn(*self.args, **self.kwargs)
             # Run the function with the emit callback
             self.fn(emit, *self.args, **self.kwargs)
@@ -1,5 +1,7 @@
 import sys
-import clr
+from src.config import defaults
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 from ctypes import *
 from src.instruments.instrument import Instrument
 import time
@@ -14,19 +16,113 @@ import time
 # OpenInstrument, CloseInstrument, AC_Get, AC_Set, PA_Get, PA_Set
 # PD, PR_Set, ST, TB, TE, TH, TP, TS, VA_Get, VA_Set
 
-# Add the DLL directory to the system path
+# The DLL is a .NET assembly, loaded with pythonnet (clr) on first use
+# so that this module can be imported without it, e.g. with the
+# simulated instruments.
 DLL_DIRECTORY = (r"./src/instruments/instruments_dlls")
-sys.path.append(DLL_DIRECTORY)
 
-# Load the DLL
-clr.AddReference("Newport.DLS.CommandInterface")
+def load_dll():
+    """ Load the DLS Command Interface DLL and return its DLS class """
+    import clr
+    if DLL_DIRECTORY not in sys.path:
+        sys.path.append(DLL_DIRECTORY)
+    clr.AddReference("Newport.DLS.CommandInterface")
+    from CommandInterfaceDLS import DLS as DLS_DLL
+    return DLS_DLL
 
-# Import the DLS class from the DLL
-from CommandInterfaceDLS import DLS as DLS_DLL
+# Controller states returned by TS (see TS in the DL Controller manual)
+MOVING = "3C"
+READY_AFTER_MOVING = "47"
+
+class DLSMove:
+    """
+    Handle for an asynchronous DLS move, returned by
+    DLS.move_absolute_async. It holds how long the stage took to get
+    within the position tolerance of the target (move_time), the
+    position measured at that point, and, once done, how long it took
+    to settle (settle_time).
+    """
+    def __init__(self, target: float):
+        self.target = target
+        self.errstring = ""
+        self.cancelled = False
+        self.move_time = None
+        self.settle_time = None
+        self.position = None
+        # Error of a failed move, stored before waiters are released
+        self.error = None
+        self._cancel = threading.Event()
+        # Set when waiters can carry on: in position, or finished
+        self._released = threading.Event()
+        self._future = None
+
+    def cancel(self):
+        """ Stop the move. The stage decelerates and stops. """
+        self._cancel.set()
+
+    def done(self) -> bool:
+        """ Check if the move has finished, failed or been cancelled. """
+        return self._future is None or self._future.done()
+
+    def add_done_callback(self, callback):
+        """
+        Call callback(move) once the move has finished, from the polling
+        thread. Called straight away if it has already finished.
+        """
+        if self._future is None:
+            callback(self)
+        else:
+            self._future.add_done_callback(lambda _: callback(self))
+
+    def result(self, timeout: float = None) -> str:
+        """
+        Wait for the move to finish. If the DLS accepts moves within
+        tolerance, this returns as soon as the stage is in position and
+        the stage settles in the background.
+        Args:
+            timeout (float): Time to wait (s), None to wait until done.
+        Returns:
+            errstring (str): empty if successful.
+        Raises:
+            TimeoutError: if the stage did not get to the target within
+                the move timeout.
+        """
+        if self._future is not None:
+            if not self._released.wait(timeout):
+                raise TimeoutError(f"Timed out waiting for the DLS move "
+                                   f"to {self.target} mm.")
+            # Stored before the release, so it is never missed while
+            # the future is still being completed
+            if self.error is not None:
+                raise self.error
+        return self.errstring
 
 class DLS(Instrument):
-    def __init__(self):
-        self.dls_dll = DLS_DLL()
+    def __init__(self, dls_dll=None):
+        """
+        Args:
+            dls_dll: Object with the Command Interface DLL methods, e.g.
+                a simulated one. If None, the real DLL is loaded at the
+                first setup, as starting the .NET runtime is slow.
+        """
+        self.dls_dll = dls_dll
+        self.is_open = False
+        # The polling thread and the caller share the DLL
+        self._lock = threading.Lock()
+        self._executor = None
+        self.last_move = None
+        # Last commanded position and applied move profile
+        self.target = None
+        self.profile = None
+        # Last position read back with TP, when it was read, and whether
+        # the stage has settled there since
+        self._position = None
+        self._position_time = 0.0
+        self._position_settled = False
+        self._move = None
+        self.tolerance = defaults["DLS"]["position tolerance (mm)"]
+        self.accept_within_tolerance = (defaults["DLS"]
+                                        ["accept within tolerance"])
 
     def setup(self, device_key: str) -> int:
         """
@@ -36,9 +132,14 @@ class DLS(Instrument):
         Returns:
         0: if successful, -1 otherwise.
         """
+        if self.dls_dll is None:
+            self.dls_dll = load_dll()()
         result = self.dls_dll.OpenInstrument(device_key)
         if result == 0:
             self.is_open = True
+            self._executor = ThreadPoolExecutor(max_workers=1)
+            # The controller may have been left with any profile
+            self.profile = None
         return result
 
     def close(self) -> int:
@@ -48,6 +149,7 @@ class DLS(Instrument):
         0: if successful, -1 otherwise.
         """
         if self.is_open:
+            self._executor.shutdown(wait=True)
             result = self.dls_dll.CloseInstrument()
             if result == 0:
                 self.is_open = False
@@ -55,6 +157,17 @@ class DLS(Instrument):
         else:
             return -1
 
+    def check_status(self) -> bool:
+        """
+        Cheap health check: the DLS is open and answers a TS query.
+        Returns:
+            True if the DLS is usable, False otherwise.
+        """
+        if not self.is_open:
+            return False
+        with self._lock:
+            return self.dls_dll.TS()[0] == 0
+
     def _TB(self, error_code: str) -> str:
         """
         returns a string that explains the meaning of the error code.
@@ -64,7 +177,8 @@ class DLS(Instrument):
         Returns:
             error_message (str)
         """
-        return self.dls_dll.TB(error_code)[1]
+        with self._lock:
+            return self.dls_dll.TB(error_code)[1]
 
     def _TS(self) -> str:
         """
@@ -75,12 +189,157 @@ class DLS(Instrument):
             status (str): The status string if successful.
             errstring (str): The error string if unsuccessful.
         """
-        command_out = self.dls_dll.TS()
+        with self._lock:
+            command_out = self.dls_dll.TS()
         if command_out[0] == 0:
             return command_out[3]
         else:
             return command_out[2]
 
+    def _TP(self) -> float:
+        """
+        Get the current (measured) position of the DLS. The value is
+        cached for get_command("position").
+        Returns:
+            position (float): The current position (mm), None if
+            unsuccessful.
+        """
+        with self._lock:
+            command_out = self.dls_dll.TP()
+        if command_out[0] != 0:
+            return None
+        self._position = command_out[1]
+        self._position_time = time.perf_counter()
+        return self._position
+
+    def _ST(self) -> str:
+        """
+        Stop the motion in progress.
+        Returns:
+            errstring (str): empty if successful.
+        """
+        with self._lock:
+            return self.dls_dll.ST()[1]
+
+    def move_absolute_async(self,
+                            position: float,
+                            poll_interval: float = None,
+                            timeout: float = None,
+                            should_stop=None) -> DLSMove:
+        """
+        Start an absolute move and return straight away. The status is
+        polled on a background thread at a paced rate until the stage
+        is ready again.
+        Args:
+            position (float): Target position (mm).
+            poll_interval (float): Time between status polls (s).
+            timeout (float): Maximum time for the move (s).
+            should_stop (callable): Polled with the status, the move is
+                cancelled if it returns True (e.g. the GUI stop flag).
+        Returns:
+            DLSMove handle for the move.
+        """
+        polling = defaults["DLS"]["move polling"]
+        if poll_interval is None:
+            poll_interval = polling["poll interval (s)"]
+        if timeout is None:
+            timeout = polling["timeout (s)"]
+        move = DLSMove(position)
+        self.wait_until_ready()
+        self.target = position
+        self._position_settled = False
+        with self._lock:
+            errstring = self.dls_dll.PA_Set(position)[1]
+        if errstring != "":
+            move.errstring = self._TB(errstring)
+            return move
+        move._future = self._executor.submit(self._wait_for_move,
+                                             move,
+                                             poll_interval,
+                                             timeout,
+                                             should_stop)
+        self._move = move
+        return move
+
+    def wait_until_ready(self):
+        """
+        Wait for the last move to finish settling. Moves accepted within
+        tolerance keep settling in the background, and the controller
+        does not accept new moves or profiles until they are done.
+        """
+        if self._move is not None and self._move._future is not None:
+            wait([self._move._future])
+
+    def _wait_for_move(self,
+                       move: DLSMove,
+                       poll_interval: float,
+                       timeout: float,
+                       should_stop):
+        """
+        Poll the DLS state and position until the move is done. The move
+        time is up to when the measured position gets within tolerance
+        of the target, the settle time is from there until the controller
+        reports READY. Waiters are released once in position if the DLS
+        accepts moves within tolerance, otherwise once READY.
+        """
+        start = time.perf_counter()
+        try:
+            while True:
+                # Only moves still on their way can be stopped
+                if not move._released.is_set() and (
+                        move._cancel.is_set() or
+                        (should_stop is not None and should_stop())):
+                    move.errstring = self._ST()
+                    move.cancelled = True
+                    return
+                status = self._TS()
+                position = self._TP()
+                now = time.perf_counter()
+                if move.move_time is None and (
+                        status == READY_AFTER_MOVING or
+                        (position is not None and
+                         abs(position - move.target) <= self.tolerance)):
+                    move.move_time = now - start
+                    move.position = position
+                    if self.accept_within_tolerance:
+                        move._released.set()
+                if status == READY_AFTER_MOVING:
+                    move.settle_time = now - start - move.move_time
+                    # The stage stays at this position until the next move
+                    self._position_settled = position is not None
+                    self.last_move = move
+                    return
+                if now - start > timeout:
+                    self._ST()
+                    raise TimeoutError(f"DLS move to {move.target} mm did "
+                                       f"not finish within {timeout} s.")
+                time.sleep(poll_interval)
+        except Exception as ex:
+            move.error = ex
+            raise
+        finally:
+            move._released.set()
+
+    def set_profile(self, name: str) -> str:
+        """
+        Apply a move profile (velocity and acceleration) from the
+        defaults. Nothing is sent if the profile is already applied.
+        Args:
+            name (str): Name of the profile, e.g. "fine" or "slew".
+        Returns:
+            errstring (str): empty if successful.
+        """
+        if name == self.profile:
+            return ""
+        profile = defaults["DLS"]["move profiles"][name]
+        errstring = self.set_command("velocity", profile["velocity (mm/s)"])
+        if errstring == "":
+            errstring = self.set_command("acceleration",
+                                         profile["acceleration (mm/s2)"])
+        # If anything failed, the profile on the controller is unknown
+        self.profile = name if errstring == "" else None
+        return errstring
+
     def set_command(self, command: str, value: float) -> str:
         """
         Set the command for the DLS device.
@@ -91,13 +350,53 @@ class DLS(Instrument):
             errstring (str): empty if successful.
         """
         errstring = ""
-        status = ""
         match command:
             case "move absolute":
-                errstring = self.dls_dll.PA_Set(value)[1]
-                if errstring != "":
-                    return self._TB(errstring)
-                while status != "47":
-                    status = self._TS()
+                errstring = self.move_absolute_async(value).result()
+            case "velocity":
+                # VA and AC are not allowed while the stage is moving
+                self.wait_until_ready()
+                with self._lock:
+                    errstring = self.dls_dll.VA_Set(value)[1]
+                self.profile = None
+            case "acceleration":
+                self.wait_until_ready()
+                with self._lock:
+                    errstring = self.dls_dll.AC_Set(value)[1]
+                self.profile = None
+            case "profile":
+                errstring = self.set_profile(value)
+
+        return errstring
 
-        return errstring
\ No newline at end of file
+    def get_command(self, command: str) -> float:
+        """
+        Get a value from the DLS device.
+        Args:
+            command (str): The value to get, "position" (mm),
+                "velocity" (mm/s) or "acceleration" (mm/s2).
+        Returns:
+            The value if successful, None otherwise.
+        """
+        match command:
+            case "position":
+                # Reuse the position from the move polling if the stage
+                # has settled there, or if it was read just now
+                age = time.perf_counter() - self._position_time
+                if self._position is not None and (
+                        self._position_settled or
+                        age <= defaults["DLS"]["move polling"]
+                                       ["poll interval (s)"]):
+                    return self._position
+                return self._TP()
+            case "velocity":
+                with self._lock:
+                    command_out = self.dls_dll.VA_Get()
+            case "acceleration":
+                with self._lock:
+                    command_out = self.dls_dll.AC_Get()
+            case _:
+                return None
+        if command_out[0] == 0:
+            return command_out[1]
+        return None
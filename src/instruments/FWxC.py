@@ -1,14 +1,17 @@
 from ctypes import *
-import json as js
+from src.config import defaults
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
 from src.instruments.instrument import Instrument
 
-with open(r"config/systemDefaults.json") as f:
-    defaults = js.load(f)
-
 class FWxC(Instrument):
     """ Class for FWxC device"""
     FWxCLib = None
     isLoad = False
+    # The DLL is loaded on first use (see load_default), not when the
+    # instances are made at startup
+    DLL_PATH = ("./src/instruments/instruments_dlls/"
+                "FilterWheel102_win64.dll")
 
     @staticmethod
     def list_devices():
@@ -16,6 +19,7 @@ class FWxC(Instrument):
         Returns: 
             The FWxC device list, each deice item is [serialNumber, FWxCType]
         """
+        FWxC.load_default()
         str = create_string_buffer(1024, "\0") 
         result = FWxC.FWxCLib.List(str,1024)
         devicesStr = str.raw.decode("utf-8").rstrip("\x00").split(",")
@@ -43,13 +47,27 @@ class FWxC(Instrument):
         FWxC.FWxCLib = cdll.LoadLibrary(path)
         FWxC.isLoad = True
 
+    @staticmethod
+    def load_default():
+        """ Load the FWxC DLL, unless a library is already loaded """
+        if not FWxC.isLoad:
+            FWxC.load_library(FWxC.DLL_PATH)
+
     def __init__(self):
         super().__init__("FWxC")
         self.type = "fw"
-        if not FWxC.isLoad:
-            FWxC.load_library("./src/instruments/instruments_dlls/" \
-                               "FilterWheel102_win64.dll")
         self.hdl = -1
+        # Filter value -> wheel position and relative power, built at
+        # setup once the wheel is known
+        self.positions = {}
+        self.powers = {}
+        # Last confirmed wheel position, None if unknown
+        self.position = None
+        # Moves run on their own thread, sharing the DLL with callers
+        self._lock = threading.Lock()
+        self._executor = None
+        self._target = None
+        self._move = None
 
     def setup(self, serialNo: str, nBaud: int, timeout: int = 3) -> int:
         """ Open FWxC device
@@ -62,6 +80,7 @@ class FWxC(Instrument):
         negative number: failed.
     """
         ret = -1
+        FWxC.load_default()
         if FWxC.isLoad:
             ret = FWxC.FWxCLib.Open(serialNo.encode("utf-8"),
                                     nBaud, timeout)
@@ -72,11 +91,22 @@ class FWxC(Instrument):
                 self.name = "fw2"
             self.status = f"Connect to FWxC at {serialNo} success."
             self.hdl = ret
+            self._build_indexes()
+            self._executor = ThreadPoolExecutor(max_workers=1)
+            self._move = None
+            self.get_command("current position")
         else:
             self.status = f"Connect to FWxC at {serialNo} fail."
             self.hdl = -1
         return ret
 
+    def _build_indexes(self):
+        """ Map filter values to wheel positions and powers """
+        filters = defaults["FWxC"].get(self.name, {}).get("filters", {})
+        self.positions = {filters[pos]["value"]: int(pos) for pos in filters}
+        self.powers = {filters[pos]["value"]: float(filters[pos]["power"])
+                       for pos in filters}
+
     def is_connected(self, serialNo: str) -> bool:
         """ Check opened status of FWxC device
         Args:
@@ -92,6 +122,15 @@ class FWxC(Instrument):
             else:
                 return False
 
+    def check_status(self) -> bool:
+        """ Cheap health check: the FWxC is open and answers a query
+        Returns:
+            True if the FWxC is usable, False otherwise.
+        """
+        if self.hdl < 0:
+            return False
+        return self.get_command("current position") is not None
+
     def close(self) -> int:
         """ Close opened FWxC device
         Returns: 
@@ -99,13 +138,80 @@ class FWxC(Instrument):
         """
         ret = -1
         if self.hdl >= 0:
+            self._executor.shutdown(wait=True)
+            self.position = None
             ret = FWxC.FWxCLib.Close(self.hdl)
             if ret == 0:
                 self.status = f"Close FWxC at {self.name} success."
             else:
                 self.status = f"WARNING: Close FWxC at {self.name} fail!"
+            self.hdl = -1
         return ret
 
+    def _set_position(self, position: int, value: str = None) -> int:
+        """ Turn the wheel and wait for it (runs on the move thread)
+        Args:
+            position: wheel position to go to
+            value: filter value at that position, for the status
+        Returns:
+            0: Success; otherwise the DLL error code.
+        """
+        label = f"position {position}" if value is None else \
+            f"filter {value} at position {position}"
+        with self._lock:
+            ret = FWxC.FWxCLib.SetPosition(self.hdl, position)
+        if ret == 0:
+            self.position = position
+            self.status = f"Set {self.name} to {label}."
+        else:
+            # The wheel may have moved anyway, so read it again lazily
+            self.position = None
+            if ret == 235:
+                self.status = (f"WARNING: {self.name} timed out setting "
+                               f"{label}.\nIt may have been set still, "
+                               f"please check!")
+            else:
+                self.status = (f"ERROR: {self.name} failed to set to "
+                               f"{label}!")
+        return ret
+
+    def move_async(self, position: int, value: str = None) -> Future:
+        """ Start turning the wheel without waiting for it
+        Nothing is sent if the wheel is already confirmed at the
+        position, and a move to the position in progress is reused.
+        Args:
+            position: wheel position to go to
+            value: filter value at that position, for the status
+        Returns:
+            Future resolving to 0 on success, or the DLL error code.
+        """
+        if self._move is not None and not self._move.done():
+            if self._target == position:
+                return self._move
+        elif self.position == position:
+            done = Future()
+            done.set_result(0)
+            return done
+        self._target = position
+        self._move = self._executor.submit(self._set_position,
+                                           position, value)
+        return self._move
+
+    def move_filter_async(self, value: str) -> Future:
+        """ Start turning the wheel to a filter value, see move_async
+        Args:
+            value: filter value as in the systemDefaults.json file
+        Returns:
+            Future resolving to 0 on success, or the DLL error code. -1
+            if the filter is not on this wheel.
+        """
+        position = self.get_command("which position", value)
+        if position is None:
+            done = Future()
+            done.set_result(-1)
+            return done
+        return self.move_async(position, value)
+
     def set_command(self, command: str, value: str) :
         """ Execute command on the FWxC device
         Args:
@@ -117,26 +223,14 @@ class FWxC(Instrument):
         match command:
             case("position"):
                 # This command sets the filter position
-                ret = FWxC.FWxCLib.SetPosition(self.hdl, int(value))
+                return self.move_async(int(value)).result()
 
             case("position from filter"):
                 # This command sets the filter position depending on the
                 # filter value as mapped in the systemDefaults.json file
-                filter_val = self.get_command("which position", value)
-                ret = FWxC.FWxCLib.SetPosition(self.hdl, filter_val)
-                if ret == 0:
-                    self.status = (f"Set {self.name} to filter {value} at"
-                                    f"position {filter_val}.")
-                elif ret == 235:
-                    self.status = (f"WARNING: {self.name} timed out setting"
-                                f"filter {value} at position {filter_val}.\n"
-                                f"It may have been set still, please check!")
-                else:
-                    self.status = (f"ERROR: {self.name} failed to set to"
-                                   f"filter {value} at position"
-                                   f"{filter_val}!")
+                return self.move_filter_async(value).result()
 
-    def get_command(self, command: str, value: str):
+    def get_command(self, command: str, value: str = None):
         """ Get command from the FWxC device
         Args:
             command: the command to eget
@@ -145,25 +239,22 @@ class FWxC(Instrument):
         """
         match command:
             case("current position"):
-                value = c_int(0)
-                FWxC.FWxCLib.GetPosition(self.hdl, byref(value))
-                return value.value
+                position = c_int(0)
+                with self._lock:
+                    ret = FWxC.FWxCLib.GetPosition(self.hdl, byref(position))
+                self.position = position.value if ret == 0 else None
+                return self.position
 
             case("which position"):
-                for filter in defaults["FWxC"][self.name]["filters"]:
-                    if (defaults["FWxC"][self.name]["filters"]
-                        [filter]["value"] == value):
-                        return int(filter)
+                if value in self.positions:
+                    return self.positions[value]
                 self.status = (f"Warning: filter {value} not found in"
                                f"{self.name}!\nFilter position value"
                                f"not found!")
-            
+
             case("filter power value"):
-                for filter in defaults["FWxC"][self.name]["filters"]:
-                    if (defaults["FWxC"][self.name]["filters"]
-                        [filter]["value"] == value):
-                        return float(defaults["FWxC"][self.name]["filters"]
-                                    [filter]["power"])
+                if value in self.powers:
+                    return self.powers[value]
                 self.status = (f"Warning: filter {value} not found in"
                                f"{self.name}!\nFilter power value not"
-                               f"found!")
\ No newline at end of file
+                               f"found!")
@@ -1,150 +1,275 @@
-from struct import pack,unpack
-import serial
+from src.config import defaults
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, Future
+from struct import pack, unpack
+import serial
 from src.instruments.instrument import Instrument
 
-class MCM3000(Instrument):
-	'''
-	Class for controlling the MCM3000 PLSXY stage. 
-
-	This class is a wrapper for the MCM3000 PLSXY stage and provides
-	methods for initializing the stage, getting position, absolute
-	moves, and checking status. 
-	'''
-	def __init__(self, name):
-		super().__init__(name)
-		self.type = "motion stage"
-
-	def setup(self, port, baud_rate=115200, byte_size=8, stop_bits=1):
-
-def Initialize(Port,Baud_Rate=115200,ByteSize=8,StopBits=1):
-
-	'''
-	Intializes the stage and returns a Serial object for communicating
-	with the controller. 
-
-	The Port settings default to the correct values for the PLS-X. The only
-	requires input parameter is the relevent COM port the stage is assigned. 
-
-	'''
-	
-	baud_rate = Baud_Rate
-	data_bits = ByteSize
-	stop_bits = StopBits
-	Parity = serial.PARITY_NONE
-	stage = serial.Serial(port = Port, baudrate = baud_rate, bytesize=data_bits, parity=Parity, stopbits=stop_bits,timeout=0.1)
-	return stage
-
-def Set_Encoder_Count(Stage,chan_num,encoder_value):
-
-	'''
-	Allows setting the encoder count to a user defined value. 
-
-	Setting the encoder_value parameter to 0 will take the current
-	stage position as being home position. Absolute moves would be in refernece
-	to that posiion of the stage. 
-	'''
-
-	SetEncoderCount_id = 0x0409
-	SetEncoderCount = pack('<HBBBBHi',SetEncoderCount_id,0x06,0x00,0x00,0x00,Channel,encoder_value)
-	Stage.write(SetEncoderCount)
-
-	return	
-
-def getPositionDU(Stage,chan_num):
-
-	'''
-	Returns the positions of the stage in device units(Encoder Counts)
-
-	diving the retuned values by the Counts/mm scale factor will yield
-	a value in real units. 
-
-	'''
-
-
-	GetPosition_id = 0x040A
-
-	Stage.write(pack('<HBBBB',GetPosition_id,Channel,0x00,0x00,0x00))
-	Rx = Stage.read(12)
-	header, chan_dent, position_dUnits = unpack('<6sHi',Rx)
-	return float(position_dUnits)
-
-def Absolute_Move(Stage,chan_num,ScaleFactor,abs_pos,wait=True):
+# This is a driver for the Thorlabs MCM3000 controller with PLS-X stages,
+# talking to it directly over serial. See archive/ for the original
+# Thorlabs examples the messages are taken from.
 
-	'''
-	Method for moving to an Absolute Position. abs_pos should be in units of millimeters
-	
-	'wait' is an optional parameter and defaults to True, which means the Method
-	will wait for the stage to complete the move to the requested position before
-	advancing in the program. 
+# Message IDs and total message lengths (bytes)
+SET_ENCODER_COUNT = 0x0409
+GET_POSITION = 0x040A
+POSITION_REPLY_LENGTH = 12
+MOVE_ABSOLUTE = 0x0453
+GET_STATUS = 0x0480
+STATUS_REPLY_LENGTH = 20
 
-	A wait=False argument will result in the program immediately advancing. 
-	This can be useful if you needed to take data in the program while the stage
-	is moving. 
-	'''
-
-	Move_Absolute_id = 0x0453
-	device_units = int(abs_pos*Scale_Factor) # mm position*conversion to encoder counts
-	Move_Absolute = pack('<HBBBBHi',Move_Absolute_id,0x06,0x00,0x00,0x00,chan_num,device_units)
-	Stage.write(Move_Absolute)
-
-	Status=1
-	stopped = 0
-	#Waits until the current position is within absolute position by 5um for 3 positions
-	if wait:
-		while stopped < 3:
-
-			if abs((abs_pos-getPositionDU(Stage,chan_num)/ScaleFactor)) <0.005:
-				stopped +=1
-
-		return 
-
-	#wait=False, Absolute_Move will return immediately after the command is sent 
-	#Program will not wait for motor to stop before advancing
-	else:
-		return
-
-def getStatus(Stage,chan_num):
-
-	'''
-	Methods returns 0 if the stage is not in motion and 1 if in motion
-	'''
-
-	GetStatus_id = 0x0480
-	Get_Motor_Status = pack('<HBBBB',GetStatus_id,chan_num,0x00,0x00,0x00) 
-	Stage.write(Get_Motor_Status)
-	str1,return_status,str2 = unpack('<16sB3s',Stage.read(20))
-	if return_status != 0:
-		return_status=1
-
-
-	return return_status
-
-
-
-Com_Port = 'COM5'
-Scale_Factor = 4735.597 # Encoder Counts/mm for PLS-X
-Channel = 0 # Channel 1 indexes at 0
-
-#Intialize PlS-X Stage 
-PLS_X = Initialize(Com_Port)
-
-#Set Encoder Count to 0
-Set_Encoder_Count(PLS_X,Channel,0)
-time.sleep(0.1)
-
-#Get Position Before Move
-Position = getPositionDU(PLS_X,Channel)/Scale_Factor
-print('Position: %.4f mm' % (Position))
-
-#Move Stage to 5 mm
-pos = 1 #mm
-
-Absolute_Move(PLS_X,Channel,Scale_Factor,pos)
-
-#Get Position After Move
-Position = getPositionDU(PLS_X,Channel)/Scale_Factor
-print('Position: %.4f mm' % (Position))
-
-
-del PLS_X
\ No newline at end of file
+class MCM3000(Instrument):
+    """
+    Class for controlling the MCM3000 PLSXY stage.
+
+    - The serial port is opened in setup and kept open until close.
+    - Moves are non-blocking: move_absolute_async sends the moves for
+      one or more channels in a single write and returns a Future, which
+      resolves once every channel has stopped at its target.
+    - Position and status queries for several channels are batched
+      into a single write and read.
+    """
+    def __init__(self, name: str = "MCM3000", serial_class=None):
+        """
+        Args:
+            name (str): Name of the instrument.
+            serial_class: Class to open the port with, e.g. the loopback
+                test double in simulated.py. serial.Serial if None.
+        """
+        super().__init__(name)
+        self.type = "motion stage"
+        self.serial_class = serial.Serial if serial_class is None \
+            else serial_class
+        self.stage = None
+        self.scale_factor = defaults["MCM3000"]["counts per mm"]
+        self.tolerance = defaults["MCM3000"]["position tolerance (mm)"]
+        # Each query is a write and a read that must not be interleaved
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def setup(self,
+              port: str,
+              baud_rate: int = 115200,
+              byte_size: int = 8,
+              stop_bits: int = 1) -> int:
+        """
+        Open the serial port to the MCM3000 controller.
+        Args:
+            port (str): The COM port to connect to.
+        Returns:
+            0: if successful, -1 otherwise.
+        """
+        try:
+            self.stage = self.serial_class(port=port,
+                                           baudrate=baud_rate,
+                                           bytesize=byte_size,
+                                           parity=serial.PARITY_NONE,
+                                           stopbits=stop_bits,
+                                           timeout=0.1)
+        except (serial.SerialException, OSError) as ex:
+            self.status = f"Connect to MCM3000 at {port} fail: {ex}"
+            self.stage = None
+            return -1
+        self.status = f"Connect to MCM3000 at {port} success."
+        self.is_connected = True
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        return 0
+
+    def close(self) -> int:
+        """
+        Close the serial port, after any move in progress.
+        Returns:
+            0: if successful, -1 otherwise.
+        """
+        if self.stage is None:
+            return -1
+        self._executor.shutdown(wait=True)
+        self.stage.close()
+        self.stage = None
+        self.is_connected = False
+        return 0
+
+    def check_status(self) -> bool:
+        """ Cheap health check: the controller answers a status query """
+        if self.stage is None:
+            return False
+        try:
+            self.get_status([0])
+        except (serial.SerialException, OSError):
+            return False
+        return True
+
+    def _query(self, requests: list, reply_lengths: list) -> list:
+        """
+        Send several requests in one write and read all replies.
+        Args:
+            requests (list): Request messages (bytes).
+            reply_lengths (list): Length of the reply to each request, 0
+                for requests without a reply.
+        Returns:
+            The replies (bytes), in the order of the requests.
+        Raises:
+            OSError: if not all replies were received in time.
+        """
+        total = sum(reply_lengths)
+        with self._lock:
+            self.stage.write(b"".join(requests))
+            reply = self.stage.read(total) if total != 0 else b""
+        if len(reply) != total:
+            raise OSError(f"MCM3000 replied {len(reply)} of {total} "
+                          f"bytes.")
+        replies = []
+        for length in reply_lengths:
+            replies.append(reply[:length])
+            reply = reply[length:]
+        return replies
+
+    def set_encoder_count(self, channels: dict):
+        """
+        Set the encoder count of channels, e.g. 0 to take the current
+        position as home. Absolute moves are relative to it.
+        Args:
+            channels (dict): Channel index -> encoder count.
+        """
+        self._query([pack("<HBBBBHi", SET_ENCODER_COUNT, 0x06, 0x00, 0x00,
+                          0x00, channel, count)
+                     for channel, count in channels.items()],
+                    [0] * len(channels))
+
+    def get_positions(self, channels: list) -> dict:
+        """
+        Get the positions of channels with one batched query.
+        Args:
+            channels (list): Channel indices (channel 1 is index 0).
+        Returns:
+            dict: Channel index -> position (mm).
+        """
+        replies = self._query([pack("<HBBBB", GET_POSITION, channel, 0x00,
+                                    0x00, 0x00) for channel in channels],
+                              [POSITION_REPLY_LENGTH] * len(channels))
+        positions = {}
+        for channel, reply in zip(channels, replies):
+            _, _, counts = unpack("<6sHi", reply)
+            positions[channel] = counts / self.scale_factor
+        return positions
+
+    def get_status(self, channels: list) -> dict:
+        """
+        Get whether channels are moving with one batched query.
+        Args:
+            channels (list): Channel indices.
+        Returns:
+            dict: Channel index -> True if moving, False otherwise.
+        """
+        replies = self._query([pack("<HBBBB", GET_STATUS, channel, 0x00,
+                                    0x00, 0x00) for channel in channels],
+                              [STATUS_REPLY_LENGTH] * len(channels))
+        return {channel: unpack("<16sB3s", reply)[1] != 0
+                for channel, reply in zip(channels, replies)}
+
+    def poll(self, channels: list) -> dict:
+        """
+        Get the position and status of channels in a single round trip.
+        Returns:
+            dict: Channel index -> (position (mm), moving).
+        """
+        requests = []
+        lengths = []
+        for channel in channels:
+            requests += [pack("<HBBBB", GET_POSITION, channel, 0x00, 0x00,
+                              0x00),
+                         pack("<HBBBB", GET_STATUS, channel, 0x00, 0x00,
+                              0x00)]
+            lengths += [POSITION_REPLY_LENGTH, STATUS_REPLY_LENGTH]
+        replies = self._query(requests, lengths)
+        result = {}
+        for i, channel in enumerate(channels):
+            counts = unpack("<6sHi", replies[2 * i])[2]
+            moving = unpack("<16sB3s", replies[2 * i + 1])[1] != 0
+            result[channel] = (counts / self.scale_factor, moving)
+        return result
+
+    def move_absolute_async(self,
+                            targets: dict,
+                            poll_interval: float = None,
+                            timeout: float = None) -> Future:
+        """
+        Start absolute moves on one or more channels without waiting.
+        Args:
+            targets (dict): Channel index -> position (mm).
+            poll_interval (float): Time between polls (s).
+            timeout (float): Time to wait for the moves (s).
+        Returns:
+            Future resolving to the final positions, dict of channel
+            index -> position (mm). It raises TimeoutError if the moves
+            take too long, or RuntimeError if a channel stops away from
+            its target.
+        """
+        if poll_interval is None:
+            poll_interval = defaults["MCM3000"]["poll interval (s)"]
+        if timeout is None:
+            timeout = defaults["MCM3000"]["timeout (s)"]
+        self._query([pack("<HBBBBHi", MOVE_ABSOLUTE, 0x06, 0x00, 0x00, 0x00,
+                          channel, int(position * self.scale_factor))
+                     for channel, position in targets.items()],
+                    [0] * len(targets))
+        return self._executor.submit(self._wait_for_moves, dict(targets),
+                                     poll_interval, timeout)
+
+    def _wait_for_moves(self,
+                        targets: dict,
+                        poll_interval: float,
+                        timeout: float) -> dict:
+        """
+        Poll the channels until every one has stopped within tolerance
+        of its target. A channel may not report moving straight after
+        the command, so stopping away from the target only counts as a
+        failure after three polls in a row.
+        """
+        start = time.perf_counter()
+        stopped_away = 0
+        while True:
+            state = self.poll(list(targets))
+            positions = {channel: state[channel][0] for channel in targets}
+            moving = any(state[channel][1] for channel in targets)
+            in_position = all(abs(positions[channel] - target) <
+                              self.tolerance
+                              for channel, target in targets.items())
+            if not moving and in_position:
+                return positions
+            stopped_away = stopped_away + 1 if not moving else 0
+            if stopped_away >= 3:
+                raise RuntimeError(f"MCM3000 stopped at {positions} "
+                                   f"instead of {targets}.")
+            if time.perf_counter() - start > timeout:
+                raise TimeoutError(f"MCM3000 moves to {targets} did not "
+                                   f"finish within {timeout} s.")
+            time.sleep(poll_interval)
+
+    def set_command(self, command: str, value: dict):
+        """
+        Set a command on the MCM3000, waiting for it to finish.
+        Args:
+            command (str): "move absolute" or "encoder count".
+            value (dict): Channel index -> position (mm) or encoder count.
+        Returns:
+            The final positions for moves, None otherwise.
+        """
+        match command:
+            case "move absolute":
+                return self.move_absolute_async(value).result()
+            case "encoder count":
+                self.set_encoder_count(value)
+
+    def get_command(self, command: str, channel: int):
+        """
+        Get a value from the MCM3000.
+        Args:
+            command (str): "position" (mm) or "moving" (bool).
+            channel (int): Channel index.
+        """
+        match command:
+            case "position":
+                return self.get_positions([channel])[channel]
+            case "moving":
+                return self.get_status([channel])[channel]
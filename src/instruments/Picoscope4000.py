@@ -1,21 +1,27 @@
-try:
-    import sys
-    import json as js
-    from picosdk.ps4000 import ps4000 as ps
-    from picosdk.functions import adc2mV, assert_pico_ok
-    from src.instruments.instrument import Instrument
-    from ctypes import *
-    import numpy as np
-except OSError as ex:
-    print("Warning:", ex)
+import sys
+from src.config import defaults
+from src.instruments.instrument import Instrument
+from ctypes import *
+import numpy as np
+
+# The PicoSDK is only needed for the real device, not the simulated one.
+# Importing it loads the PicoScope driver, so it is imported at the first
+# setup rather than at startup (see load_sdk).
+ps = None
+adc2mV = None
+assert_pico_ok = None
+
+def load_sdk():
+    """ Import the PicoSDK, if not imported yet """
+    global ps, adc2mV, assert_pico_ok
+    if ps is None:
+        from picosdk.functions import adc2mV, assert_pico_ok
+        from picosdk.ps4000 import ps4000 as ps
 
 
 # TODO: Add method to measure total sampling duration
 # TODO: add method to change channel range
 
-with open(r'config/systemDefaults.json') as f:
-    defaults = js.load(f)
-
 # For information on the PicoSDK, please refer to the programmer guide
 
 class PS4000(Instrument):
@@ -43,6 +49,7 @@ class PS4000(Instrument):
         Returns: 
             0 if success, or relevant error code if failed
         """
+        load_sdk()
         self.status["openunit"] = ps.ps4000OpenUnit(
             byref(self.chandle))
         assert_pico_ok(self.status["openunit"])
@@ -83,6 +90,15 @@ class PS4000(Instrument):
             assert_pico_ok(self.status["close"])
             self.is_connected = False
 
+    def check_status(self) -> bool:
+        """ Cheap health check: the PicoScope is open and answers a ping.
+        Returns:
+            True if the PicoScope is usable, False otherwise.
+        """
+        if not self.is_connected:
+            return False
+        return ps.ps4000PingUnit(self.chandle) == 0
+
     def get_data(self, bits2Volts:bool= False) -> np.ndarray:
         """
         Collect data from picoscope 4262 device. Current implementation
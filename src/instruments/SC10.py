@@ -1,10 +1,18 @@
 from ctypes import *
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
 from src.instruments.instrument import Instrument
 
 class SC10(Instrument):
     """ Class for SC10 device """
     sc10Lib = None
     isLoad = False
+    # The DLL is loaded on first use (see load_default), not when the
+    # instances are made at startup
+    DLL_PATH = ("./src/instruments/instruments_dlls/"
+                "SC10CommandLib_x64.dll")
+    # Result of a command dropped for an opposite one before it was sent
+    SUPERSEDED = -2
 
     @staticmethod
     def list_devices():
@@ -12,6 +20,7 @@ class SC10(Instrument):
         Returns:
            The mcm301 device list, each device item is serialNumber/COM
         """
+        SC10.load_default()
         str1 = create_string_buffer(10240)
         result = SC10.sc10Lib.List(str1, 10240)
         devicesStr = str1.value.decode("utf-8",
@@ -38,13 +47,27 @@ class SC10(Instrument):
         SC10.sc10Lib = cdll.LoadLibrary(path)
         SC10.isLoad = True
 
+    @staticmethod
+    def load_default():
+        """ Load the SC10 DLL, unless a library is already loaded """
+        if not SC10.isLoad:
+            SC10.load_library(SC10.DLL_PATH)
+
     def __init__(self):
         super().__init__("SC10")
         self.type = "Shutter"
-        lib_path = "./src/instruments/instruments_dlls/SC10CommandLib_x64.dll"
-        if not SC10.isLoad:
-            SC10.load_library(lib_path)
         self.hdl = -1
+        # Cached shutter state: True if closed, False if open, None if
+        # unknown. Updated on toggles, and read from the device only
+        # when unknown.
+        self.closed = None
+        # Commands run on their own thread, sharing the DLL with callers
+        self._lock = threading.Lock()
+        # Guards the hand over of pending commands to the command thread
+        self._pending_lock = threading.Lock()
+        self._executor = None
+        self._target = None
+        self._pending = None
 
     def setup(self, serialNo: str, nBaud: int, timeout=20):
         """ Setup the SC10 device
@@ -57,12 +80,16 @@ class SC10(Instrument):
             negative number: failed.
         """
         ret = -1
+        SC10.load_default()
         if SC10.isLoad:
             ret = SC10.sc10Lib.Open(serialNo.encode("utf-8"), nBaud, timeout)
             if ret >= 0:
                 self.hdl = ret
+                self._executor = ThreadPoolExecutor(max_workers=1)
+                self._pending = None
             else:
                 self.hdl = -1
+            self.closed = None
         return ret
 
     def is_connected(self, serialNo: str) -> bool:
@@ -81,6 +108,15 @@ class SC10(Instrument):
             else:
                 return False
 
+    def check_status(self) -> bool:
+        """ Cheap health check: the SC10 is open and answers a query
+        Returns:
+            True if the SC10 is usable, False otherwise.
+        """
+        if self.hdl < 0:
+            return False
+        return self._get_closed_state() != -1
+
     def _toggle_enable(self) -> int:
         """ Enable/Disable the shutter
         Args:
@@ -89,7 +125,8 @@ class SC10(Instrument):
         """
         ret = -1
         if self.hdl >= 0:
-            ret = SC10.sc10Lib.ToggleEnable(self.hdl)
+            with self._lock:
+                ret = SC10.sc10Lib.ToggleEnable(self.hdl)
         return ret
 
     def _get_closed_state(self) -> int:
@@ -99,31 +136,90 @@ class SC10(Instrument):
         """
         if self.hdl >= 0:
             state_val = c_int(0)
-            SC10.sc10Lib.GetClosedState(self.hdl, byref(state_val))
+            with self._lock:
+                ret = SC10.sc10Lib.GetClosedState(self.hdl,
+                                                  byref(state_val))
+            if ret < 0:
+                self.closed = None
+                return -1
+            self.closed = state_val.value == 1
             return state_val.value
         else:
             return -1
 
-    def set_command(self, command: str) -> int:
-        """ Set command to SC10 device
+    def _set_state(self, closed: bool) -> int:
+        """ Toggle the shutter if it is not in the requested state
         Args:
-            command: command string
-            value: value of command
+            closed: True to close the shutter, False to open it
         Returns:
             0: Success; negative number: failed.
         """
-        ret = -1
-        if self.hdl >= 0:
-            match command:
-                case "open":
-                    if self._get_closed_state() == 1:
-                        ret = self._toggle_enable()
+        if self.closed is None:
+            # Verify the state lazily, only when the cache is unknown
+            if self._get_closed_state() == -1:
+                return -1
+        if self.closed == closed:
+            return 0
+        ret = self._toggle_enable()
+        # If the toggle failed, the state has to be read again
+        self.closed = closed if ret == 0 else None
+        return ret
 
-                case "close":
-                    if self._get_closed_state() == 0:
-                        ret = self._toggle_enable()
+    def set_command_async(self, command: str) -> Future:
+        """ Send a command to the SC10 device without waiting for it
+        Redundant commands are coalesced: nothing is sent if the shutter
+        is already in the requested state, a pending command to the same
+        state is reused, and a pending command to the opposite state
+        that has not been sent yet is dropped. The Future of a dropped
+        command resolves to SUPERSEDED, so callers waiting on it still
+        get a return code.
+        Args:
+            command: "open" or "close"
+        Returns:
+            Future resolving to 0 on success, SUPERSEDED if dropped for
+            an opposite command, other negative number if failed.
+        """
+        if self.hdl < 0 or command not in ["open", "close"]:
+            done = Future()
+            done.set_result(-1)
+            return done
+        closed = command == "close"
+        with self._pending_lock:
+            pending = self._pending
+            if pending is not None and not pending.done():
+                if self._target == closed:
+                    return pending
+                if not pending.running():
+                    # Not sent yet, so it is dropped. A command already
+                    # being sent finishes, and this one follows it.
+                    pending.set_result(SC10.SUPERSEDED)
+            self._target = closed
+            self._pending = Future()
+            self._executor.submit(self._send, self._pending, closed)
+            return self._pending
 
-        return ret
+    def _send(self, result: Future, closed: bool):
+        """
+        Send a command on the command thread, unless it was dropped
+        meanwhile, and resolve its Future with the return code.
+        """
+        with self._pending_lock:
+            if result.done():
+                return
+            result.set_running_or_notify_cancel()
+        try:
+            result.set_result(self._set_state(closed))
+        except Exception as ex:
+            result.set_exception(ex)
+
+    def set_command(self, command: str) -> int:
+        """ Set command to SC10 device
+        Args:
+            command: command string, "open" or "close"
+        Returns:
+            0: Success; negative number: failed.
+        """
+        return self.set_command_async(command).result()
 
     def close(self) -> int:
         """ Close opened SC10 device
@@ -133,5 +229,8 @@ class SC10(Instrument):
         ret = -1
         if self.hdl >= 0:
             self.set_command("close")
+            self._executor.shutdown(wait=True)
             ret = SC10.sc10Lib.Close(self.hdl)
+            self.hdl = -1
+            self.closed = None
         return ret
\ No newline at end of file
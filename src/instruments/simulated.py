@@ -0,0 +1,370 @@
+from src.config import defaults
+import threading
+import time
+import numpy as np
+from ctypes import *
+from struct import pack, unpack
+from src.instruments.Picoscope4000 import PS4000
+from src.instruments.FWxC import FWxC
+from src.instruments.SC10 import SC10
+
+# Simulated instruments, to run and time the whole program without any
+# hardware (e.g. on Linux). The DLS, FWxC and SC10 simulations stand in
+# for their DLLs, so the real instrument classes (polling, caching,
+# async moves) run on top of them. The PicoScope is simulated as a whole
+# instrument, as the PicoSDK is a module of functions. The MCM3000 is
+# simulated at the serial port (LoopbackMCM3000Serial).
+# Enable with "simulation": {"enabled": true} in systemDefaults.json.
+# The latencies are set in the same place.
+
+sim = defaults["simulation"]
+
+def _command():
+    """ Wait for the round trip of one serial/USB command """
+    time.sleep(sim["command latency (s)"])
+
+def _write_int(ref, value: int):
+    """ Write to a c_int passed by reference, as a DLL would """
+    cast(ref, POINTER(c_int))[0] = value
+
+class SimulatedDLSInterface:
+    """
+    Stand-in for the Newport DLS Command Interface DLL (see DLS.py).
+    Moves follow a trapezoidal velocity profile with the current
+    velocity and acceleration, then settle: the stage overshoots by the
+    settle error, which decays over the settle time.
+    """
+    def __init__(self):
+        self.length = None
+        self.velocity = defaults["DLS"]["move profiles"]["slew"][
+            "velocity (mm/s)"]
+        self.acceleration = defaults["DLS"]["move profiles"]["slew"][
+            "acceleration (mm/s2)"]
+        self.start = 0.0
+        self.target = 0.0
+        self.t0 = 0.0
+        self.duration = 0.0
+        self.moved = False
+        self._lock = threading.Lock()
+
+    def _travelled(self, t: float, distance: float) -> float:
+        """ Distance covered t seconds into a move of distance (mm) """
+        v, a = self.velocity, self.acceleration
+        t_acc = v / a
+        if distance < v * t_acc:
+            # Triangular profile, top speed is never reached
+            t_acc = np.sqrt(distance / a)
+            v = a * t_acc
+        t_cruise = self.duration - 2 * t_acc
+        if t < t_acc:
+            return 0.5 * a * t**2
+        if t < t_acc + t_cruise:
+            return 0.5 * a * t_acc**2 + v * (t - t_acc)
+        t_dec = min(t - t_acc - t_cruise, t_acc)
+        return (0.5 * a * t_acc**2 + v * t_cruise +
+                v * t_dec - 0.5 * a * t_dec**2)
+
+    def _move_duration(self, distance: float) -> float:
+        """ Time (s) to move a distance (mm), without settling """
+        v, a = self.velocity, self.acceleration
+        if distance < v**2 / a:
+            return 2 * np.sqrt(distance / a)
+        return distance / v + v / a
+
+    def position(self, now: float = None) -> float:
+        """ Actual stage position (mm) """
+        if now is None:
+            now = time.perf_counter()
+        with self._lock:
+            distance = abs(self.target - self.start)
+            direction = np.sign(self.target - self.start)
+            t = now - self.t0
+            if t < self.duration:
+                return (self.start +
+                        direction * self._travelled(t, distance))
+            settle = sim["DLS settle (s)"]
+            if not self.moved or t >= self.duration + settle:
+                return self.target
+            error = sim["DLS settle error (mm)"] * min(distance, 1.0)
+            return (self.target + direction * error *
+                    (1 - (t - self.duration) / settle))
+
+    def OpenInstrument(self, port: str) -> int:
+        time.sleep(sim["serial open (s)"])
+        for stage in ["THz DLS", "Pump DLS"]:
+            if defaults["DLS"][stage]["serial port"] == port:
+                self.length = defaults["DLS"][stage]["length"]
+        return 0
+
+    def CloseInstrument(self) -> int:
+        _command()
+        return 0
+
+    def TS(self):
+        _command()
+        now = time.perf_counter()
+        if not self.moved:
+            return (0, "", "", "32")
+        if now - self.t0 < self.duration + sim["DLS settle (s)"]:
+            return (0, "", "", "3C")
+        return (0, "", "", "47")
+
+    def TP(self):
+        _command()
+        return (0, self.position(), "")
+
+    def TB(self, error_code: str):
+        _command()
+        return (0, f"Simulated error {error_code}", "")
+
+    def PA_Set(self, position: float):
+        _command()
+        if self.length is not None and not 0 <= position <= self.length:
+            return (1, "C")
+        now = time.perf_counter()
+        start = self.position(now)
+        with self._lock:
+            self.start = start
+            self.target = position
+            self.t0 = now
+            self.duration = self._move_duration(abs(position - start))
+            self.moved = True
+        return (0, "")
+
+    def ST(self):
+        _command()
+        now = time.perf_counter()
+        position = self.position(now)
+        with self._lock:
+            self.start = self.target = position
+            self.t0 = now - sim["DLS settle (s)"]
+            self.duration = 0.0
+        return (0, "")
+
+    def VA_Set(self, value: float):
+        _command()
+        self.velocity = value
+        return (0, "")
+
+    def VA_Get(self):
+        _command()
+        return (0, self.velocity, "")
+
+    def AC_Set(self, value: float):
+        _command()
+        self.acceleration = value
+        return (0, "")
+
+    def AC_Get(self):
+        _command()
+        return (0, self.acceleration, "")
+
+class SimulatedFWxCLib:
+    """
+    Stand-in for the FWxC filter wheel DLL (see FWxC.py). The wheel
+    turns the shortest way round, one filter wheel step per slot.
+    """
+    def __init__(self):
+        self.ports = [defaults["FWxC"][wheel]["serial port"]
+                      for wheel in ["fw1", "fw2"]]
+        self.positions = {}
+        # Handle -> number of filter slots of its wheel
+        self.slots = {}
+
+    def List(self, buffer, size: int) -> int:
+        _command()
+        buffer.value = ",".join(f"{port},FW102C"
+                                for port in self.ports).encode("utf-8")
+        return 0
+
+    def Open(self, serialNo: bytes, nBaud: int, timeout: int) -> int:
+        time.sleep(sim["serial open (s)"])
+        port = serialNo.decode("utf-8")
+        if port not in self.ports:
+            return -1
+        wheel = ["fw1", "fw2"][self.ports.index(port)]
+        hdl = len(self.positions)
+        self.positions[hdl] = 1
+        self.slots[hdl] = len(defaults["FWxC"][wheel]["filters"])
+        return hdl
+
+    def IsOpen(self, serialNo: bytes) -> int:
+        return 1
+
+    def SetPosition(self, hdl: int, position: int) -> int:
+        _command()
+        slots = self.slots[hdl]
+        steps = abs(position - self.positions[hdl])
+        steps = min(steps, slots - steps)
+        time.sleep(steps * sim["filter wheel step (s)"])
+        self.positions[hdl] = position
+        return 0
+
+    def GetPosition(self, hdl: int, position) -> int:
+        _command()
+        _write_int(position, self.positions[hdl])
+        return 0
+
+    def Close(self, hdl: int) -> int:
+        _command()
+        return 0
+
+class SimulatedSC10Lib:
+    """ Stand-in for the SC10 shutter controller DLL (see SC10.py) """
+    def __init__(self):
+        self.closed = 1
+
+    def List(self, buffer, size: int) -> int:
+        _command()
+        buffer.value = f"{defaults['SC10']['serial port']},SC10".encode(
+            "utf-8")
+        return 0
+
+    def Open(self, serialNo: bytes, nBaud: int, timeout: int) -> int:
+        time.sleep(sim["serial open (s)"])
+        return 0
+
+    def IsOpen(self, serialNo: bytes) -> int:
+        return 1
+
+    def ToggleEnable(self, hdl: int) -> int:
+        _command()
+        time.sleep(sim["shutter toggle (s)"])
+        self.closed = 1 - self.closed
+        return 0
+
+    def GetClosedState(self, hdl: int, state) -> int:
+        _command()
+        _write_int(state, self.closed)
+        return 0
+
+    def Close(self, hdl: int) -> int:
+        _command()
+        return 0
+
+class LoopbackMCM3000Serial:
+    """
+    Test double for the serial port of an MCM3000 controller, to pass to
+    MCM3000(serial_class=...). Requests written to it are answered as
+    the controller would, with the replies read back in order. Stages
+    move at a constant speed.
+    """
+    def __init__(self, port: str = None, timeout: float = 0.1, **kwargs):
+        self.port = port
+        self.timeout = timeout
+        self.is_open = True
+        self.speed = sim["MCM3000 speed (mm/s)"]
+        self.scale_factor = defaults["MCM3000"]["counts per mm"]
+        self.replies = b""
+        # Channel index -> (start, target, start time), in counts
+        self.moves = {}
+
+    def _position(self, channel: int, now: float) -> tuple:
+        """ Position (counts) of a channel and whether it is moving """
+        start, target, t0 = self.moves.get(channel, (0, 0, now))
+        travelled = self.speed * self.scale_factor * (now - t0)
+        if travelled >= abs(target - start):
+            return target, False
+        return start + np.sign(target - start) * travelled, True
+
+    def write(self, data: bytes) -> int:
+        # Imported here, as MCM3000 needs pyserial, which the rest of
+        # the simulation does not
+        from src.instruments import MCM3000 as mcm
+        _command()
+        now = time.perf_counter()
+        remaining = data
+        while len(remaining) >= 6:
+            message_id = unpack("<H", remaining[:2])[0]
+            if message_id in [mcm.SET_ENCODER_COUNT, mcm.MOVE_ABSOLUTE]:
+                _, _, _, _, _, channel, value = unpack(
+                    "<HBBBBHi", remaining[:12])
+                remaining = remaining[12:]
+                if message_id == mcm.SET_ENCODER_COUNT:
+                    self.moves[channel] = (value, value, now)
+                else:
+                    position = self._position(channel, now)[0]
+                    self.moves[channel] = (position, value, now)
+                continue
+            channel = remaining[2]
+            remaining = remaining[6:]
+            position, moving = self._position(channel, now)
+            if message_id == mcm.GET_POSITION:
+                self.replies += pack("<HBBBBHi", mcm.GET_POSITION + 1, 0x06,
+                                     0x00, 0x00, 0x00, channel,
+                                     int(round(position)))
+            elif message_id == mcm.GET_STATUS:
+                self.replies += (pack("<HBBBB", mcm.GET_STATUS + 1, 0x0E,
+                                      0x00, 0x00, 0x00) + bytes(10) +
+                                 pack("<B3s", int(moving), bytes(3)))
+        return len(data)
+
+    def read(self, size: int) -> bytes:
+        reply, self.replies = self.replies[:size], self.replies[size:]
+        return reply
+
+    def reset_input_buffer(self):
+        self.replies = b""
+
+    def close(self):
+        self.is_open = False
+
+def load_libraries():
+    """ Use the simulated DLLs for all FWxC and SC10 instances """
+    FWxC.FWxCLib = SimulatedFWxCLib()
+    FWxC.isLoad = True
+    SC10.sc10Lib = SimulatedSC10Lib()
+    SC10.isLoad = True
+
+class SimulatedPS4000(PS4000):
+    """
+    Simulated PicoScope 4262. Captures return the A, B, C, D pulse
+    pattern of an OPTP measurement with a single cycle THz pulse, centred
+    at the "THz peak (mm)" delay of the THz DLS, plus Gaussian noise.
+    """
+    def __init__(self, thz_position=None):
+        """
+        Args:
+            thz_position: Callable returning the THz DLS position (mm).
+        """
+        super().__init__()
+        self.name = "Simulated PicoScope 4262"
+        self.thz_position = thz_position
+        self.rng = np.random.default_rng()
+        self.pulses = (self.sampling_mode["pulses"] *
+                       self.sampling_mode["sampling counts"])
+
+    def setup(self, range: str = "PS4000_10V") -> None:
+        time.sleep(sim["PicoScope open (s)"])
+        self.is_connected = True
+
+    def close(self) -> None:
+        self.is_connected = False
+
+    def check_status(self) -> bool:
+        return self.is_connected
+
+    def thz_field(self) -> float:
+        """ THz field (counts) at the current THz DLS position """
+        if self.thz_position is None:
+            return 0.0
+        delay_ps = (2 * (self.thz_position() - sim["THz peak (mm)"]) *
+                    1e9 / defaults["C"])
+        width_ps = 0.3
+        x = delay_ps / width_ps
+        return (sim["THz amplitude (counts)"] * -x *
+                np.exp(0.5 * (1 - x**2)))
+
+    def get_data(self, bits2Volts: bool = False) -> np.ndarray:
+        time.sleep(sim["capture (s)"])
+        field = self.thz_field()
+        pump = 0.2 * sim["THz amplitude (counts)"]
+        # Background, pump + THz, pump only, THz only
+        levels = np.tile([0.0, pump + 0.9 * field, pump, field],
+                         self.pulses // 4)
+        samples = np.repeat(levels, self.max_samples // self.pulses)
+        samples = np.pad(samples, (0, self.max_samples - len(samples)),
+                         mode="edge")
+        samples += self.rng.normal(0, sim["noise (counts)"],
+                                   self.max_samples)
+        return np.clip(samples, -32767, 32767).astype(np.int16)
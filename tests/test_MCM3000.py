@@ -0,0 +1,95 @@
+import unittest
+from struct import pack
+from src.instruments.MCM3000 import (
+    MCM3000, GET_POSITION, POSITION_REPLY_LENGTH
+)
+from src.instruments.simulated import LoopbackMCM3000Serial
+
+# Tests of the MCM3000 driver against the loopback serial port of
+# simulated.py, so no controller is needed. Run from the repository
+# root, as the system defaults are read from config/:
+#     python -m unittest discover tests
+
+class ShortReplySerial(LoopbackMCM3000Serial):
+    """ Loopback port that drops the last byte of every read """
+    def read(self, size: int) -> bytes:
+        return super().read(size)[:-1]
+
+class MCM3000Tests(unittest.TestCase):
+    def setUp(self):
+        self.stage = MCM3000(serial_class=LoopbackMCM3000Serial)
+        self.assertEqual(self.stage.setup("COM5"), 0)
+
+    def tearDown(self):
+        self.stage.close()
+
+    def test_setup(self):
+        self.assertTrue(self.stage.is_connected)
+        self.assertEqual(self.stage.stage.port, "COM5")
+        self.assertTrue(self.stage.check_status())
+
+    def test_setup_fails(self):
+        def refuse(**kwargs):
+            raise OSError("port busy")
+        stage = MCM3000(serial_class=refuse)
+        self.assertEqual(stage.setup("COM5"), -1)
+        self.assertFalse(stage.is_connected)
+        self.assertFalse(stage.check_status())
+
+    def test_move_absolute_async(self):
+        move = self.stage.move_absolute_async({0: 0.5, 1: 0.2},
+                                              poll_interval=0.01,
+                                              timeout=5)
+        positions = move.result(timeout=10)
+        self.assertEqual(set(positions), {0, 1})
+        self.assertAlmostEqual(positions[0], 0.5,
+                               delta=self.stage.tolerance)
+        self.assertAlmostEqual(positions[1], 0.2,
+                               delta=self.stage.tolerance)
+        self.assertFalse(self.stage.get_command("moving", 0))
+
+    def test_batched_queries(self):
+        self.stage.set_encoder_count({0: 0, 1: 0, 2: 0})
+        self.stage.set_command("move absolute", {1: 0.1, 2: -0.1})
+        positions = self.stage.get_positions([0, 1, 2])
+        self.assertEqual(list(positions), [0, 1, 2])
+        self.assertAlmostEqual(positions[0], 0.0)
+        self.assertAlmostEqual(positions[1], 0.1, delta=1e-3)
+        self.assertAlmostEqual(positions[2], -0.1, delta=1e-3)
+        self.assertEqual(self.stage.get_status([0, 1, 2]),
+                         {0: False, 1: False, 2: False})
+        state = self.stage.poll([1, 2])
+        self.assertAlmostEqual(state[1][0], 0.1, delta=1e-3)
+        self.assertFalse(state[2][1])
+
+    def test_status_while_moving(self):
+        move = self.stage.move_absolute_async({0: 1.0},
+                                              poll_interval=0.01)
+        self.assertTrue(self.stage.get_status([0])[0])
+        move.result(timeout=10)
+        self.assertFalse(self.stage.get_status([0])[0])
+
+    def test_query_framing(self):
+        # Replies are split by length, in the order of the requests
+        self.stage.set_encoder_count({0: 100, 1: 200})
+        requests = [pack("<HBBBB", GET_POSITION, channel, 0, 0, 0)
+                    for channel in [1, 0]]
+        replies = self.stage._query(
+            requests, [POSITION_REPLY_LENGTH, POSITION_REPLY_LENGTH])
+        self.assertEqual([len(reply) for reply in replies],
+                         [POSITION_REPLY_LENGTH] * 2)
+        self.assertEqual(replies[0][-4:], pack("<i", 200))
+        self.assertEqual(replies[1][-4:], pack("<i", 100))
+
+    def test_short_reply(self):
+        stage = MCM3000(serial_class=ShortReplySerial)
+        stage.setup("COM5")
+        try:
+            with self.assertRaises(OSError):
+                stage.get_positions([0, 1])
+            self.assertFalse(stage.check_status())
+        finally:
+            stage.close()
+
+if __name__ == "__main__":
+    unittest.main()